@@ -5,6 +5,7 @@ This module initializes the Flask application and its extensions.
 """
 import os
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from dotenv import load_dotenv
@@ -15,7 +16,7 @@ csrf = CSRFProtect()
 
 # Import models to ensure they are registered with SQLAlchemy
 # This import must come after db initialization to avoid circular imports
-from app.models.user import User, UserStore, ExcelUserStore  # noqa
+from app.models.user import User, UserStore, ExcelUserStore, SQLiteUserStore, get_user_store  # noqa
 
 # Import blueprints to register routes
 from . import auth, main  # noqa
@@ -36,6 +37,36 @@ def create_app(config=None):
     app.config.update(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev-key-change-in-production'),
         WTF_CSRF_ENABLED=True,
+        USER_STORE_BACKEND=os.environ.get('USER_STORE_BACKEND', 'excel'),
+        USER_DB_PATH=os.environ.get('USER_DB_PATH'),
+        USER_JOURNAL_COMPACT_THRESHOLD=int(os.environ.get('USER_JOURNAL_COMPACT_THRESHOLD', 1000)),
+        SESSION_USER_SNAPSHOT=os.environ.get('SESSION_USER_SNAPSHOT', 'false').lower() in ['true', '1', 't'],
+        SESSION_USER_SNAPSHOT_TTL=int(os.environ.get('SESSION_USER_SNAPSHOT_TTL', 300)),
+        SECURITY_PASSWORD_HASH=os.environ.get('SECURITY_PASSWORD_HASH', 'scrypt'),
+        HASH_WORKERS=int(os.environ.get('HASH_WORKERS', 4)),
+        HASH_QUEUE_DEPTH=int(os.environ.get('HASH_QUEUE_DEPTH', 16)),
+        HASH_RETRY_AFTER=int(os.environ.get('HASH_RETRY_AFTER', 1)),
+        LOGIN_RATE_LIMIT_BURST=int(os.environ.get('LOGIN_RATE_LIMIT_BURST', 10)),
+        LOGIN_RATE_LIMIT_PER_MINUTE=int(os.environ.get('LOGIN_RATE_LIMIT_PER_MINUTE', 10)),
+        PROXY_FIX_HOPS=int(os.environ.get('PROXY_FIX_HOPS', 1)),
+        PROGRESS_STORE_BACKEND=os.environ.get('PROGRESS_STORE_BACKEND', 'json'),
+        PROGRESS_DATA_DIR=os.environ.get('PROGRESS_DATA_DIR'),
+        PROGRESS_DB_PATH=os.environ.get('PROGRESS_DB_PATH'),
+        PROGRESS_SHARD_COUNT=int(os.environ.get('PROGRESS_SHARD_COUNT', 256)),
+        PROGRESS_WRITE_BEHIND=os.environ.get('PROGRESS_WRITE_BEHIND', 'false').lower() in ['true', '1', 't'],
+        PROGRESS_FLUSH_INTERVAL=float(os.environ.get('PROGRESS_FLUSH_INTERVAL', 2.0)),
+        PROGRESS_FLUSH_THRESHOLD=int(os.environ.get('PROGRESS_FLUSH_THRESHOLD', 100)),
+        PROGRESS_LAZY_LOAD=os.environ.get('PROGRESS_LAZY_LOAD', 'false').lower() in ['true', '1', 't'],
+        PROGRESS_CACHE_SIZE=int(os.environ.get('PROGRESS_CACHE_SIZE', 10000)),
+        LEADERBOARD_REFRESH_SECONDS=int(os.environ.get('LEADERBOARD_REFRESH_SECONDS', 300)),
+        QUESTION_BANK_DIR=os.environ.get('QUESTION_BANK_DIR'),
+        QUESTION_BANK_PRELOAD=os.environ.get('QUESTION_BANK_PRELOAD', 'true').lower() in ['true', '1', 't'],
+        QUESTION_BANK_AUTO_RELOAD=os.environ.get('QUESTION_BANK_AUTO_RELOAD', 'false').lower() in ['true', '1', 't'],
+        QUESTION_BANK_MMAP=os.environ.get('QUESTION_BANK_MMAP', 'true').lower() in ['true', '1', 't'],
+        QUESTION_BANK_CACHE_DIR=os.environ.get('QUESTION_BANK_CACHE_DIR'),
+        QUIZ_SIZE=int(os.environ.get('QUIZ_SIZE', 20)),
+        QUESTION_POOL_SIZE=int(os.environ.get('QUESTION_POOL_SIZE', 500)),
+        QUESTION_POOL_PREFILL=os.environ.get('QUESTION_POOL_PREFILL', 'true').lower() in ['true', '1', 't'],
     )
     
     # Override with passed config if provided
@@ -45,6 +76,11 @@ def create_app(config=None):
         else:
             app.config.from_object(config)
     
+    # Take the client address from the trusted proxies' X-Forwarded-For
+    if app.config['PROXY_FIX_HOPS']:
+        hops = app.config['PROXY_FIX_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+    
     # Ensure the instance folder exists
     try:
         os.makedirs(app.instance_path, exist_ok=True)
@@ -72,22 +108,50 @@ def create_app(config=None):
     from .utils import filters
     filters.init_filters(app)
     
-    # No database initialization required
+    # Bound password hashing and rate-limit logins
+    from .utils import hashing, ratelimit
+    hashing.init_hashing(app)
+    ratelimit.init_rate_limiter(app)
+    
+    # Point the SQLite user store at the instance folder unless configured
+    SQLiteUserStore.DB_PATH = app.config.get('USER_DB_PATH') or os.path.join(app.instance_path, 'users.db')
+    ExcelUserStore.COMPACT_THRESHOLD = app.config['USER_JOURNAL_COMPACT_THRESHOLD']
+    
+    # Progress store (sharded files or SQLite under PROGRESS_DATA_DIR, default instance/)
+    from .models.progress import init_progress_store
+    init_progress_store(app)
+    
+    # Parsed question banks (app/content unless QUESTION_BANK_DIR is set)
+    from .models.question_bank import init_question_bank
+    init_question_bank(app)
+    
+    # Pools of generated questions for the templated categories
+    from .models.generator import init_question_generator
+    init_question_generator(app)
     
     # Import and register CLI commands
     from . import cli
     cli.init_app(app)
     
     # User loader for Flask-Login (use in-memory store)
+    from .utils import user_snapshot
+
     @login_manager.user_loader
     def load_user(user_id):
-        # Prefer Excel-backed store if available
+        # Serve from the session snapshot while it is fresh
+        user = user_snapshot.load(user_id)
+        if user:
+            return user
+        # Prefer the configured persistent store if available
         try:
-            user = ExcelUserStore.get_by_username(user_id)
-            if user:
-                return user
+            user = get_user_store().get_by_username(user_id)
         except Exception:
-            pass
-        return UserStore.get_by_username(user_id)
+            user = None
+        if not user:
+            user = UserStore.get_by_username(user_id)
+        if user and not user_snapshot.revalidate(user):
+            # Password changed since this session was established
+            return None
+        return user
     
     return app
@@ -3,10 +3,12 @@ Authentication routes.
 
 This module contains the authentication routes for user registration, login, and logout.
 """
-from flask import render_template, redirect, url_for, flash, request
+import math
+from flask import render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from app.models.user import User, UserStore, ExcelUserStore
+from app.models.user import User, UserStore, get_user_store
+from app.utils import user_snapshot
 from . import bp
 
 
@@ -37,10 +39,13 @@ def register():
         elif password != confirm_password:
             errors.append('Passwords do not match.')
         
-        # Check if username or email already exists (in-memory)
-        if ExcelUserStore.exists_username(username) or UserStore.exists_username(username):
+        # Check if username or email already exists
+        user_store = get_user_store()
+        username_taken, email_taken = user_store.identity_conflicts(username, email)
+        in_memory_username, in_memory_email = UserStore.identity_conflicts(username, email)
+        if username_taken or in_memory_username:
             errors.append('Username is already taken.')
-        if ExcelUserStore.exists_email(email) or UserStore.exists_email(email):
+        if email_taken or in_memory_email:
             errors.append('Email is already registered.')
         
         if errors:
@@ -50,16 +55,39 @@ def register():
             # Create new user
             user = User(username=username, email=email, password=password)
             try:
-                ExcelUserStore.add(user)
+                added = user_store.add(user)
             except Exception:
-                UserStore.add(user)
+                added = UserStore.add(user)
+            if added is None:
+                # Another registration took the name or email after our check
+                taken = user_store.exists_username(username)
+                flash('Username is already taken.' if taken else 'Email is already registered.', 'danger')
+                return render_template('auth/register.html')
             login_user(user)
+            user_snapshot.remember(user)
             flash('Registration successful! Welcome to your dashboard.', 'success')
             return redirect(url_for('main.dashboard'))
     
     return render_template('auth/register.html')
 
 
+@bp.route('/check-username')
+def check_username():
+    """Report whether a username is free, for the registration form."""
+    username = request.args.get('username', '').strip()
+    if not username:
+        return jsonify({'username': username, 'available': False})
+    try:
+        taken, _ = get_user_store().identity_conflicts(username, None)
+    except Exception as e:
+        # Unknown, not free: registration re-checks under the store's own lock
+        print(f"Error checking username availability: {e}")
+        return jsonify({'username': username, 'available': None}), 503
+    if not taken:
+        taken, _ = UserStore.identity_conflicts(username, None)
+    return jsonify({'username': username, 'available': not taken})
+
+
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Handle user login."""
@@ -71,9 +99,18 @@ def login():
         password = request.form.get('password')
         remember = request.form.get('remember') == 'on'
         
+        # Throttle per client and per account before spending hashing time
+        limiter = current_app.extensions.get('login_limiter')
+        if limiter is not None:
+            retry_after = limiter.consume(f'ip:{request.remote_addr}', f'user:{username}')
+            if retry_after:
+                flash('Too many login attempts. Please try again later.', 'danger')
+                headers = {'Retry-After': str(max(1, math.ceil(min(retry_after, 86400))))}
+                return render_template('auth/login.html'), 429, headers
+        
         user = None
         try:
-            user = ExcelUserStore.get_by_username(username)
+            user = get_user_store().get_by_username(username)
         except Exception:
             pass
         if not user:
@@ -81,6 +118,7 @@ def login():
         
         if user and user.check_password(password):
             login_user(user, remember=remember)
+            user_snapshot.remember(user)
             next_page = request.args.get('next')
             flash('You have been logged in!', 'success')
             return redirect(next_page or url_for('main.dashboard'))
@@ -95,5 +133,6 @@ def login():
 def logout():
     """Handle user logout."""
     logout_user()
+    user_snapshot.forget()
     flash('You have been logged out.', 'info')
     return redirect(url_for('main.index'))
@@ -4,17 +4,29 @@ Command Line Interface (CLI) commands for the application.
 This module contains CLI commands for database management and other utilities.
 """
 import click
+import csv
+import json
 import unittest
 import sys
+from datetime import datetime
 from flask import current_app
 from flask.cli import with_appcontext
-from app.models.user import User, UserStore, ExcelUserStore
+from app.models.user import User, UserStore, ExcelUserStore, SQLiteUserStore, get_user_store
+from app.models.progress import ProgressStore, SQLiteProgressStore, UserProgress, get_progress_store
+from app.models.question_bank import get_question_bank
+from app.models import generator
 
 
 def init_app(app):
     """Register CLI commands with the application."""
     # Database-related commands removed
     app.cli.add_command(create_admin_command)
+    app.cli.add_command(migrate_users_command)
+    app.cli.add_command(compact_users_command)
+    app.cli.add_command(migrate_progress_command)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(content_cli)
+    app.cli.add_command(calibrate_hash_command)
     app.cli.add_command(run_tests_command)
 
 
@@ -31,21 +43,224 @@ def create_admin_command(username, email, password):
         email: Email for the admin
         password: Password for the admin
     """
-    # Check if user already exists (in-memory)
-    if ExcelUserStore.exists_username(username) or UserStore.exists_username(username):
+    # Check if user already exists
+    user_store = get_user_store()
+    username_taken, email_taken = user_store.identity_conflicts(username, email)
+    in_memory_username, in_memory_email = UserStore.identity_conflicts(username, email)
+    if username_taken or in_memory_username:
         click.echo(f'User {username} already exists.')
         return
+    if email_taken or in_memory_email:
+        click.echo(f'Email {email} is already registered.')
+        return
     
     # Create admin user
     admin = User(username=username, email=email, password=password, is_admin=True)
     try:
-        ExcelUserStore.add(admin)
+        added = user_store.add(admin)
     except Exception:
-        UserStore.add(admin)
+        added = UserStore.add(admin)
+    if added is None:
+        click.echo(f'User {username} already exists.')
+        return
     
     click.echo(f'Created admin user: {username}')
 
 
+@click.command('migrate-users')
+@click.option('--source', type=click.Path(exists=True, dir_okay=False),
+              help='Workbook to import (defaults to the ExcelUserStore file).')
+@with_appcontext
+def migrate_users_command(source):
+    """Bulk-load users from users.xlsx into the SQLite user store.
+    
+    All rows are inserted in a single transaction; rows whose username or
+    email already exist in the database are skipped.
+    """
+    original_file = ExcelUserStore.FILE_NAME
+    if source:
+        ExcelUserStore.FILE_NAME = source
+    try:
+        rows = ExcelUserStore.iter_rows()
+    finally:
+        ExcelUserStore.FILE_NAME = original_file
+    
+    inserted = SQLiteUserStore.bulk_import(rows)
+    click.echo(f'Migrated {inserted} of {len(rows)} users into {SQLiteUserStore._db_path()}')
+
+
+@click.command('compact-users')
+@with_appcontext
+def compact_users_command():
+    """Fold the users.xlsx journal back into the workbook."""
+    folded = ExcelUserStore.compact()
+    click.echo(f'Folded {folded} journal records into {ExcelUserStore._file_path()}')
+
+
+@click.command('migrate-progress')
+@click.option('--source', type=click.Path(exists=True, dir_okay=False),
+              help='Single-file progress JSON to import (defaults to instance/user_progress.json).')
+@with_appcontext
+def migrate_progress_command(source):
+    """Move progress data into the configured progress store.
+    
+    With the file backend, the legacy user_progress.json is split into
+    per-user shards. With the SQLite backend, users are copied from --source
+    or, without it, from the progress shards in PROGRESS_DATA_DIR. Users that
+    already exist in the destination are left untouched.
+    """
+    progress_store = get_progress_store()
+    if isinstance(progress_store, SQLiteProgressStore):
+        if source:
+            with open(source, 'r', encoding='utf-8') as f:
+                records = [UserProgress.from_dict(data) for data in json.load(f).values()]
+        else:
+            data_dir = current_app.config.get('PROGRESS_DATA_DIR') or current_app.instance_path
+            records = list(ProgressStore(data_dir).get_all_progress().values())
+        migrated = progress_store.import_progress(records)
+        click.echo(f'Migrated {migrated} of {len(records)} users into {progress_store.db_path}')
+        return
+    
+    source = source or progress_store.progress_file
+    try:
+        migrated = progress_store.migrate_legacy(source)
+    except FileNotFoundError:
+        click.echo(f'No progress file found at {source}')
+        return
+    click.echo(f'Migrated {migrated} users into {progress_store.progress_dir}')
+
+
+@click.group('users')
+def users_cli():
+    """Bulk user import and export."""
+
+
+@users_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def import_users_command(path):
+    """Import users from a CSV file in a single store write.
+    
+    The header row must name ``username`` and ``email`` columns plus either
+    ``password_hash`` (stored as-is) or ``password`` (hashed on import, which
+    is far slower for large files). ``is_admin`` and ``created_at`` are
+    optional. Users whose username or email already exist are skipped.
+    """
+    now = datetime.utcnow().isoformat()
+    rows = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for record in csv.DictReader(f):
+            username = (record.get('username') or '').strip()
+            email = (record.get('email') or '').strip()
+            if not username or not email:
+                continue
+            password_hash = record.get('password_hash') or ''
+            if not password_hash and record.get('password'):
+                password_hash = User(username, email, password=record['password']).password_hash
+            is_admin = (record.get('is_admin') or '').strip().lower() in ['1', 'true', 'yes']
+            rows.append([username, email, password_hash, record.get('created_at') or now,
+                         '1' if is_admin else '0'])
+    
+    added = get_user_store().bulk_import(rows)
+    click.echo(f'Imported {added} users ({len(rows) - added} skipped as duplicates)')
+
+
+@users_cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@with_appcontext
+def export_users_command(path):
+    """Export all users to a CSV or XLSX file (chosen by extension)."""
+    rows = get_user_store().iter_rows()
+    if path.lower().endswith('.xlsx'):
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('users')
+        ws.append(ExcelUserStore.HEADERS)
+        for row in rows:
+            ws.append(row)
+        wb.save(path)
+    else:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(ExcelUserStore.HEADERS)
+            writer.writerows(rows)
+    click.echo(f'Exported {len(rows)} users to {path}')
+
+
+@click.group('content')
+def content_cli():
+    """Question bank maintenance."""
+
+
+@content_cli.command('compile')
+@with_appcontext
+def compile_content_command():
+    """Compile every question bank and report how many questions each holds.
+    
+    Banks are parsed and, unless QUESTION_BANK_MMAP is off, written to
+    .qbank files in QUESTION_BANK_CACHE_DIR. The app already does this at
+    startup unless QUESTION_BANK_PRELOAD is off; run it after editing
+    app/content (or in a build step) to catch banks whose questions no longer
+    parse.
+    """
+    bank = get_question_bank()
+    counts = bank.compile_all()
+    for slug, count in counts.items():
+        click.echo(f'{slug}: {count} questions')
+    empty = [slug for slug, count in counts.items() if count == 0]
+    if empty:
+        raise click.ClickException(f'No questions parsed from: {", ".join(empty)}')
+    click.echo(f'Compiled {sum(counts.values())} questions from {len(counts)} banks in {bank.content_dir}'
+               + (f' to {bank.cache_dir}' if bank.cache_dir else ''))
+
+
+@content_cli.command('generate')
+@click.option('--category', type=click.Choice(sorted(generator.CATEGORY_TEMPLATES)),
+              default='numerical-aptitude', show_default=True)
+@click.option('--count', default=1000, show_default=True, help='Questions to generate.')
+@click.option('--seed', type=int, help='Seed for a reproducible bank.')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='Markdown file to write (default: stdout).')
+@click.option('--title', help='Heading for the bank.')
+def generate_content_command(category, count, seed, output, title):
+    """Generate a question bank in the MCQ markdown format.
+    
+    Questions are written as they are generated, so large counts run in
+    constant memory. Every question is distinct; if the templates cannot
+    produce COUNT distinct questions, a shortfall warning is printed. Save
+    the output as app/content/<slug>.md to serve it like any other bank.
+    """
+    title = title or category.replace('-', ' ').title()
+    written = generator.write_markdown(output, title, generator.generate_questions(category, count, seed))
+    click.echo(f'Generated {written} {category} questions', err=True)
+    if written < count:
+        click.echo(f'Warning: only {written} of {count} requested questions are distinct; '
+                   f'the {category} templates ran out of new questions', err=True)
+
+
+@click.command('calibrate-hash')
+@click.option('--target-ms', default=50.0, show_default=True,
+              help='Latency budget for one password hash.')
+@click.option('--algorithm', type=click.Choice(['scrypt', 'pbkdf2']), default='scrypt',
+              show_default=True)
+@click.option('--samples', default=5, show_default=True, help='Hashes timed per measurement.')
+@click.option('--max-memory-mb', default=64, show_default=True,
+              help='Memory cap for one scrypt hash; each worker runs HASH_WORKERS at once.')
+@with_appcontext
+def calibrate_hash_command(target_ms, algorithm, samples, max_memory_mb):
+    """Measure hash cost on this machine and suggest SECURITY_PASSWORD_HASH.
+    
+    Existing hashes are upgraded to the configured method the next time
+    their owner logs in.
+    """
+    from app.utils import hashing
+    method, measured = hashing.calibrate(target_ms, algorithm, samples, max_memory_mb)
+    current = hashing.password_hash_method()
+    click.echo(f'Current method: {current} ({hashing.measure_ms(current, samples):.1f} ms)')
+    click.echo(f'Suggested:      {method} ({measured:.1f} ms, target {target_ms:.0f} ms)')
+    click.echo(f'Set SECURITY_PASSWORD_HASH={method} to apply it.')
+
+
 @click.command('run-tests')
 @with_appcontext
 def run_tests_command():
@@ -3,14 +3,30 @@ Main application routes.
 
 This module contains the main application routes for the Aptitude Generator.
 """
-from flask import render_template, redirect, url_for, request, flash, abort
+from flask import render_template, redirect, url_for, request, flash, abort, jsonify, session, current_app
 from flask_login import login_required, current_user
-from app.models.user import User, ExcelUserStore, UserStore
-from app.models.progress import progress_store
-import os
-import re
+from app.models.user import User, UserStore, get_user_store
+from app.models.progress import get_progress_store
+from app.models.leaderboard import Leaderboard
+from app.models.question_bank import get_question_bank, grade
+from app.models import generator, quiz
+from app.utils import user_snapshot
 from . import bp
 
+# All aptitude categories, in display order
+CATEGORIES = [
+    {'title': 'Numerical Aptitude', 'slug': 'numerical-aptitude'},
+    {'title': 'Verbal Aptitude', 'slug': 'verbal-aptitude'},
+    {'title': 'Abstract / Logical Reasoning Aptitude', 'slug': 'abstract-logical-reasoning-aptitude'},
+    {'title': 'Mechanical Aptitude', 'slug': 'mechanical-aptitude'},
+    {'title': 'Spatial Aptitude', 'slug': 'spatial-aptitude'},
+    {'title': 'Clerical / Perceptual Aptitude', 'slug': 'clerical-perceptual-aptitude'},
+    {'title': 'Technical Aptitude', 'slug': 'technical-aptitude'},
+    {'title': 'Creativity Aptitude', 'slug': 'creativity-aptitude'},
+    {'title': 'Social / Emotional Aptitude', 'slug': 'social-emotional-aptitude'},
+    {'title': 'Career-specific Aptitude Tests', 'slug': 'career-specific-aptitude-tests'},
+]
+
 
 @bp.route('/')
 def index():
@@ -31,22 +47,13 @@ def about():
 def dashboard():
     """Render the user dashboard."""
     # Get user progress data
-    user_progress = progress_store.get_user_progress(current_user.username)
+    user_progress = get_progress_store().get_user_progress(current_user.username)
     overall_stats = user_progress.get_overall_progress()
     
-    # Define all available categories
-    categories = [
-        {'title': 'Numerical Aptitude', 'slug': 'numerical-aptitude'},
-        {'title': 'Verbal Aptitude', 'slug': 'verbal-aptitude'},
-        {'title': 'Abstract / Logical Reasoning Aptitude', 'slug': 'abstract-logical-reasoning-aptitude'},
-        {'title': 'Mechanical Aptitude', 'slug': 'mechanical-aptitude'},
-        {'title': 'Spatial Aptitude', 'slug': 'spatial-aptitude'},
-        {'title': 'Clerical / Perceptual Aptitude', 'slug': 'clerical-perceptual-aptitude'},
-        {'title': 'Technical Aptitude', 'slug': 'technical-aptitude'},
-        {'title': 'Creativity Aptitude', 'slug': 'creativity-aptitude'},
-        {'title': 'Social / Emotional Aptitude', 'slug': 'social-emotional-aptitude'},
-        {'title': 'Career-specific Aptitude Tests', 'slug': 'career-specific-aptitude-tests'},
-    ]
+    categories = CATEGORIES
+    # Read from the board as already built; it is refreshed in the background
+    percentiles = get_progress_store().leaderboard().percentiles(
+        current_user.username, [category['slug'] for category in categories])
     
     # Get progress for each category
     category_progress = []
@@ -59,7 +66,8 @@ def dashboard():
             'questions_correct': progress.questions_correct,
             'accuracy_percentage': progress.accuracy_percentage,
             'completion_percentage': progress.completion_percentage,
-            'last_attempted': progress.last_attempted
+            'last_attempted': progress.last_attempted,
+            'percentile': percentiles[category['slug']]
         })
     
     # Get recent activities from progress data
@@ -101,20 +109,18 @@ def edit_account():
             errors.append('Valid email is required.')
 
         # If username/email changed, ensure not taken by someone else
-        if new_username != current_user.username:
-            try:
-                if ExcelUserStore.exists_username(new_username) or UserStore.exists_username(new_username):
-                    errors.append('Username is already taken.')
-            except Exception:
-                if UserStore.exists_username(new_username):
-                    errors.append('Username is already taken.')
-        if new_email != current_user.email:
-            try:
-                if ExcelUserStore.exists_email(new_email) or UserStore.exists_email(new_email):
-                    errors.append('Email is already registered.')
-            except Exception:
-                if UserStore.exists_email(new_email):
-                    errors.append('Email is already registered.')
+        user_store = get_user_store()
+        check_username = new_username if new_username != current_user.username else None
+        check_email = new_email if new_email != current_user.email else None
+        try:
+            username_taken, email_taken = user_store.identity_conflicts(check_username, check_email)
+        except Exception:
+            username_taken, email_taken = False, False
+        in_memory_username, in_memory_email = UserStore.identity_conflicts(check_username, check_email)
+        if username_taken or in_memory_username:
+            errors.append('Username is already taken.')
+        if email_taken or in_memory_email:
+            errors.append('Email is already registered.')
 
         if errors:
             for e in errors:
@@ -124,13 +130,17 @@ def edit_account():
         # Apply updates to a new user object for persistence
         updated = User(username=new_username, email=new_email)
         updated.password_hash = current_user.password_hash
+        if updated.password_hash is None:
+            # Session snapshots do not carry the hash; read it from the store
+            stored = user_store.get_by_username(current_user.username)
+            updated.password_hash = stored.password_hash if stored else None
         updated.is_admin = getattr(current_user, 'is_admin', False)
         if new_password:
             updated.set_password(new_password)
 
         saved = False
         try:
-            saved = ExcelUserStore.update_user(current_user.username, updated)
+            saved = user_store.update_user(current_user.username, updated)
         except Exception:
             saved = False
 
@@ -147,6 +157,7 @@ def edit_account():
         current_user.email = updated.email
         current_user.password_hash = updated.password_hash
         current_user.is_admin = updated.is_admin
+        user_snapshot.remember(updated)
 
         flash('Account updated successfully.', 'success')
         return redirect(url_for('main.dashboard'))
@@ -159,22 +170,10 @@ def edit_account():
 def profile():
     """Show user profile with detailed statistics."""
     # Get user progress data
-    user_progress = progress_store.get_user_progress(current_user.username)
+    user_progress = get_progress_store().get_user_progress(current_user.username)
     overall_stats = user_progress.get_overall_progress()
     
-    # Define all available categories
-    categories = [
-        {'title': 'Numerical Aptitude', 'slug': 'numerical-aptitude'},
-        {'title': 'Verbal Aptitude', 'slug': 'verbal-aptitude'},
-        {'title': 'Abstract / Logical Reasoning Aptitude', 'slug': 'abstract-logical-reasoning-aptitude'},
-        {'title': 'Mechanical Aptitude', 'slug': 'mechanical-aptitude'},
-        {'title': 'Spatial Aptitude', 'slug': 'spatial-aptitude'},
-        {'title': 'Clerical / Perceptual Aptitude', 'slug': 'clerical-perceptual-aptitude'},
-        {'title': 'Technical Aptitude', 'slug': 'technical-aptitude'},
-        {'title': 'Creativity Aptitude', 'slug': 'creativity-aptitude'},
-        {'title': 'Social / Emotional Aptitude', 'slug': 'social-emotional-aptitude'},
-        {'title': 'Career-specific Aptitude Tests', 'slug': 'career-specific-aptitude-tests'},
-    ]
+    categories = CATEGORIES
     
     # Get detailed progress for each category
     category_progress = []
@@ -190,137 +189,149 @@ def profile():
             'last_attempted': progress.last_attempted
         })
     
-    # Get recent activities
+    # Get one page of attempt history (newest first), paginated by cursor
+    cursor = request.args.get('before', type=int)
+    attempts, next_cursor = get_progress_store().attempts.recent(
+        current_user.username, limit=10, cursor=cursor)
     recent_activities = []
-    for activity in reversed(user_progress.activities[-10:]):  # Show last 10 activities
-        if activity['type'] == 'quiz_completed':
-            category_title = next((cat['title'] for cat in categories if cat['slug'] == activity['category_slug']), activity['category_slug'])
-            recent_activities.append({
-                'type': 'quiz_completed',
-                'description': f"Completed {category_title}",
-                'score': activity['score'],
-                'timestamp': activity['timestamp']
-            })
+    for attempt in attempts:
+        category_title = next((cat['title'] for cat in categories if cat['slug'] == attempt.category_slug), attempt.category_slug)
+        recent_activities.append({
+            'type': 'quiz_completed',
+            'description': f"Completed {category_title}",
+            'score': f"{attempt.questions_correct}/{attempt.questions_attempted} ({attempt.accuracy_percentage:.1f}%)",
+            'timestamp': attempt.timestamp.isoformat()
+        })
+    if not attempts and cursor is None:
+        # Users whose submissions predate the attempt log
+        for activity in reversed(user_progress.activities[-10:]):
+            if activity['type'] == 'quiz_completed':
+                category_title = next((cat['title'] for cat in categories if cat['slug'] == activity['category_slug']), activity['category_slug'])
+                recent_activities.append({
+                    'type': 'quiz_completed',
+                    'description': f"Completed {category_title}",
+                    'score': activity['score'],
+                    'timestamp': activity['timestamp']
+                })
     
     # Calculate additional statistics
     total_categories = len(categories)
-    categories_started = len([cat for cat in category_progress if cat['questions_attempted'] > 0])
-    categories_completed = len([cat for cat in category_progress if cat['completion_percentage'] >= 100])
+    categories_started = overall_stats['categories_started']
+    categories_completed = overall_stats['categories_completed']
     
-    # Calculate study streak (simplified - based on recent activities)
-    study_streak = 0
-    if recent_activities:
-        # Simple streak calculation based on consecutive days with activities
-        from datetime import datetime, timedelta
-        today = datetime.now().date()
-        current_date = today
-        
-        for activity in reversed(recent_activities):
-            activity_date = datetime.fromisoformat(activity['timestamp']).date()
-            if activity_date == current_date:
-                study_streak += 1
-                current_date -= timedelta(days=1)
-            elif activity_date < current_date:
-                break
+    # Study streaks from the per-day activity calendar
+    from datetime import date, timedelta
+    today = date.today()
+    study_streak = user_progress.current_streak(today)
+    longest_streak = user_progress.longest_streak()
+    active_days_30 = user_progress.active_days(today - timedelta(days=29), today)
+    activity_calendar = user_progress.activity_calendar(today, weeks=12)
     
     return render_template('profile.html',
                          user=current_user,
                          overall_stats=overall_stats,
                          category_progress=category_progress,
                          recent_activities=recent_activities,
+                         history_cursor=cursor,
+                         next_cursor=next_cursor,
                          total_categories=total_categories,
                          categories_started=categories_started,
                          categories_completed=categories_completed,
-                         study_streak=study_streak)
+                         study_streak=study_streak,
+                         longest_streak=longest_streak,
+                         active_days_30=active_days_30,
+                         activity_calendar=activity_calendar,
+                         today=today)
 
 
 @bp.route('/practice')
 def practice():
     """Show list of aptitude topics to begin practice."""
-    topics = [
-        {'title': 'Numerical Aptitude', 'slug': 'numerical-aptitude'},
-        {'title': 'Verbal Aptitude', 'slug': 'verbal-aptitude'},
-        {'title': 'Abstract / Logical Reasoning Aptitude', 'slug': 'abstract-logical-reasoning-aptitude'},
-        {'title': 'Mechanical Aptitude', 'slug': 'mechanical-aptitude'},
-        {'title': 'Spatial Aptitude', 'slug': 'spatial-aptitude'},
-        {'title': 'Clerical / Perceptual Aptitude', 'slug': 'clerical-perceptual-aptitude'},
-        {'title': 'Technical Aptitude', 'slug': 'technical-aptitude'},
-        {'title': 'Creativity Aptitude', 'slug': 'creativity-aptitude'},
-        {'title': 'Social / Emotional Aptitude', 'slug': 'social-emotional-aptitude'},
-        {'title': 'Career-specific Aptitude Tests', 'slug': 'career-specific-aptitude-tests'},
-    ]
+    topics = CATEGORIES
     return render_template('practice.html', topics=topics)
 
 
-def _parse_mcq_markdown(md_text: str):
-    """Parse markdown file into a list of MCQ dicts with options and answer.
-
-    Expected format per question:
-    N) Question text
-    - A) option
-    - B) option
-    - C) option
-    - D) option
-    Answer: X
-    """
-    lines = [l.strip() for l in md_text.splitlines()]
-    questions = []
-    current = None
-    option_pattern = re.compile(r"^-\s*([A-Da-d])\)\s*(.+)$")
-    q_pattern = re.compile(r"^\d+\)\s*(.+)$")
-    answer_pattern = re.compile(r"^Answer:\s*([A-Da-d])(?:\b.*)?$")
-    for line in lines:
-        if not line:
-            continue
-        q_match = q_pattern.match(line)
-        if q_match:
-            if current is not None:
-                # incomplete question without answer; skip adding
-                pass
-            current = {
-                'question': q_match.group(1).strip(),
-                'options': [],
-                'answer': None,
-            }
-            questions.append(current)
-            continue
-        if current is not None:
-            o_match = option_pattern.match(line)
-            if o_match:
-                key = o_match.group(1).upper()
-                text = o_match.group(2).strip()
-                current['options'].append({'key': key, 'text': text})
-                continue
-            a_match = answer_pattern.match(line)
-            if a_match:
-                current['answer'] = a_match.group(1).upper()
-                current = None
-                continue
-    # filter valid questions
-    return [q for q in questions if q.get('question') and q.get('options') and q.get('answer')]
+@bp.route('/leaderboard')
+@login_required
+def leaderboard():
+    """Show the top users overall or in one category, and the viewer's rank."""
+    slugs = {category['slug'] for category in CATEGORIES}
+    scope = request.args.get('category') or None
+    if scope is not None and scope not in slugs:
+        abort(404)
+    metric = request.args.get('metric', 'accuracy')
+    if metric not in Leaderboard.METRICS:
+        metric = 'accuracy'
+    
+    board = get_progress_store().leaderboard()
+    return render_template('leaderboard.html',
+                         categories=CATEGORIES,
+                         scope=scope,
+                         scope_title=next((c['title'] for c in CATEGORIES if c['slug'] == scope), 'Overall'),
+                         metric=metric,
+                         entries=board.top(scope, metric, limit=20),
+                         your_rank=board.rank(current_user.username, scope, metric))
+
+
+@bp.route('/admin/metrics')
+@login_required
+def admin_metrics():
+    """Report store and worker figures as JSON (admins only)."""
+    if not getattr(current_user, 'is_admin', False):
+        abort(403)
+    from app.utils import hashing
+    return jsonify({
+        'progress_store': get_progress_store().metrics(),
+        'password_hashing': hashing.hash_executor.stats(),
+        'question_pools': {slug: pool.metrics()
+                           for slug, pool in current_app.extensions.get('question_pools', {}).items()},
+    })
 
 
 @bp.route('/practice/<slug>')
 def practice_topic(slug: str):
-    """Render a topic page by loading markdown content from disk and showing MCQs."""
-    base_dir = os.path.join(os.path.dirname(__file__), '..', 'content')
-    md_path = os.path.abspath(os.path.join(base_dir, f"{slug}.md"))
-    # Ensure the path is within the content directory
-    if not md_path.startswith(os.path.abspath(base_dir)):
+    """Render a topic page with this user's next quiz from the category's question bank."""
+    bank = get_question_bank().compiled(slug)
+    if bank is None:
         abort(404)
-    if not os.path.exists(md_path):
-        abort(404)
-
-    with open(md_path, 'r', encoding='utf-8') as f:
-        md_text = f.read()
-    questions = _parse_mcq_markdown(md_text)
+    
+    # The next QUIZ_SIZE questions in this user's order through the bank
+    secret = current_app.config['SECRET_KEY']
+    spec = quiz.QuizSpec(slug, quiz.quiz_seed(secret, current_user.username, slug),
+                         session.get('quiz_rounds', {}).get(slug, 0),
+                         current_app.config['QUIZ_SIZE'], bank.digest)
     
     # Get user's current progress for this category
-    user_progress = progress_store.get_user_progress(current_user.username)
+    user_progress = get_progress_store().get_user_progress(current_user.username)
     category_progress = user_progress.get_category_progress(slug)
     
     return render_template('practice_topic.html', 
-                         questions=questions, 
+                         questions=quiz.assemble_quiz(bank.questions, spec), 
+                         token_field='quiz_token',
+                         quiz_token=quiz.dump_token(spec, secret),
+                         generated_available=slug in generator.CATEGORY_TEMPLATES,
+                         slug=slug,
+                         category_progress=category_progress)
+
+
+@bp.route('/practice/<slug>/generated')
+@login_required
+def practice_generated(slug: str):
+    """Render a quiz of freshly generated questions for a templated category."""
+    if slug not in generator.CATEGORY_TEMPLATES:
+        abort(404)
+    items = generator.take_questions(slug, current_app.config['QUIZ_SIZE'])
+    seeds = [seed for seed, _ in items]
+    
+    user_progress = get_progress_store().get_user_progress(current_user.username)
+    category_progress = user_progress.get_category_progress(slug)
+    
+    return render_template('practice_topic.html',
+                         questions=[quiz.shuffle_options(question, seed) for seed, question in items],
+                         token_field='generated_token',
+                         quiz_token=generator.dump_token(slug, current_user.username, seeds,
+                                                         current_app.config['SECRET_KEY']),
+                         generated=True,
                          slug=slug,
                          category_progress=category_progress)
 
@@ -332,35 +343,47 @@ def submit_practice(slug: str):
     print(f"DEBUG: Submit practice called for slug: {slug}")
     print(f"DEBUG: Form data: {dict(request.form)}")
     
-    base_dir = os.path.join(os.path.dirname(__file__), '..', 'content')
-    md_path = os.path.abspath(os.path.join(base_dir, f"{slug}.md"))
-    
-    # Ensure the path is within the content directory
-    if not md_path.startswith(os.path.abspath(base_dir)):
-        abort(404)
-    if not os.path.exists(md_path):
-        abort(404)
-
-    with open(md_path, 'r', encoding='utf-8') as f:
-        md_text = f.read()
-    questions = _parse_mcq_markdown(md_text)
-    
-    print(f"DEBUG: Found {len(questions)} questions")
-    
-    # Calculate results
-    correct_answers = 0
-    total_questions = len(questions)
-    
-    for i, question in enumerate(questions):
-        user_answer = request.form.get(f'question_{i}')
-        print(f"DEBUG: Question {i}: user_answer={user_answer}, correct_answer={question['answer']}")
-        if user_answer and user_answer.upper() == question['answer']:
-            correct_answers += 1
+    secret = current_app.config['SECRET_KEY']
+    generated_token = request.form.get('generated_token')
+    if generated_token is not None:
+        # Generated quizzes carry their question seeds; regenerate to grade
+        if slug not in generator.CATEGORY_TEMPLATES:
+            abort(404)
+        seeds = generator.load_token(generated_token, slug, current_user.username, secret)
+        if seeds is None:
+            abort(400)
+        served = [generator.generate_question(slug, seed) for seed in seeds]
+        answers = {q.id: request.form.get(f'question_{q.id}') for q in served}
+        correct_answers, total_questions = grade({q.id: q.answer for q in served}, answers)
+    else:
+        bank = get_question_bank().compiled(slug)
+        if bank is None:
+            abort(404)
+        
+        # Only the signed quiz token says which questions were served
+        spec = quiz.load_token(request.form.get('quiz_token', ''), secret)
+        if spec is None or spec.slug != slug or \
+                spec.seed != quiz.quiz_seed(secret, current_user.username, slug):
+            abort(400)
+        if spec.digest != bank.digest:
+            # The bank was edited after this quiz was served
+            flash('These questions have been updated since your quiz started. Please start again.', 'warning')
+            return redirect(url_for('main.practice_topic', slug=slug))
+        served = quiz.served_question_ids(bank.questions, spec)
+        
+        # Grade only the questions that were served, by ID
+        answers = {qid: request.form.get(f'question_{qid}') for qid in served}
+        correct_answers, total_questions = grade(bank.answer_key, answers)
+        
+        # Move on to the next round of this bank
+        rounds = dict(session.get('quiz_rounds', {}))
+        rounds[slug] = max(rounds.get(slug, 0), spec.round + 1)
+        session['quiz_rounds'] = rounds
     
     print(f"DEBUG: Final score: {correct_answers}/{total_questions}")
     
     # Update user progress
-    progress_store.update_user_progress(
+    get_progress_store().update_user_progress(
         current_user.username, 
         slug, 
         total_questions, 
@@ -0,0 +1,258 @@
+"""
+Attempt history.
+
+Every quiz submission is appended to a per-user log so that history is never
+truncated. ``AttemptLog`` keeps one binary file per user with fixed-width
+records in time order, so "last N attempts" and "attempts between t1 and t2"
+are answered with a few seeks rather than a scan. ``SQLiteAttemptLog`` offers
+the same API on an ``attempts`` table for the SQLite progress backend.
+"""
+from collections import namedtuple
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+from app.utils.locking import file_lock
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+class Attempt(namedtuple('Attempt', 'timestamp category_slug questions_attempted questions_correct')):
+    """One quiz submission; ``timestamp`` is a naive local ``datetime``."""
+
+    __slots__ = ()
+
+    @property
+    def accuracy_percentage(self) -> float:
+        if self.questions_attempted == 0:
+            return 0.0
+        return (self.questions_correct / self.questions_attempted) * 100
+
+
+def _epoch(value) -> int:
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+class AttemptLog:
+    """Append-only per-user attempt files under ``directory``.
+
+    Each record is 12 bytes: epoch seconds, category id, questions attempted
+    and questions correct. Category slugs are mapped to small ids through
+    ``categories.json``. Records are appended under an exclusive lock on the
+    user's file and fsynced before ``append`` returns. Their timestamps
+    never decrease, which keeps every file sorted for binary search.
+
+    Cursors returned by ``recent`` are record positions in the user's file.
+    """
+
+    RECORD = struct.Struct('<IHHHxx')
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._registry_path = os.path.join(directory, 'categories.json')
+        self._slugs: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, username: str) -> str:
+        digest = hashlib.sha1(username.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], f'{digest}.log')
+
+    def _load_registry(self):
+        try:
+            with open(self._registry_path, 'r', encoding='utf-8') as f:
+                slugs = json.load(f)
+        except FileNotFoundError:
+            slugs = []
+        self._slugs = slugs
+        self._ids = {slug: i for i, slug in enumerate(slugs)}
+
+    def _category_id(self, slug: str) -> int:
+        with self._lock:
+            if slug in self._ids:
+                return self._ids[slug]
+            os.makedirs(self.directory, exist_ok=True)
+            with file_lock(self._registry_path + '.lock'):
+                self._load_registry()
+                if slug not in self._ids:
+                    tmp_path = f'{self._registry_path}.{os.getpid()}.tmp'
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump(self._slugs + [slug], f)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self._registry_path)
+                    self._load_registry()
+            return self._ids[slug]
+
+    def _slug(self, category_id: int) -> str:
+        with self._lock:
+            if category_id >= len(self._slugs):
+                self._load_registry()
+            return self._slugs[category_id] if category_id < len(self._slugs) else str(category_id)
+
+    def append(self, username: str, category_slug: str, questions_attempted: int,
+               questions_correct: int, timestamp=None):
+        """Record one submission for ``username``."""
+        epoch = _epoch(timestamp) if timestamp is not None else int(time.time())
+        category_id = self._category_id(category_slug)
+        path = self._path(username)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                size = f.seek(0, os.SEEK_END)
+                size -= size % self.RECORD.size  # ignore a torn tail
+                if size:
+                    f.seek(size - self.RECORD.size)
+                    epoch = max(epoch, self.RECORD.unpack(f.read(self.RECORD.size))[0])
+                f.truncate(size)
+                f.seek(size)
+                f.write(self.RECORD.pack(epoch, category_id,
+                                         min(questions_attempted, 0xFFFF), min(questions_correct, 0xFFFF)))
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _decode(self, raw: bytes) -> Attempt:
+        epoch, category_id, attempted, correct = self.RECORD.unpack(raw)
+        return Attempt(datetime.fromtimestamp(epoch), self._slug(category_id), attempted, correct)
+
+    def _read(self, f, start: int, stop: int) -> List[Attempt]:
+        size = self.RECORD.size
+        f.seek(start * size)
+        data = f.read((stop - start) * size)
+        return [self._decode(data[i:i + size]) for i in range(0, len(data) - size + 1, size)]
+
+    def _open(self, username: str):
+        try:
+            return open(self._path(username), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def count(self, username: str) -> int:
+        """Number of attempts recorded for ``username``."""
+        try:
+            return os.path.getsize(self._path(username)) // self.RECORD.size
+        except FileNotFoundError:
+            return 0
+
+    def recent(self, username: str, limit: int = 10,
+               cursor: Optional[int] = None) -> Tuple[List[Attempt], Optional[int]]:
+        """Return up to ``limit`` attempts, newest first, and the next page's cursor.
+
+        Pass the returned cursor back to continue with older attempts; it is
+        None when there are no more.
+        """
+        f = self._open(username)
+        if f is None:
+            return [], None
+        with f:
+            total = os.fstat(f.fileno()).st_size // self.RECORD.size
+            stop = total if cursor is None else max(0, min(cursor, total))
+            start = max(0, stop - limit)
+            attempts = self._read(f, start, stop)
+        attempts.reverse()
+        return attempts, (start if start > 0 else None)
+
+    def between(self, username: str, start, end) -> List[Attempt]:
+        """Return attempts with ``start <= timestamp < end``, oldest first."""
+        f = self._open(username)
+        if f is None:
+            return []
+        with f:
+            total = os.fstat(f.fileno()).st_size // self.RECORD.size
+            first = self._bisect(f, total, _epoch(start))
+            last = self._bisect(f, total, _epoch(end))
+            return self._read(f, first, last)
+
+    def _bisect(self, f, total: int, epoch: int) -> int:
+        """Position of the first record with a timestamp >= ``epoch``."""
+        lo, hi = 0, total
+        size = self.RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(mid * size)
+            if self.RECORD.unpack(f.read(size))[0] < epoch:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class SQLiteAttemptLog:
+    """``AttemptLog`` API over the ``attempts`` table of a progress database.
+
+    Rows are written by ``SQLiteProgressStore`` in the same transaction as the
+    progress update (see ``insert``). Cursors are attempt row ids; the
+    ``(username, id)`` index serves ``recent`` pages without a sort and the
+    ``(username, ts)`` index serves ``between``.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            category_slug TEXT NOT NULL,
+            questions_attempted INTEGER NOT NULL,
+            questions_correct INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_attempts_username_ts ON attempts (username, ts);
+        CREATE INDEX IF NOT EXISTS ix_attempts_username_id ON attempts (username, id);
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection]):
+        self._connect = connect
+
+    @staticmethod
+    def insert(conn: sqlite3.Connection, username: str, category_slug: str,
+               questions_attempted: int, questions_correct: int, timestamp=None):
+        """Insert one attempt using the caller's connection (and transaction)."""
+        epoch = _epoch(timestamp) if timestamp is not None else int(time.time())
+        conn.execute(
+            'INSERT INTO attempts (username, ts, category_slug, questions_attempted, questions_correct) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (username, epoch, category_slug, questions_attempted, questions_correct))
+
+    @staticmethod
+    def _attempt(row) -> Attempt:
+        return Attempt(datetime.fromtimestamp(row[0]), row[1], row[2], row[3])
+
+    def append(self, username: str, category_slug: str, questions_attempted: int,
+               questions_correct: int, timestamp=None):
+        conn = self._connect()
+        with conn:
+            self.insert(conn, username, category_slug, questions_attempted, questions_correct, timestamp)
+
+    def count(self, username: str) -> int:
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM attempts WHERE username = ?', (username,)).fetchone()[0]
+
+    def recent(self, username: str, limit: int = 10,
+               cursor: Optional[int] = None) -> Tuple[List[Attempt], Optional[int]]:
+        rows = self._connect().execute(
+            'SELECT ts, category_slug, questions_attempted, questions_correct, id FROM attempts '
+            'WHERE username = ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (username, cursor if cursor is not None else 2 ** 63 - 1, limit + 1)).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return [self._attempt(r) for r in rows], (rows[-1][4] if more else None)
+
+    def between(self, username: str, start, end) -> List[Attempt]:
+        return [self._attempt(r) for r in self._connect().execute(
+            'SELECT ts, category_slug, questions_attempted, questions_correct FROM attempts '
+            'WHERE username = ? AND ts >= ? AND ts < ? ORDER BY ts, id',
+            (username, _epoch(start), _epoch(end)))]
@@ -0,0 +1,367 @@
+"""
+Parametric question generator.
+
+This module builds numerical and clerical questions from templates
+(arithmetic, fractions, percentages, number series and data comparison).
+Each template computes the correct answer and plausible distractors from a
+seeded ``random.Random``, so a question is fully determined by its category
+and seed. Quizzes only carry seeds, and grading regenerates the questions.
+
+``QuestionPool`` keeps pre-generated questions per category and tops them up
+from a background thread, so serving a generated quiz costs about the same
+as serving one from a static bank.
+"""
+from collections import deque
+from fractions import Fraction
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import atexit
+import math
+import os
+import random
+import threading
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from app.models.question_bank import Option, Question, question_id
+from app.models.quiz import LABELS
+
+TOKEN_SALT = 'generated-quiz'
+# Upper bound on seeds accepted from a token
+MAX_QUIZ_SIZE = 100
+# Consecutive repeated questions after which a category counts as exhausted
+MAX_REPEATED_DRAWS = 10000
+
+_seed_source = random.SystemRandom()
+
+
+def new_seed() -> int:
+    """A fresh random 63-bit question seed."""
+    return _seed_source.getrandbits(63)
+
+
+# Templates return (question text, correct value, candidate distractors, formatter)
+
+def _arithmetic(rng: random.Random):
+    op = rng.choice('+−×÷')
+    if op == '+':
+        a, b = rng.randint(100, 999), rng.randint(100, 999)
+        answer = a + b
+        near = [answer + 10, answer - 10, answer + 1, answer - 100]
+    elif op == '−':
+        a = rng.randint(500, 999)
+        b = rng.randint(101, a - 1)
+        answer = a - b
+        near = [answer + 10, answer - 10, answer - 1, answer + 100]
+    elif op == '×':
+        a, b = rng.randint(12, 99), rng.randint(3, 19)
+        answer = a * b
+        near = [a * (b + 1), a * (b - 1), answer + 10, answer - 10]
+    else:
+        b, answer = rng.randint(3, 19), rng.randint(12, 99)
+        a = b * answer
+        near = [answer + 1, answer - 1, answer + 10, answer - 10]
+    return f'What is {a} {op} {b}?', answer, near, str
+
+
+def _fraction_text(value: Fraction) -> str:
+    whole, rest = divmod(value.numerator, value.denominator)
+    if rest == 0:
+        return str(whole)
+    if whole == 0:
+        return f'{rest}/{value.denominator}'
+    return f'{whole} {rest}/{value.denominator}'
+
+
+def _fractions(rng: random.Random):
+    b, d = rng.sample([2, 3, 4, 5, 6, 8, 10, 12], 2)
+    a, c = rng.randint(1, b - 1), rng.randint(1, d - 1)
+    first, second = Fraction(a, b), Fraction(c, d)
+    op = rng.choice('+−')
+    if op == '−' and first < second:
+        (a, b, first), (c, d, second) = (c, d, second), (a, b, first)
+    answer = first + second if op == '+' else first - second
+    near = [Fraction(a + c, b + d) if op == '+' else Fraction(abs(a - c) or 1, abs(b - d) or 1),
+            first * second,
+            answer + Fraction(1, answer.denominator),
+            answer - Fraction(1, answer.denominator),
+            answer + 1]
+    near = [value for value in near if value > 0]
+    return f'Simplify: {a}/{b} {op} {c}/{d} = ?', answer, near, _fraction_text
+
+
+def _percentages(rng: random.Random):
+    percent = rng.choice([5, 10, 12, 15, 20, 25, 30, 40, 45, 60, 75])
+    # Multiples of step make every figure below a whole number
+    step = 100 // math.gcd(percent, 100)
+    if rng.random() < 0.5:
+        base = step * rng.randint(max(1, 40 // step), max(2, 2000 // step))
+        answer = percent * base // 100
+        near = [(100 - percent) * base // 100, answer * 10, answer + base // 20, answer // 2]
+        return f'What is {percent}% of {base}?', answer, near, str
+    old = step * rng.randint(max(1, 40 // step), max(2, 500 // step))
+    new = old * (100 + percent) // 100
+    near = [(new - old) * 100 // new, percent + 5, percent - 5, new - old]
+    return (f'A price rises from ${old} to ${new}. What is the percentage increase?',
+            percent, [value for value in near if value > 0], lambda value: f'{value}%')
+
+
+def _series(rng: random.Random):
+    kind = rng.choice(['arithmetic', 'geometric', 'squares'])
+    if kind == 'arithmetic':
+        start, step = rng.randint(2, 50), rng.randint(3, 15)
+        terms = [start + step * i for i in range(6)]
+        near = [terms[5] + step, terms[5] - 1, terms[5] + 1, terms[4] + step + 2]
+    elif kind == 'geometric':
+        start, ratio = rng.randint(1, 5), rng.randint(2, 4)
+        terms = [start * ratio ** i for i in range(6)]
+        near = [terms[4] * (ratio + 1), terms[5] + terms[4], terms[5] - ratio, terms[5] + ratio]
+    else:
+        offset = rng.randint(1, 9)
+        terms = [(offset + i) ** 2 for i in range(6)]
+        near = [terms[5] + 1, terms[5] - 1, terms[4] + (terms[4] - terms[3]), terms[5] + 2]
+    shown = ', '.join(str(term) for term in terms[:5])
+    return f'What number comes next in the series: {shown}, ?', terms[5], near, str
+
+
+_CODE_CHARS = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+_LOOKALIKES = {'O': '0', '0': 'O', 'I': '1', '1': 'I', 'S': '5', '5': 'S',
+               'B': '8', '8': 'B', 'Z': '2', '2': 'Z', 'G': '6', '6': 'G'}
+
+
+def _data_comparison(rng: random.Random):
+    code = ''.join(rng.choice(_CODE_CHARS) for _ in range(8))
+    code = f'{code[:4]}-{code[4:]}'
+
+    def mutate():
+        chars = list(code)
+        positions = [i for i, ch in enumerate(chars) if ch != '-']
+        i = rng.choice(positions)
+        move = rng.random()
+        if move < 0.4 and chars[i] in _LOOKALIKES:
+            chars[i] = _LOOKALIKES[chars[i]]
+        elif move < 0.7 and i + 1 in positions and chars[i] != chars[i + 1]:
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+        else:
+            chars[i] = rng.choice(_CODE_CHARS.replace(chars[i], ''))
+        return ''.join(chars)
+
+    near = []
+    while len(near) < 3:
+        candidate = mutate()
+        if candidate != code and candidate not in near:
+            near.append(candidate)
+    return f'Which of the following is identical to {code}?', code, near, str
+
+
+TEMPLATES: Dict[str, Callable] = {
+    'arithmetic': _arithmetic,
+    'fractions': _fractions,
+    'percentages': _percentages,
+    'series': _series,
+    'data-comparison': _data_comparison,
+}
+
+# Categories that can be practised with generated questions, and their templates
+CATEGORY_TEMPLATES: Dict[str, Tuple[str, ...]] = {
+    'numerical-aptitude': ('arithmetic', 'fractions', 'percentages', 'series'),
+    'clerical-perceptual-aptitude': ('data-comparison', 'series'),
+}
+
+
+def generate_question(slug: str, seed: int) -> Question:
+    """Build the question for ``seed`` in category ``slug``; the same inputs give the same question."""
+    rng = random.Random(seed)
+    template = TEMPLATES[rng.choice(CATEGORY_TEMPLATES[slug])]
+    text, answer, near, fmt = template(rng)
+
+    correct = fmt(answer)
+    distractors: List[str] = []
+    for value in near:
+        shown = fmt(value)
+        if shown != correct and shown not in distractors:
+            distractors.append(shown)
+    step = 1
+    while len(distractors) < 3:  # numeric templates only; data comparison always has three
+        shown = fmt(answer + step)
+        if answer + step > 0 and shown != correct and shown not in distractors:
+            distractors.append(shown)
+        step = -step if step > 0 else -step + 1
+
+    texts = [correct] + distractors[:3]
+    rng.shuffle(texts)
+    options = tuple(Option(LABELS[i], option) for i, option in enumerate(texts))
+    return Question(question_id(text, options), text, options, LABELS[texts.index(correct)])
+
+
+def generate_questions(slug: str, count: int, seed: Optional[int] = None) -> Iterator[Question]:
+    """Yield ``count`` distinct questions for ``slug``; pass ``seed`` for a reproducible batch.
+
+    Seeds that give an already-yielded question are skipped. Fewer than
+    ``count`` questions are yielded if ``MAX_REPEATED_DRAWS`` seeds in a row
+    repeat, i.e. the templates have run out of new questions.
+    """
+    rng = random.Random(seed) if seed is not None else _seed_source
+    seen = set()
+    repeats = 0
+    while len(seen) < count and repeats < MAX_REPEATED_DRAWS:
+        question = generate_question(slug, rng.getrandbits(63))
+        if question.id in seen:
+            repeats += 1
+            continue
+        seen.add(question.id)
+        repeats = 0
+        yield question
+
+
+def write_markdown(f, title: str, questions: Iterator[Question]) -> int:
+    """Write ``questions`` to ``f`` in the MCQ markdown format; return how many."""
+    f.write(f'# {title}\n\n')
+    count = 0
+    for count, question in enumerate(questions, 1):
+        options = ''.join(f'- {option.key}) {option.text}\n' for option in question.options)
+        f.write(f'{count}) {question.question}\n\n{options}\nAnswer: {question.answer}\n\n')
+    return count
+
+
+class QuestionPool:
+    """Pre-generated ``(seed, Question)`` pairs for one category.
+
+    ``take`` hands out questions from the pool and wakes a background thread
+    once it drops below half of ``size``; the thread tops it back up in
+    batches. A pool that runs dry generates the shortfall inline. The thread
+    is started on first use in each process, so a pool filled before a
+    gunicorn fork keeps working in the workers.
+    """
+
+    BATCH = 100
+
+    def __init__(self, slug: str, size: int = 500):
+        self.slug = slug
+        self.size = size
+        self._items: deque = deque()
+        self._cond = threading.Condition()
+        self._refiller: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._closed = False
+        self._generated = 0
+        self._served = 0
+        self._misses = 0
+
+    def start(self):
+        """Start (or, after a fork, restart) the refill thread."""
+        with self._cond:
+            if self._closed or (self._pid == os.getpid() and self._refiller is not None):
+                return
+            self._pid = os.getpid()
+            self._refiller = threading.Thread(target=self._refill_loop,
+                                              name=f'question-pool-{self.slug}', daemon=True)
+            self._refiller.start()
+
+    def _refill_loop(self):
+        """Background thread: refill the pool whenever it falls below half full."""
+        low_water = max(1, self.size // 2)
+        while True:
+            with self._cond:
+                while not self._closed and len(self._items) >= low_water:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            # Generate outside the lock, one batch at a time, until full
+            while True:
+                with self._cond:
+                    wanted = min(self.BATCH, self.size - len(self._items))
+                    if self._closed or wanted <= 0:
+                        break
+                batch = [(seed, generate_question(self.slug, seed))
+                         for seed in (new_seed() for _ in range(wanted))]
+                with self._cond:
+                    self._items.extend(batch)
+                    self._generated += len(batch)
+
+    def take(self, count: int) -> List[Tuple[int, Question]]:
+        """Remove and return ``count`` questions, generating any shortfall inline."""
+        if self._pid != os.getpid():
+            self.start()
+        with self._cond:
+            items = [self._items.popleft() for _ in range(min(count, len(self._items)))]
+            self._served += len(items)
+            self._misses += count - len(items)
+            if len(self._items) < max(1, self.size // 2):
+                self._cond.notify()
+        while len(items) < count:
+            seed = new_seed()
+            items.append((seed, generate_question(self.slug, seed)))
+        return items
+
+    def close(self):
+        """Stop the refill thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._refiller is not None and self._refiller is not threading.current_thread():
+            self._refiller.join(timeout=5)
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            return {
+                'size': self.size,
+                'available': len(self._items),
+                'generated': self._generated,
+                'served': self._served,
+                'misses': self._misses,
+            }
+
+
+def dump_token(slug: str, username: str, seeds: Sequence[int], secret: str) -> str:
+    """Sign the seeds of a generated quiz for the practice form."""
+    return URLSafeSerializer(secret, salt=TOKEN_SALT).dumps([slug, username, list(seeds)])
+
+
+def load_token(token: str, slug: str, username: str, secret: str) -> Optional[List[int]]:
+    """Return the seeds from a ``dump_token`` token, or None if it is invalid or not for this quiz."""
+    try:
+        token_slug, token_user, seeds = URLSafeSerializer(secret, salt=TOKEN_SALT).loads(token)
+    except (BadSignature, TypeError, ValueError):
+        return None
+    if (token_slug, token_user) != (slug, username) or not isinstance(seeds, list):
+        return None
+    if len(seeds) > MAX_QUIZ_SIZE or not all(isinstance(seed, int) for seed in seeds):
+        return None
+    return seeds
+
+
+def init_question_generator(app):
+    """Create a question pool per generated category and start filling them.
+
+    ``QUESTION_POOL_SIZE`` questions are kept per category; 0 disables the
+    pools and generated quizzes are built on request. With
+    ``QUESTION_POOL_PREFILL`` off, each pool's thread starts on first use.
+    The threads are stopped at exit and by ``close_question_pools``.
+    """
+    pools = {}
+    size = app.config.get('QUESTION_POOL_SIZE', 500)
+    if size > 0:
+        pools = {slug: QuestionPool(slug, size) for slug in CATEGORY_TEMPLATES}
+        atexit.register(_close_pools, list(pools.values()))
+        if app.config.get('QUESTION_POOL_PREFILL', True):
+            for pool in pools.values():
+                pool.start()
+    app.extensions['question_pools'] = pools
+    return pools
+
+
+def _close_pools(pools):
+    for pool in pools:
+        pool.close()
+
+
+def close_question_pools(app):
+    """Stop the refill threads of ``app``'s question pools."""
+    _close_pools(app.extensions.get('question_pools', {}).values())
+
+
+def take_questions(slug: str, count: int) -> List[Tuple[int, Question]]:
+    """``count`` generated ``(seed, Question)`` pairs for ``slug``, from its pool if there is one."""
+    pool = current_app.extensions.get('question_pools', {}).get(slug)
+    if pool is not None:
+        return pool.take(count)
+    return [(seed, generate_question(slug, seed)) for seed in (new_seed() for _ in range(count))]
@@ -0,0 +1,284 @@
+"""
+Leaderboards.
+
+This module keeps overall and per-category rankings by accuracy and by
+questions correct. Each board is a ``SortedList`` of ranking keys, so a
+submission moves one user in O(log n) and "your rank" is a positional
+lookup rather than a scan over every user. Each scope also has an accuracy
+histogram for "better than X% of users" lookups.
+"""
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+import os
+import threading
+import time
+from app.utils.sortedlist import SortedList
+
+LeaderboardEntry = namedtuple('LeaderboardEntry', 'rank username questions_correct questions_attempted accuracy')
+
+# Scope of the board that ranks users by their totals across all categories
+OVERALL = None
+
+
+class ScoreHistogram:
+    """Count of users per whole-percent accuracy bucket (0-100)."""
+
+    BUCKETS = 101
+
+    __slots__ = ('counts', 'total')
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.total = 0
+
+    @staticmethod
+    def bucket(correct: int, attempted: int) -> int:
+        return min(100, max(0, correct * 100 // attempted))
+
+    def add(self, bucket: int, delta: int = 1):
+        self.counts[bucket] += delta
+        self.total += delta
+
+    def below(self, bucket: int) -> int:
+        """Number of users in buckets lower than ``bucket``."""
+        return sum(self.counts[:bucket])
+
+
+class Leaderboard:
+    """Ranked boards for every (scope, metric) pair.
+
+    ``scope`` is a category slug or ``OVERALL``; ``metric`` is ``'accuracy'``
+    (ties broken by questions correct) or ``'correct'`` (ties broken by
+    accuracy). Users who have not attempted anything in a scope are not
+    ranked there.
+    """
+
+    METRICS = ('accuracy', 'correct')
+
+    def __init__(self):
+        self._boards: Dict[Tuple[Optional[str], str], SortedList] = {}
+        # (scope, username) -> (correct, attempted) currently on the boards
+        self._scores: Dict[Tuple[Optional[str], str], Tuple[int, int]] = {}
+        self._histograms: Dict[Optional[str], ScoreHistogram] = {}
+        self._lock = threading.Lock()
+        self.built_at = time.monotonic()
+
+    @staticmethod
+    def _key(metric: str, username: str, correct: int, attempted: int):
+        accuracy = correct / attempted
+        if metric == 'accuracy':
+            return (-accuracy, -correct, username)
+        return (-correct, -accuracy, username)
+
+    @classmethod
+    def build(cls, progresses: Iterable) -> 'Leaderboard':
+        """Build every board from ``UserProgress`` objects in one pass."""
+        board = cls()
+        keys: Dict[Tuple[Optional[str], str], list] = {}
+        for progress in progresses:
+            scores = [(slug, cat.questions_correct, cat.questions_attempted)
+                      for slug, cat in progress.categories.items()]
+            attempted, correct = progress.totals[0], progress.totals[1]
+            scores.append((OVERALL, correct, attempted))
+            for scope, correct, attempted in scores:
+                if attempted <= 0:
+                    continue
+                board._scores[(scope, progress.username)] = (correct, attempted)
+                board._histogram(scope).add(ScoreHistogram.bucket(correct, attempted))
+                for metric in cls.METRICS:
+                    keys.setdefault((scope, metric), []).append(
+                        cls._key(metric, progress.username, correct, attempted))
+        board._boards = {name: SortedList(values) for name, values in keys.items()}
+        return board
+
+    def _histogram(self, scope: Optional[str]) -> ScoreHistogram:
+        histogram = self._histograms.get(scope)
+        if histogram is None:
+            histogram = self._histograms[scope] = ScoreHistogram()
+        return histogram
+
+    def _set(self, scope: Optional[str], username: str, correct: int, attempted: int):
+        old = self._scores.get((scope, username))
+        new = (correct, attempted) if attempted > 0 else None
+        if old == new:
+            return
+        histogram = self._histogram(scope)
+        if old is not None:
+            histogram.add(ScoreHistogram.bucket(*old), -1)
+        if new is not None:
+            histogram.add(ScoreHistogram.bucket(*new))
+        for metric in self.METRICS:
+            board = self._boards.setdefault((scope, metric), SortedList())
+            if old is not None:
+                board.discard(self._key(metric, username, *old))
+            if new is not None:
+                board.add(self._key(metric, username, *new))
+        if new is None:
+            self._scores.pop((scope, username), None)
+        else:
+            self._scores[(scope, username)] = new
+
+    def record(self, progress, category_slug: str):
+        """Move ``progress``'s user on the board for ``category_slug`` and overall."""
+        category = progress.categories.get(category_slug)
+        attempted, correct = progress.totals[0], progress.totals[1]
+        with self._lock:
+            if category is not None:
+                self._set(category_slug, progress.username,
+                          category.questions_correct, category.questions_attempted)
+            self._set(OVERALL, progress.username, correct, attempted)
+
+    def top(self, scope: Optional[str] = OVERALL, metric: str = 'accuracy',
+            limit: int = 10) -> List[LeaderboardEntry]:
+        """Return the best ``limit`` users on a board."""
+        with self._lock:
+            board = self._boards.get((scope, metric))
+            keys = board.islice(0, limit) if board is not None else []
+            entries = []
+            for position, key in enumerate(keys, 1):
+                correct, attempted = self._scores[(scope, key[2])]
+                entries.append(LeaderboardEntry(position, key[2], correct, attempted,
+                                                correct / attempted * 100))
+            return entries
+
+    def rank(self, username: str, scope: Optional[str] = OVERALL,
+             metric: str = 'accuracy') -> Optional[Tuple[int, int]]:
+        """Return ``(rank, ranked users)`` for ``username``, or None if unranked."""
+        with self._lock:
+            score = self._scores.get((scope, username))
+            if score is None:
+                return None
+            board = self._boards[(scope, metric)]
+            return board.bisect_left(self._key(metric, username, *score)) + 1, len(board)
+
+    def percentile(self, username: str, scope: Optional[str] = OVERALL) -> Optional[float]:
+        """Percentage of the other ranked users whose accuracy bucket is below ``username``'s.
+
+        Returns None if ``username`` is unranked in ``scope`` or is its only user.
+        """
+        with self._lock:
+            return self._percentile(username, scope)
+
+    def percentiles(self, username: str, scopes: Iterable[Optional[str]]) -> Dict[Optional[str], Optional[float]]:
+        """``percentile`` for several scopes, read under one lock acquisition."""
+        with self._lock:
+            return {scope: self._percentile(username, scope) for scope in scopes}
+
+    def _percentile(self, username: str, scope: Optional[str]) -> Optional[float]:
+        score = self._scores.get((scope, username))
+        histogram = self._histograms.get(scope)
+        if score is None or histogram is None or histogram.total < 2:
+            return None
+        return histogram.below(ScoreHistogram.bucket(*score)) / (histogram.total - 1) * 100
+
+    def size(self, scope: Optional[str] = OVERALL) -> int:
+        with self._lock:
+            board = self._boards.get((scope, self.METRICS[0]))
+            return len(board) if board is not None else 0
+
+
+class LeaderboardMixin:
+    """Give a progress store a leaderboard that is never built on a request.
+
+    ``start_leaderboard()`` (called once at startup) builds the board from
+    ``leaderboard_source()`` and starts a background thread that rebuilds it
+    every ``leaderboard_refresh`` seconds (0 never rebuilds), to pick up
+    submissions handled by other workers. With ``background=True`` the first
+    build also runs on that thread, so startup does not read the store.
+    In between, ``update_user_progress`` moves the user on the current
+    board. ``leaderboard()`` only returns what is already built.
+    """
+
+    leaderboard_refresh = 300
+    _leaderboard: Optional[Leaderboard] = None
+    # True once a full build has completed in this store
+    _leaderboard_ready = False
+    # Submissions recorded while a rebuild runs, replayed onto the new board
+    _leaderboard_pending: Optional[list] = None
+    _leaderboard_refresher: Optional[threading.Thread] = None
+    _leaderboard_pid: Optional[int] = None
+    _leaderboard_stop: Optional[threading.Event] = None
+    _leaderboard_lock = threading.Lock()
+
+    def leaderboard(self) -> Leaderboard:
+        """Return the current board.
+
+        Until the first build finishes (or if the store was never started)
+        this is a board holding only the submissions seen since.
+        """
+        if self._leaderboard_stop is not None and self._leaderboard_pid != os.getpid():
+            self._start_refresher()
+        board = self._leaderboard
+        if board is None:
+            with self._leaderboard_lock:
+                if self._leaderboard is None:
+                    self._leaderboard = Leaderboard()
+                board = self._leaderboard
+        return board
+
+    def start_leaderboard(self, background: bool = False):
+        """Build the board (now, or first thing on the thread) and start the refresh thread."""
+        if not background:
+            self.rebuild_leaderboard()
+        if background or self.leaderboard_refresh > 0:
+            self._leaderboard_stop = threading.Event()
+            self._start_refresher()
+
+    def _start_refresher(self):
+        """Start (or, after a fork, restart) the refresh thread."""
+        with self._leaderboard_lock:
+            if self._leaderboard_pid == os.getpid() or self._leaderboard_stop.is_set():
+                return
+            self._leaderboard_pid = os.getpid()
+            self._leaderboard_refresher = threading.Thread(
+                target=self._refresh_loop, name='leaderboard-refresh', daemon=True)
+            self._leaderboard_refresher.start()
+
+    def _refresh_loop(self):
+        stop = self._leaderboard_stop
+        wait = 0 if not self._leaderboard_ready else self.leaderboard_refresh
+        while not stop.wait(wait):
+            try:
+                self.rebuild_leaderboard()
+            except Exception as e:
+                print(f"Error rebuilding leaderboard: {e}")
+            if self.leaderboard_refresh <= 0 and self._leaderboard_ready:
+                return
+            wait = self.leaderboard_refresh if self._leaderboard_ready else 1
+
+    def stop_leaderboard(self):
+        """Stop the refresh thread."""
+        if self._leaderboard_stop is None:
+            return
+        self._leaderboard_stop.set()
+        refresher = self._leaderboard_refresher
+        if refresher is not None and refresher is not threading.current_thread():
+            refresher.join(timeout=5)
+
+    def rebuild_leaderboard(self) -> Leaderboard:
+        """Rebuild rankings and histograms from everything in the store."""
+        with self._leaderboard_lock:
+            self._leaderboard_pending = []
+        board = Leaderboard.build(self.leaderboard_source())
+        with self._leaderboard_lock:
+            for progress, category_slug in self._leaderboard_pending:
+                board.record(progress, category_slug)
+            self._leaderboard_pending = None
+            self._leaderboard = board
+            self._leaderboard_ready = True
+        return board
+
+    def leaderboard_source(self) -> Iterable:
+        """``UserProgress`` objects to build the board from; every user in the store.
+
+        Stores override this to yield users one at a time.
+        """
+        return self.get_all_progress().values()
+
+    def _update_leaderboard(self, progress, category_slug: str):
+        with self._leaderboard_lock:
+            if self._leaderboard_pending is not None:
+                self._leaderboard_pending.append((progress, category_slug))
+            board = self._leaderboard
+        if board is not None:
+            board.record(progress, category_slug)
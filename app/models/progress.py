@@ -3,21 +3,100 @@ User progress tracking model.
 
 This module handles tracking user progress across different aptitude categories.
 """
-from datetime import datetime
-from typing import Dict, List, Optional
+from datetime import date, datetime, timedelta
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+import atexit
 import json
 import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from flask import current_app
+from app.utils.locking import file_lock
+from app.models.attempts import AttemptLog, SQLiteAttemptLog
+from app.models.leaderboard import LeaderboardMixin
+
+
+def _to_epoch(value) -> Optional[int]:
+    """Convert a naive local ``datetime`` (or ISO string) to int epoch seconds."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+
+def _from_epoch(value: Optional[int]) -> Optional[datetime]:
+    return datetime.fromtimestamp(value) if value is not None else None
+
+
+# Activity tuples: (type, category_slug, questions_correct, questions_attempted, epoch)
+# An activity whose score could not be parsed keeps the score string in the
+# correct slot and None for attempted.
+_SCORE_RE = re.compile(r'^(\d+)/(\d+)')
+
+
+def _activity_from_dict(activity: Dict) -> Tuple:
+    score = activity.get('score') or ''
+    match = _SCORE_RE.match(score)
+    if match:
+        correct, attempted = int(match.group(1)), int(match.group(2))
+    else:
+        correct, attempted = score, None
+    slug = activity.get('category_slug')
+    return (sys.intern(activity.get('type') or ''),
+            sys.intern(slug) if slug is not None else None,
+            correct, attempted,
+            _to_epoch(activity.get('timestamp')) or int(time.time()))
+
+
+def _activity_to_dict(activity: Tuple) -> Dict:
+    kind, slug, correct, attempted, epoch = activity
+    if attempted is None:
+        score = correct
+    else:
+        accuracy = (correct / attempted * 100) if attempted > 0 else 0
+        score = f"{correct}/{attempted} ({accuracy:.1f}%)"
+    return {
+        'type': kind,
+        'category_slug': slug,
+        'score': score,
+        'timestamp': datetime.fromtimestamp(epoch).isoformat(),
+    }
 
 
 class CategoryProgress:
-    """Represents progress for a single aptitude category."""
+    """Represents progress for a single aptitude category.
+
+    Instances use ``__slots__``, an interned slug and an int epoch for
+    ``last_attempted`` (exposed as a ``datetime``) to keep per-user memory
+    small.
+    """
+
+    __slots__ = ('category_slug', 'questions_attempted', 'questions_correct', '_last_attempted')
+
+    # For now, assume each category has 20 questions
+    # TODO: Make this dynamic based on actual question count
+    TOTAL_QUESTIONS = 20
     
     def __init__(self, category_slug: str, questions_attempted: int = 0, 
                  questions_correct: int = 0, last_attempted: Optional[datetime] = None):
-        self.category_slug = category_slug
+        self.category_slug = sys.intern(category_slug)
         self.questions_attempted = questions_attempted
         self.questions_correct = questions_correct
         self.last_attempted = last_attempted or datetime.now()
+
+    @property
+    def last_attempted(self) -> Optional[datetime]:
+        return _from_epoch(self._last_attempted)
+
+    @last_attempted.setter
+    def last_attempted(self, value: Optional[datetime]):
+        self._last_attempted = _to_epoch(value)
     
     @property
     def accuracy_percentage(self) -> float:
@@ -29,12 +108,15 @@ class CategoryProgress:
     @property
     def completion_percentage(self) -> float:
         """Calculate completion percentage based on questions attempted vs total available."""
-        # For now, assume each category has 20 questions
-        # TODO: Make this dynamic based on actual question count
-        total_questions = 20
+        total_questions = self.TOTAL_QUESTIONS
         if total_questions == 0:
             return 0.0
         return min((self.questions_attempted / total_questions) * 100, 100.0)
+
+    @property
+    def is_completed(self) -> bool:
+        """True once completion_percentage reaches 100."""
+        return self.questions_attempted >= self.TOTAL_QUESTIONS
     
     def to_dict(self) -> Dict:
         """Convert to dictionary for JSON serialization."""
@@ -42,7 +124,8 @@ class CategoryProgress:
             'category_slug': self.category_slug,
             'questions_attempted': self.questions_attempted,
             'questions_correct': self.questions_correct,
-            'last_attempted': self.last_attempted.isoformat() if self.last_attempted else None
+            'last_attempted': (self.last_attempted.isoformat()
+                               if self._last_attempted is not None else None)
         }
     
     @classmethod
@@ -61,51 +144,189 @@ class CategoryProgress:
 
 
 class UserProgress:
-    """Manages progress for a single user across all categories."""
+    """Manages progress for a single user across all categories.
+
+    The last ten activities are kept as tuples in a ring buffer and the
+    timestamps as int epoch seconds; ``activities``, ``created_at`` and
+    ``updated_at`` present them as dicts and ``datetime`` objects.
+
+    Overall totals (questions attempted and correct, categories started and
+    completed) are kept as running counters that ``update_category_progress``
+    adjusts by the change in one category, so reading them is O(1). Category
+    records must therefore be added through ``add_category`` or
+    ``get_category_progress`` rather than by assigning into ``categories``.
+
+    Days with at least one submission are kept as a bitmap: bit ``i`` of
+    ``_day_bits`` is day ``_day_origin + i`` (proleptic ordinals of local
+    dates). Streaks and active-day counts are computed with bit operations.
+    """
+
+    __slots__ = ('username', 'categories', '_activities', '_created_at', '_updated_at',
+                 '_total_attempted', '_total_correct', '_categories_started',
+                 '_categories_completed', '_day_origin', '_day_bits')
+
+    # Activities kept per user
+    MAX_ACTIVITIES = 10
     
     def __init__(self, username: str):
         self.username = username
         self.categories: Dict[str, CategoryProgress] = {}
-        self.activities: List[Dict] = []
-        self.created_at = datetime.now()
-        self.updated_at = datetime.now()
+        self._activities: Deque[Tuple] = deque(maxlen=self.MAX_ACTIVITIES)
+        now = int(time.time())
+        self._created_at = now
+        self._updated_at = now
+        self._total_attempted = 0
+        self._total_correct = 0
+        self._categories_started = 0
+        self._categories_completed = 0
+        self._day_origin = 0
+        self._day_bits = 0
+
+    @property
+    def created_at(self) -> datetime:
+        return _from_epoch(self._created_at)
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        self._created_at = _to_epoch(value)
+
+    @property
+    def updated_at(self) -> datetime:
+        return _from_epoch(self._updated_at)
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        self._updated_at = _to_epoch(value)
+
+    @property
+    def activities(self) -> List[Dict]:
+        """Recent activities, oldest first, as dicts."""
+        return [_activity_to_dict(activity) for activity in self._activities]
+
+    @activities.setter
+    def activities(self, value: List[Dict]):
+        self._activities = deque((_activity_from_dict(a) for a in value), maxlen=self.MAX_ACTIVITIES)
+    
+    def add_category(self, progress: CategoryProgress, slug: Optional[str] = None):
+        """Attach a loaded category record (under ``slug`` if given) and count it in the totals."""
+        slug = sys.intern(slug) if slug is not None else progress.category_slug
+        previous = self.categories.get(slug)
+        if previous is not None:
+            self._count(previous, -1)
+        self.categories[slug] = progress
+        self._count(progress, 1)
+
+    def _count(self, progress: CategoryProgress, sign: int):
+        self._total_attempted += sign * progress.questions_attempted
+        self._total_correct += sign * progress.questions_correct
+        if progress.questions_attempted > 0:
+            self._categories_started += sign
+        if progress.is_completed:
+            self._categories_completed += sign
+
+    @property
+    def totals(self) -> Tuple[int, int, int, int]:
+        """(attempted, correct, categories started, categories completed)."""
+        return (self._total_attempted, self._total_correct,
+                self._categories_started, self._categories_completed)
+
+    def _recompute_totals(self) -> Tuple[int, int, int, int]:
+        """Rebuild the running totals from the categories and return them."""
+        self._total_attempted = self._total_correct = 0
+        self._categories_started = self._categories_completed = 0
+        for progress in self.categories.values():
+            self._count(progress, 1)
+        return self.totals
     
     def get_category_progress(self, category_slug: str) -> CategoryProgress:
         """Get progress for a specific category, creating if it doesn't exist."""
         if category_slug not in self.categories:
-            self.categories[category_slug] = CategoryProgress(category_slug)
+            progress = CategoryProgress(category_slug)
+            self.categories[progress.category_slug] = progress
         return self.categories[category_slug]
     
     def update_category_progress(self, category_slug: str, questions_attempted: int, 
                                questions_correct: int):
         """Update progress for a specific category."""
         progress = self.get_category_progress(category_slug)
+        now = int(time.time())
+        self._count(progress, -1)
         progress.questions_attempted = questions_attempted
         progress.questions_correct = questions_correct
-        progress.last_attempted = datetime.now()
-        self.updated_at = datetime.now()
+        progress._last_attempted = now
+        self._count(progress, 1)
+        self._updated_at = now
         
-        # Add activity
-        accuracy = (questions_correct / questions_attempted * 100) if questions_attempted > 0 else 0
-        activity = {
-            'type': 'quiz_completed',
-            'category_slug': category_slug,
-            'score': f"{questions_correct}/{questions_attempted} ({accuracy:.1f}%)",
-            'timestamp': datetime.now().isoformat()
-        }
-        self.activities.append(activity)
-        
-        # Keep only last 10 activities
-        if len(self.activities) > 10:
-            self.activities = self.activities[-10:]
+        # Add activity (the ring buffer keeps only the last ten)
+        self._activities.append(
+            ('quiz_completed', progress.category_slug, questions_correct, questions_attempted, now))
+        self.mark_active(date.fromtimestamp(now))
+
+    def mark_active(self, day: date):
+        """Record ``day`` as a day with activity."""
+        ordinal = day.toordinal()
+        if not self._day_bits:
+            self._day_origin, self._day_bits = ordinal, 1
+        elif ordinal < self._day_origin:
+            self._day_bits = (self._day_bits << (self._day_origin - ordinal)) | 1
+            self._day_origin = ordinal
+        else:
+            self._day_bits |= 1 << (ordinal - self._day_origin)
+
+    def active_day_ordinals(self):
+        """Yield the ordinal of every active day, oldest first."""
+        bits, ordinal = self._day_bits, self._day_origin
+        while bits:
+            skip = (bits & -bits).bit_length() - 1
+            ordinal += skip
+            yield ordinal
+            bits >>= skip + 1
+            ordinal += 1
+
+    def is_active(self, day: date) -> bool:
+        offset = day.toordinal() - self._day_origin
+        return offset >= 0 and bool(self._day_bits >> offset & 1)
+
+    def current_streak(self, today: Optional[date] = None) -> int:
+        """Consecutive active days ending today (0 if today has no activity)."""
+        offset = (today or date.today()).toordinal() - self._day_origin
+        if offset < 0 or not self._day_bits >> offset & 1:
+            return 0
+        # The highest clear bit at or below today ends the run
+        gaps = ~self._day_bits & ((1 << (offset + 1)) - 1)
+        return offset - gaps.bit_length() + 1
+
+    def longest_streak(self) -> int:
+        """Longest run of consecutive active days."""
+        bits, longest = self._day_bits, 0
+        # Each step shortens every run of ones by one
+        while bits:
+            bits &= bits << 1
+            longest += 1
+        return longest
+
+    def active_days(self, start: date, end: date) -> int:
+        """Number of active days with ``start <= day <= end``."""
+        low = max(start.toordinal() - self._day_origin, 0)
+        high = end.toordinal() - self._day_origin
+        if high < low:
+            return 0
+        window = (self._day_bits >> low) & ((1 << (high - low + 1)) - 1)
+        return bin(window).count('1')
+
+    def activity_calendar(self, end: Optional[date] = None, weeks: int = 12) -> List[List[Tuple[date, bool]]]:
+        """Return ``weeks`` Monday-first weeks of (day, active) ending with ``end``'s week."""
+        end = end or date.today()
+        first = end - timedelta(days=end.weekday() + 7 * (weeks - 1))
+        return [[(day, self.is_active(day))
+                 for day in (first + timedelta(days=7 * week + i) for i in range(7))]
+                for week in range(weeks)]
     
     def get_overall_progress(self) -> Dict:
-        """Get overall progress statistics."""
-        total_attempted = sum(cat.questions_attempted for cat in self.categories.values())
-        total_correct = sum(cat.questions_correct for cat in self.categories.values())
+        """Get overall progress statistics from the running totals."""
+        total_attempted = self._total_attempted
+        total_correct = self._total_correct
         total_categories = len(self.categories)
-        categories_with_progress = len([cat for cat in self.categories.values() 
-                                      if cat.questions_attempted > 0])
         
         overall_accuracy = 0.0
         if total_attempted > 0:
@@ -115,7 +336,8 @@ class UserProgress:
             'total_questions_attempted': total_attempted,
             'total_questions_correct': total_correct,
             'overall_accuracy': overall_accuracy,
-            'categories_started': categories_with_progress,
+            'categories_started': self._categories_started,
+            'categories_completed': self._categories_completed,
             'total_categories': total_categories
         }
     
@@ -126,69 +348,805 @@ class UserProgress:
             'categories': {slug: progress.to_dict() for slug, progress in self.categories.items()},
             'activities': self.activities,
             'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'updated_at': self.updated_at.isoformat(),
+            'activity_days': {
+                'origin': date.fromordinal(self._day_origin).isoformat() if self._day_bits else None,
+                'bits': format(self._day_bits, 'x'),
+            }
         }
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'UserProgress':
         """Create from dictionary."""
         progress = cls(data['username'])
-        progress.created_at = datetime.fromisoformat(data['created_at'])
-        progress.updated_at = datetime.fromisoformat(data['updated_at'])
+        progress._created_at = _to_epoch(data['created_at'])
+        progress._updated_at = _to_epoch(data['updated_at'])
         progress.activities = data.get('activities', [])
         
         for slug, cat_data in data.get('categories', {}).items():
-            progress.categories[slug] = CategoryProgress.from_dict(cat_data)
+            progress.add_category(CategoryProgress.from_dict(cat_data), slug)
+
+        days = data.get('activity_days')
+        if days is not None:
+            if days.get('origin'):
+                progress._day_origin = date.fromisoformat(days['origin']).toordinal()
+                progress._day_bits = int(days.get('bits') or '0', 16)
+        else:
+            # Records written before the calendar existed: seed it from the
+            # days that are still known
+            for activity in progress._activities:
+                progress.mark_active(date.fromtimestamp(activity[4]))
+            for category in progress.categories.values():
+                if category._last_attempted is not None and category.questions_attempted > 0:
+                    progress.mark_active(date.fromtimestamp(category._last_attempted))
         
         return progress
 
 
-class ProgressStore:
-    """Manages user progress data storage."""
-    
-    def __init__(self, data_dir: str = "instance"):
+class ProgressStore(LeaderboardMixin):
+    """Manages user progress data storage.
+
+    Progress is kept in hash-bucketed JSON Lines shards under
+    ``<data_dir>/progress``, one line per user. A quiz submission rewrites
+    only the shard holding that user, atomically (temp file plus rename)
+    and under a per-shard lock, so the cost of a save does not grow with the
+    total number of users.
+
+    The shard count is recorded in ``progress/meta.json`` the first time the
+    directory is created and read back from there afterwards, because
+    changing it would move users to different shards.
+
+    With ``write_behind`` enabled, submissions only mark the user dirty. A
+    background thread writes dirty users out once the oldest has waited
+    ``flush_interval`` seconds or ``flush_threshold`` users are dirty,
+    rewriting each affected shard once per flush. At most ``flush_interval``
+    seconds of submissions are lost if the process dies; ``close()`` (run at
+    exit and from the gunicorn ``worker_exit`` hook) flushes everything.
+
+    With ``lazy`` enabled, nothing is parsed at startup. Each shard has a
+    ``.idx`` sidecar mapping usernames to the byte offset and length of
+    their line; it is rewritten with the shard, or rebuilt by scanning the
+    shard when it is missing or stale. A user is deserialized on first
+    access and kept in an LRU of at most ``cache_size`` users; users with
+    unflushed changes are never evicted.
+    """
+
+    LEGACY_FILE = "user_progress.json"
+    META_FILE = "meta.json"
+    DEFAULT_SHARD_COUNT = 256
+
+    def __init__(self, data_dir: str = "instance", shard_count: int = DEFAULT_SHARD_COUNT,
+                 write_behind: bool = False, flush_interval: float = 2.0,
+                 flush_threshold: int = 100, lazy: bool = False, cache_size: int = 10000):
         self.data_dir = data_dir
-        self.progress_file = os.path.join(data_dir, "user_progress.json")
-        self._progress_data: Dict[str, UserProgress] = {}
+        self.progress_file = os.path.join(data_dir, self.LEGACY_FILE)
+        self.progress_dir = os.path.join(data_dir, "progress")
+        self.shard_count = shard_count
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.lazy = lazy
+        self.cache_size = cache_size
+        # Full submission history; with write-behind, appended by flush()
+        self.attempts = AttemptLog(os.path.join(data_dir, "attempts"))
+        # Submissions waiting for the next flush (write-behind only)
+        self._pending_attempts: List[tuple] = []
+        # All users, or in lazy mode the LRU of loaded users (oldest first)
+        self._progress_data: 'OrderedDict[str, UserProgress]' = OrderedDict()
+        # shard -> (file signature, {username: (offset, length)}), lazy mode only
+        self._shard_indexes: Dict[int, Tuple[Tuple[int, int, int], Dict[str, Tuple[int, int]]]] = {}
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # Guards _progress_data mutations against the flusher serializing them
+        self._lock = threading.RLock()
+        self._flush_cond = threading.Condition(self._lock)
+        # username -> monotonic time it was first dirtied since the last flush
+        self._dirty: Dict[str, float] = {}
+        # Users being written by flush(); pinned in the LRU like dirty ones
+        self._flushing: set = set()
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+        self._flushes = 0
+        self._users_flushed = 0
+        self._flush_errors = 0
+        self._last_flush_at: Optional[float] = None
+        self._last_flush_lag = 0.0
+        self._last_flush_seconds = 0.0
         self._load_data()
-    
+        if write_behind:
+            self._flusher = threading.Thread(target=self._flush_loop, name='progress-flusher', daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def _shard_for(self, username: str) -> int:
+        """Return the shard number holding ``username``."""
+        return zlib.crc32(username.encode('utf-8')) % self.shard_count
+
+    def _shard_path(self, shard: int) -> str:
+        return os.path.join(self.progress_dir, f"shard-{shard:03d}.jsonl")
+
+    def _index_path(self, shard: int) -> str:
+        return os.path.join(self.progress_dir, f"shard-{shard:03d}.idx")
+
+    def _read_meta(self) -> bool:
+        """Adopt the shard count recorded on disk; return False if there is none."""
+        meta_path = os.path.join(self.progress_dir, self.META_FILE)
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            self.shard_count = int(json.load(f)['shards'])
+        return True
+
+    def _write_meta(self):
+        os.makedirs(self.progress_dir, exist_ok=True)
+        _atomic_write(os.path.join(self.progress_dir, self.META_FILE),
+                      json.dumps({'shards': self.shard_count}))
+
+    def _read_shard(self, shard: int) -> List[str]:
+        """Return the raw lines of a shard file (empty if it does not exist)."""
+        try:
+            with open(self._shard_path(shard), 'r', encoding='utf-8') as f:
+                return [line for line in f.read().splitlines() if line.strip()]
+        except FileNotFoundError:
+            return []
+
     def _load_data(self):
-        """Load progress data from file."""
+        """Load progress data from the shard files, migrating the legacy file first."""
+        if not self._read_meta():
+            self._write_meta()
         if os.path.exists(self.progress_file):
             try:
-                with open(self.progress_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for username, progress_data in data.items():
-                        self._progress_data[username] = UserProgress.from_dict(progress_data)
-            except (json.JSONDecodeError, KeyError, ValueError) as e:
-                print(f"Error loading progress data: {e}")
-                self._progress_data = {}
-    
-    def _save_data(self):
-        """Save progress data to file."""
-        os.makedirs(self.data_dir, exist_ok=True)
-        data = {username: progress.to_dict() for username, progress in self._progress_data.items()}
-        with open(self.progress_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
-    
+                self.migrate_legacy()
+                return
+            except FileNotFoundError:
+                pass  # another worker migrated it first
+        self._load_shards()
+
+    def _load_shards(self):
+        if self.lazy:
+            # Drop what may be stale; users load again on first access
+            with self._lock:
+                for username in list(self._progress_data):
+                    if username not in self._dirty and username not in self._flushing:
+                        del self._progress_data[username]
+                self._shard_indexes.clear()
+            return
+        self._progress_data.clear()
+        for shard in range(self.shard_count):
+            for line in self._read_shard(shard):
+                try:
+                    progress = UserProgress.from_dict(json.loads(line))
+                except (json.JSONDecodeError, KeyError, ValueError) as e:
+                    print(f"Error loading progress data from shard {shard}: {e}")
+                    continue
+                self._progress_data[progress.username] = progress
+
+    def migrate_legacy(self, source: Optional[str] = None) -> int:
+        """Split a single-file ``user_progress.json`` into shards.
+
+        Users already present in the shards are kept as they are. The source
+        file is renamed to ``*.migrated`` afterwards so it is not imported
+        twice. Returns the number of users migrated.
+        """
+        source = source or self.progress_file
+        with open(source, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        by_shard: Dict[int, List[UserProgress]] = {}
+        for username, progress_data in data.items():
+            try:
+                progress = UserProgress.from_dict(progress_data)
+            except (KeyError, ValueError) as e:
+                print(f"Error migrating progress for {username}: {e}")
+                continue
+            by_shard.setdefault(self._shard_for(progress.username), []).append(progress)
+
+        migrated = 0
+        for shard, users in by_shard.items():
+            with file_lock(self._shard_path(shard) + '.lock'):
+                entries = [(_line_username(line), line) for line in self._read_shard(shard)]
+                present = {username for username, _ in entries}
+                for progress in users:
+                    if progress.username in present:
+                        continue
+                    entries.append((progress.username, json.dumps(progress.to_dict())))
+                    migrated += 1
+                self._write_shard(shard, entries)
+
+        os.replace(source, source + '.migrated')
+        self._load_shards()
+        if self._leaderboard is not None:
+            self.rebuild_leaderboard()
+        return migrated
+
+    def _write_shard(self, shard: int, entries: List[Tuple[Optional[str], str]]):
+        """Replace a shard with ``(username, line)`` entries and refresh its index.
+
+        The caller holds the shard lock. The ``.idx`` sidecar is not fsynced:
+        it carries the shard's signature and is simply rebuilt if it does
+        not match after a crash.
+        """
+        path = self._shard_path(shard)
+        _atomic_write(path, ''.join(line + '\n' for _, line in entries))
+        offsets: Dict[str, Tuple[int, int]] = {}
+        position = 0
+        for username, line in entries:
+            length = len(line.encode('utf-8'))
+            if username is not None:
+                offsets[username] = (position, length)
+            position += length + 1
+        signature = _file_signature(os.stat(path))
+        _atomic_write(self._index_path(shard),
+                      json.dumps({'signature': signature, 'offsets': offsets}), fsync=False)
+        if self.lazy:
+            with self._lock:
+                self._shard_indexes[shard] = (signature, offsets)
+
+    def _serialize(self, usernames) -> Dict[int, Dict[str, str]]:
+        """Return JSON lines for ``usernames`` grouped by shard (caller holds the lock)."""
+        records: Dict[int, Dict[str, str]] = {}
+        for username in usernames:
+            progress = self._progress_data.get(username)
+            if progress is not None:
+                records.setdefault(self._shard_for(username), {})[username] = \
+                    json.dumps(progress.to_dict())
+        return records
+
+    def _write_records(self, records: Dict[int, Dict[str, str]]):
+        """Rewrite the given shards, copying other users' lines as-is."""
+        os.makedirs(self.progress_dir, exist_ok=True)
+        for shard, shard_records in records.items():
+            with file_lock(self._shard_path(shard) + '.lock'):
+                pending = dict(shard_records)
+                entries = []
+                for line in self._read_shard(shard):
+                    username = _line_username(line)
+                    record = pending.pop(username, None)
+                    entries.append((username, record if record is not None else line))
+                entries.extend(pending.items())
+                self._write_shard(shard, entries)
+
+    def _save_users(self, usernames):
+        """Rewrite the shards holding ``usernames``."""
+        with self._lock:
+            records = self._serialize(usernames)
+        self._write_records(records)
+
+    def _lookup(self, username: str) -> Optional[UserProgress]:
+        """Read one user's line from its shard via the offset index (lazy mode)."""
+        shard = self._shard_for(username)
+        try:
+            f = open(self._shard_path(shard), 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            # Index and read the same open file, so a concurrent rewrite
+            # (which replaces the file) cannot shift the offsets under us
+            signature = _file_signature(os.fstat(f.fileno()))
+            cached = self._shard_indexes.get(shard)
+            if cached is not None and cached[0] == signature:
+                offsets = cached[1]
+            else:
+                offsets = self._read_index(shard, signature)
+                if offsets is None:
+                    offsets = _scan_offsets(f)
+                self._shard_indexes[shard] = (signature, offsets)
+            entry = offsets.get(username)
+            if entry is None:
+                return None
+            f.seek(entry[0])
+            line = f.read(entry[1]).decode('utf-8')
+        try:
+            return UserProgress.from_dict(json.loads(line))
+        except (json.JSONDecodeError, KeyError, ValueError) as e:
+            print(f"Error loading progress data for {username}: {e}")
+            return None
+
+    def _read_index(self, shard: int, signature) -> Optional[Dict[str, Tuple[int, int]]]:
+        """Return the sidecar offsets if they were written for this shard file."""
+        try:
+            with open(self._index_path(shard), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if tuple(data['signature']) != tuple(signature):
+                return None
+            return {username: tuple(entry) for username, entry in data['offsets'].items()}
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+
+    def _evict(self):
+        """Trim the LRU to ``cache_size``, skipping users with unflushed changes."""
+        data = self._progress_data
+        pinned = []
+        while data and len(data) + len(pinned) > self.cache_size:
+            username, progress = data.popitem(last=False)
+            if username in self._dirty or username in self._flushing:
+                pinned.append((username, progress))
+        for username, progress in reversed(pinned):
+            data[username] = progress
+            data.move_to_end(username, last=False)
+
+    def _mark_dirty(self, username: str):
+        with self._lock:
+            self._dirty.setdefault(username, time.monotonic())
+            # Wake the flusher to start the interval clock, or to flush now
+            if len(self._dirty) == 1 or len(self._dirty) >= self.flush_threshold:
+                self._flush_cond.notify()
+
+    def _flush_loop(self):
+        """Background thread: flush on the interval or dirty-count threshold."""
+        while True:
+            with self._lock:
+                while not self._closed:
+                    if len(self._dirty) >= self.flush_threshold:
+                        break
+                    if self._dirty:
+                        oldest = min(self._dirty.values())
+                        wait = oldest + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._flush_cond.wait(wait)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                # Dirty users were put back by flush(); retry on the next round
+                print(f"Error flushing progress data: {e}")
+                time.sleep(min(self.flush_interval, 1.0))
+
+    def flush(self) -> int:
+        """Write out every dirty user now; return how many were written."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            attempts, self._pending_attempts = self._pending_attempts, []
+            if not dirty and not attempts:
+                return 0
+            self._flushing.update(dirty)
+            records = self._serialize(dirty)
+        started = time.monotonic()
+        try:
+            self._write_attempts(attempts)
+            self._write_records(records)
+        except Exception:
+            with self._lock:
+                self._flush_errors += 1
+                for username, since in dirty.items():
+                    self._dirty[username] = min(since, self._dirty.get(username, since))
+            raise
+        finally:
+            with self._lock:
+                self._flushing.difference_update(dirty)
+        finished = time.monotonic()
+        with self._lock:
+            self._flushes += 1
+            self._users_flushed += len(dirty)
+            self._last_flush_at = time.time()
+            self._last_flush_lag = finished - min(dirty.values())
+            self._last_flush_seconds = finished - started
+        return len(dirty)
+
+    def _write_attempts(self, attempts):
+        """Append queued submissions to the attempt log, requeueing any not written."""
+        for i, attempt in enumerate(attempts):
+            try:
+                self.attempts.append(*attempt)
+            except Exception:
+                with self._lock:
+                    self._pending_attempts[:0] = attempts[i:]
+                raise
+
+    def close(self):
+        """Stop the flusher and leaderboard threads and write out anything still dirty."""
+        self.stop_leaderboard()
+        with self._lock:
+            self._closed = True
+            self._flush_cond.notify_all()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=max(self.flush_interval, 1.0) + 5)
+        self.flush()
+
+    def metrics(self) -> Dict:
+        """Return write-behind figures for monitoring and tuning."""
+        with self._lock:
+            oldest = min(self._dirty.values()) if self._dirty else None
+            return {
+                'backend': 'json',
+                'write_behind': self.write_behind,
+                'flush_interval': self.flush_interval,
+                'flush_threshold': self.flush_threshold,
+                'dirty_users': len(self._dirty),
+                'flush_lag_seconds': round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                'last_flush_lag_seconds': round(self._last_flush_lag, 3),
+                'last_flush_duration_ms': round(self._last_flush_seconds * 1000, 3),
+                'last_flush_at': self._last_flush_at,
+                'flushes': self._flushes,
+                'users_flushed': self._users_flushed,
+                'flush_errors': self._flush_errors,
+                'lazy': self.lazy,
+                'users_loaded': len(self._progress_data),
+                'cache_size': self.cache_size if self.lazy else None,
+                'cache_hits': self._cache_hits,
+                'cache_misses': self._cache_misses,
+            }
+
     def get_user_progress(self, username: str) -> UserProgress:
-        """Get progress for a user, creating if it doesn't exist."""
-        if username not in self._progress_data:
-            self._progress_data[username] = UserProgress(username)
-            self._save_data()
-        return self._progress_data[username]
-    
-    def update_user_progress(self, username: str, category_slug: str, 
+        """Get progress for a user, creating if it doesn't exist.
+
+        A new user is only written to disk once they record progress.
+        """
+        with self._lock:
+            progress = self._progress_data.get(username)
+            if progress is not None:
+                if self.lazy:
+                    self._cache_hits += 1
+                    self._progress_data.move_to_end(username)
+                return progress
+            if self.lazy:
+                self._cache_misses += 1
+                progress = self._lookup(username)
+            if progress is None:
+                progress = UserProgress(username)
+            self._progress_data[username] = progress
+            if self.lazy:
+                self._evict()
+            return progress
+
+    def update_user_progress(self, username: str, category_slug: str,
+                           questions_attempted: int, questions_correct: int):
+        """Update progress for a user in a specific category.
+
+        With write-behind the attempt record is queued with the user and
+        written by the same flush, so a crash loses both or neither.
+        """
+        with self._lock:
+            progress = self.get_user_progress(username)
+            progress.update_category_progress(category_slug, questions_attempted, questions_correct)
+            attempt = (username, category_slug, questions_attempted, questions_correct,
+                       progress.updated_at)
+            deferred = self.write_behind and not self._closed
+            if deferred:
+                self._pending_attempts.append(attempt)
+            self._update_leaderboard(progress, category_slug)
+        if deferred:
+            self._mark_dirty(username)
+        else:
+            self.attempts.append(*attempt)
+            self._save_users([username])
+
+    def get_all_progress(self) -> Dict[str, UserProgress]:
+        """Get all user progress data.
+
+        In lazy mode this reads every shard (without filling the LRU).
+        """
+        if not self.lazy:
+            return self._progress_data.copy()
+        result = self._read_all_shards()
+        with self._lock:
+            result.update(self._progress_data)
+        return result
+
+    def leaderboard_source(self):
+        """Every user as last written by any worker, plus this worker's unflushed changes.
+
+        Users are parsed and yielded one at a time, so a rebuild never holds
+        every ``UserProgress`` in memory at once.
+        """
+        with self._lock:
+            local = {username: self._progress_data[username]
+                     for username in self._dirty.keys() | self._flushing
+                     if username in self._progress_data}
+        for shard in range(self.shard_count):
+            for line in self._read_shard(shard):
+                if _line_username(line) in local:
+                    continue
+                try:
+                    yield UserProgress.from_dict(json.loads(line))
+                except (json.JSONDecodeError, KeyError, ValueError):
+                    continue
+        yield from local.values()
+
+    def _read_all_shards(self) -> Dict[str, UserProgress]:
+        """Parse every shard on disk (without filling the LRU)."""
+        result: Dict[str, UserProgress] = {}
+        for shard in range(self.shard_count):
+            for line in self._read_shard(shard):
+                try:
+                    progress = UserProgress.from_dict(json.loads(line))
+                except (json.JSONDecodeError, KeyError, ValueError):
+                    continue
+                result[progress.username] = progress
+        return result
+
+
+def _line_username(line: str) -> Optional[str]:
+    """Return the username of a shard line without decoding the whole record."""
+    # Lines are written with "username" as the first key
+    prefix = '{"username": '
+    if line.startswith(prefix):
+        try:
+            value, _ = json.JSONDecoder().raw_decode(line, len(prefix))
+            return value
+        except json.JSONDecodeError:
+            pass
+    try:
+        return json.loads(line).get('username')
+    except (json.JSONDecodeError, AttributeError):
+        return None
+
+
+def _scan_offsets(f) -> Dict[str, Tuple[int, int]]:
+    """Build a username -> (offset, length) map by scanning an open shard file."""
+    f.seek(0)
+    offsets: Dict[str, Tuple[int, int]] = {}
+    position = 0
+    for raw in f:
+        line = raw.rstrip(b'\n')
+        if line.strip():
+            username = _line_username(line.decode('utf-8'))
+            if username is not None:
+                offsets[username] = (position, len(line))
+        position += len(raw)
+    return offsets
+
+
+def _file_signature(st) -> Tuple[int, int, int]:
+    """Identify one version of a shard file (rewrites replace the inode)."""
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _atomic_write(path: str, text: str, fsync: bool = True):
+    """Replace ``path`` with ``text`` via a temp file in the same directory."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SQLiteProgressStore(LeaderboardMixin):
+    """Progress storage in a SQLite database shared by all workers.
+
+    Exposes the same API as ``ProgressStore``, but keeps no copy of the data
+    in the process: a dashboard reads only one user's rows, and a submission
+    upserts the user row and one category row and inserts one activity row,
+    all in a single transaction. The database runs in WAL mode, so several
+    gunicorn workers and threads can write concurrently without overwriting
+    each other's submissions.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS user_progress (
+            username TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS category_progress (
+            username TEXT NOT NULL,
+            category_slug TEXT NOT NULL,
+            questions_attempted INTEGER NOT NULL DEFAULT 0,
+            questions_correct INTEGER NOT NULL DEFAULT 0,
+            last_attempted TEXT,
+            PRIMARY KEY (username, category_slug)
+        );
+        CREATE TABLE IF NOT EXISTS activities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            type TEXT NOT NULL,
+            category_slug TEXT,
+            score TEXT,
+            timestamp TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_activities_username ON activities (username, id);
+        CREATE TABLE IF NOT EXISTS activity_days (
+            username TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            PRIMARY KEY (username, day)
+        ) WITHOUT ROWID;
+    """ + SQLiteAttemptLog.SCHEMA
+
+    # Activities kept per user, matching UserProgress
+    MAX_ACTIVITIES = 10
+
+    def __init__(self, db_path: str):
+        self.db_path = os.path.abspath(db_path)
+        self.write_behind = False
+        # One connection per thread
+        self._local = threading.local()
+        self.attempts = SQLiteAttemptLog(self._connect)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    # One row per user with its categories, active days and latest activities
+    # aggregated as JSON, so any number of users loads in a single query
+    LOAD_QUERY = """
+        SELECT u.username, u.created_at, u.updated_at,
+            (SELECT json_group_array(json_array(
+                        c.category_slug, c.questions_attempted, c.questions_correct, c.last_attempted))
+             FROM category_progress c WHERE c.username = u.username),
+            (SELECT json_group_array(day) FROM (
+                SELECT day FROM activity_days d WHERE d.username = u.username ORDER BY day)),
+            (SELECT json_group_array(json_array(type, category_slug, score, timestamp)) FROM (
+                SELECT * FROM (
+                    SELECT id, type, category_slug, score, timestamp FROM activities a
+                    WHERE a.username = u.username ORDER BY id DESC LIMIT {limit}
+                ) ORDER BY id))
+        FROM user_progress u
+    """
+
+    def _from_row(self, row) -> UserProgress:
+        username, created_at, updated_at, categories, days, activities = row
+        progress = UserProgress(username)
+        progress.created_at = datetime.fromisoformat(created_at)
+        progress.updated_at = datetime.fromisoformat(updated_at)
+        for slug, attempted, correct, last_attempted in json.loads(categories):
+            progress.add_category(CategoryProgress(
+                slug, attempted, correct,
+                datetime.fromisoformat(last_attempted) if last_attempted else None))
+        for day in json.loads(days):
+            progress.mark_active(date.fromordinal(day))
+        progress.activities = [
+            {'type': kind, 'category_slug': slug, 'score': score, 'timestamp': timestamp}
+            for kind, slug, score, timestamp in json.loads(activities)
+        ]
+        return progress
+
+    def _load(self, conn: sqlite3.Connection, username: str) -> Optional[UserProgress]:
+        row = conn.execute(self.LOAD_QUERY.format(limit=self.MAX_ACTIVITIES) + ' WHERE u.username = ?',
+                           (username,)).fetchone()
+        return self._from_row(row) if row is not None else None
+
+    def _write(self, conn: sqlite3.Connection, progress: UserProgress, slugs, activities):
+        """Upsert ``progress`` (only the given category rows) and append ``activities``."""
+        conn.execute(
+            'INSERT INTO user_progress (username, created_at, updated_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(username) DO UPDATE SET updated_at = excluded.updated_at',
+            (progress.username, progress.created_at.isoformat(), progress.updated_at.isoformat()))
+        conn.executemany(
+            'INSERT INTO category_progress '
+            '(username, category_slug, questions_attempted, questions_correct, last_attempted) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(username, category_slug) DO UPDATE SET '
+            'questions_attempted = excluded.questions_attempted, '
+            'questions_correct = excluded.questions_correct, '
+            'last_attempted = excluded.last_attempted',
+            [(progress.username, slug, cat.questions_attempted, cat.questions_correct,
+              cat.last_attempted.isoformat() if cat.last_attempted else None)
+             for slug, cat in ((slug, progress.categories[slug]) for slug in slugs)])
+        conn.executemany(
+            'INSERT OR IGNORE INTO activity_days (username, day) VALUES (?, ?)',
+            [(progress.username, day) for day in progress.active_day_ordinals()])
+        if activities:
+            conn.executemany(
+                'INSERT INTO activities (username, type, category_slug, score, timestamp) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(progress.username, a.get('type', ''), a.get('category_slug'),
+                  a.get('score'), a.get('timestamp') or datetime.now().isoformat())
+                 for a in activities])
+            conn.execute(
+                'DELETE FROM activities WHERE username = ? AND id <= ('
+                '  SELECT id FROM activities WHERE username = ? ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                (progress.username, progress.username, self.MAX_ACTIVITIES))
+
+    def get_user_progress(self, username: str) -> UserProgress:
+        """Get progress for a user (an empty, unsaved one if they have none)."""
+        return self._load(self._connect(), username) or UserProgress(username)
+
+    def update_user_progress(self, username: str, category_slug: str,
                            questions_attempted: int, questions_correct: int):
         """Update progress for a user in a specific category."""
-        progress = self.get_user_progress(username)
+        # Build the category row and activity the same way UserProgress does
+        progress = UserProgress(username)
         progress.update_category_progress(category_slug, questions_attempted, questions_correct)
-        self._save_data()
-    
+        conn = self._connect()
+        with conn:
+            self._write(conn, progress, [category_slug], progress.activities)
+            SQLiteAttemptLog.insert(conn, username, category_slug, questions_attempted,
+                                    questions_correct, progress.updated_at)
+        if self._leaderboard is not None:
+            # The overall board needs this user's totals across categories
+            self._update_leaderboard(self.get_user_progress(username), category_slug)
+
     def get_all_progress(self) -> Dict[str, UserProgress]:
-        """Get all user progress data."""
-        return self._progress_data.copy()
+        """Get all user progress data in one query."""
+        return {progress.username: progress for progress in self.leaderboard_source()}
+
+    def leaderboard_source(self):
+        """Every user, read with one query and yielded one at a time."""
+        rows = self._connect().execute(
+            self.LOAD_QUERY.format(limit=self.MAX_ACTIVITIES) + ' ORDER BY u.username')
+        for row in rows:
+            yield self._from_row(row)
+
+    def import_progress(self, progresses) -> int:
+        """Insert ``UserProgress`` records for users not yet in the database.
+
+        Everything is written in one transaction. Returns the number of users
+        imported.
+        """
+        conn = self._connect()
+        imported = 0
+        with conn:
+            existing = {r[0] for r in conn.execute('SELECT username FROM user_progress')}
+            for progress in progresses:
+                if progress.username in existing:
+                    continue
+                existing.add(progress.username)
+                self._write(conn, progress, list(progress.categories), progress.activities)
+                imported += 1
+        if imported and self._leaderboard is not None:
+            self.rebuild_leaderboard()
+        return imported
+
+    def flush(self) -> int:
+        """Nothing is buffered; present for API parity with ``ProgressStore``."""
+        return 0
+
+    def close(self):
+        self.stop_leaderboard()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def metrics(self) -> Dict:
+        """Return figures for monitoring."""
+        conn = self._connect()
+        return {
+            'backend': 'sqlite',
+            'write_behind': False,
+            'dirty_users': 0,
+            'flush_lag_seconds': 0.0,
+            'users': conn.execute('SELECT COUNT(*) FROM user_progress').fetchone()[0],
+        }
+
+
+PROGRESS_STORE_BACKENDS = ('json', 'sqlite')
+
+
+def init_progress_store(app):
+    """Create the application's progress store from its config.
+
+    ``PROGRESS_STORE_BACKEND`` selects sharded JSON files (``'json'``, the
+    default) or ``SQLiteProgressStore`` (``'sqlite'``). The store is kept in
+    ``app.extensions['progress_store']``.
+    """
+    data_dir = app.config.get('PROGRESS_DATA_DIR') or app.instance_path
+    backend = app.config.get('PROGRESS_STORE_BACKEND', 'json')
+    if backend not in PROGRESS_STORE_BACKENDS:
+        raise ValueError(f"Unknown PROGRESS_STORE_BACKEND {backend!r}")
+    if backend == 'sqlite':
+        store = SQLiteProgressStore(
+            app.config.get('PROGRESS_DB_PATH') or os.path.join(data_dir, 'progress.db'))
+    else:
+        store = ProgressStore(
+            data_dir=data_dir,
+            shard_count=app.config.get('PROGRESS_SHARD_COUNT', ProgressStore.DEFAULT_SHARD_COUNT),
+            write_behind=app.config.get('PROGRESS_WRITE_BEHIND', False),
+            flush_interval=app.config.get('PROGRESS_FLUSH_INTERVAL', 2.0),
+            flush_threshold=app.config.get('PROGRESS_FLUSH_THRESHOLD', 100),
+            lazy=app.config.get('PROGRESS_LAZY_LOAD', False),
+            cache_size=app.config.get('PROGRESS_CACHE_SIZE', 10000),
+        )
+    store.leaderboard_refresh = app.config.get('LEADERBOARD_REFRESH_SECONDS', 300)
+    # A lazy or SQLite store reads nothing at startup; build its board on the thread
+    store.start_leaderboard(background=backend == 'sqlite' or store.lazy)
+    app.extensions['progress_store'] = store
+    return store
 
 
-# Global progress store instance
-progress_store = ProgressStore()
+def get_progress_store():
+    """Return the progress store of the current application."""
+    return current_app.extensions['progress_store']
@@ -0,0 +1,396 @@
+"""
+Question banks.
+
+This module parses the MCQ markdown files in ``app/content`` into immutable
+``Question`` tuples and keeps them in a per-process cache keyed by category
+slug, so practice pages do not re-read and re-parse a bank on every request.
+
+Every question gets a stable ID derived from its text and options. Forms
+carry these IDs, so a submission is graded against the questions that were
+actually shown even if the bank was edited in the meantime.
+
+With a cache directory, each bank is also compiled to a ``<slug>.qbank``
+file that is memory-mapped read-only (``MmapQuestionBank``). Workers then
+share one copy of every bank through the OS page cache, and a question is
+only decoded when it is served.
+"""
+from collections import namedtuple
+from collections.abc import Mapping as MappingABC, Sequence as SequenceABC
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Tuple
+import hashlib
+import mmap
+import os
+import re
+import struct
+import threading
+from flask import current_app
+
+Option = namedtuple('Option', 'key text')
+Question = namedtuple('Question', 'id question options answer')
+# A parsed bank plus what it was parsed from
+CompiledBank = namedtuple('CompiledBank', 'mtime_ns size questions answer_key digest')
+
+DEFAULT_CONTENT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'content')
+
+_SLUG_RE = re.compile(r'^[a-z0-9][a-z0-9-]*$')
+_ID_RE = re.compile(r'^[0-9a-f]{16}$')
+_OPTION_RE = re.compile(r"^-\s*([A-Da-d])\)\s*(.+)$")
+_QUESTION_RE = re.compile(r"^\d+\)\s*(.+)$")
+_ANSWER_RE = re.compile(r"^Answer:\s*([A-Da-d])(?:\b.*)?$")
+
+
+def question_id(text: str, options: Iterable[Option]) -> str:
+    """Stable 16-hex-digit ID for a question's text and options.
+
+    The answer is deliberately left out, so correcting a wrong answer key
+    keeps the ID (and regrades open quizzes against the fix).
+    """
+    parts = [text] + [f'{key}) {option}' for key, option in options]
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def parse_mcq_markdown(md_text: str) -> Tuple[Question, ...]:
+    """Parse markdown file into a tuple of ``Question``s with options and answer.
+
+    Expected format per question:
+    N) Question text
+    - A) option
+    - B) option
+    - C) option
+    - D) option
+    Answer: X
+
+    Questions without options or an answer are dropped, as are repeats of
+    an earlier question (same ID).
+    """
+    questions = []
+    current = None
+    for line in md_text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        q_match = _QUESTION_RE.match(line)
+        if q_match:
+            current = [q_match.group(1).strip(), [], None]
+            questions.append(current)
+            continue
+        if current is not None:
+            o_match = _OPTION_RE.match(line)
+            if o_match:
+                current[1].append(Option(o_match.group(1).upper(), o_match.group(2).strip()))
+                continue
+            a_match = _ANSWER_RE.match(line)
+            if a_match:
+                current[2] = a_match.group(1).upper()
+                current = None
+                continue
+    parsed = {}
+    for text, options, answer in questions:
+        if text and options and answer:
+            qid = question_id(text, options)
+            parsed.setdefault(qid, Question(qid, text, tuple(options), answer))
+    return tuple(parsed.values())
+
+
+def grade(answer_key: Mapping[str, str], answers: Mapping[str, Optional[str]]) -> Tuple[int, int]:
+    """Score ``answers`` (question ID -> chosen key) against ``answer_key``.
+
+    Returns ``(correct, total)``. Only the IDs in ``answers`` are looked
+    at; IDs that are no longer in the bank are not counted.
+    """
+    correct = total = 0
+    for qid, chosen in answers.items():
+        answer = answer_key.get(qid)
+        if answer is None:
+            continue
+        total += 1
+        if chosen and chosen.upper() == answer:
+            correct += 1
+    return correct, total
+
+
+def _digest(ids: Iterable[str]) -> str:
+    return hashlib.sha1(''.join(ids).encode('ascii')).hexdigest()[:16]
+
+
+class MmapQuestionBank(SequenceABC):
+    """Read-only ``Sequence`` of ``Question``s backed by a memory-mapped ``.qbank`` file.
+
+    File layout (little-endian)::
+
+        header   magic, version, count, source mtime_ns, source size, digest
+        offsets  count + 1 uint64 record offsets, relative to the data section
+        ids      count (uint64 question id, uint32 position), sorted by id
+        data     per question: uint64 id, answer byte, option count byte,
+                 uint32-length question text, then per option: key byte,
+                 uint32-length text
+
+    Questions are decoded on access; ``answer_key`` answers ID lookups with a
+    binary search over the id table and a one-byte read.
+    """
+
+    MAGIC = b'QBNK'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHxxIQQ16s')
+    OFFSET = struct.Struct('<Q')
+    ID_ENTRY = struct.Struct('<QI')
+    RECORD = struct.Struct('<QBB')
+    LENGTH = struct.Struct('<I')
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, mtime_ns, size, digest = self.HEADER.unpack_from(self._mm, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self._mm.close()
+            raise ValueError(f'{path} is not a version {self.VERSION} question bank')
+        self.path = path
+        self.source_mtime_ns = mtime_ns
+        self.source_size = size
+        self.digest = digest.decode('ascii')
+        self._count = count
+        self._offsets = self.HEADER.size
+        self._ids = self._offsets + (count + 1) * self.OFFSET.size
+        self._data = self._ids + count * self.ID_ENTRY.size
+        self.answer_key = MmapAnswerKey(self)
+
+    @classmethod
+    def write(cls, path: str, questions: Iterable[Question], mtime_ns: int = 0, size: int = 0):
+        """Compile ``questions`` into a ``.qbank`` file at ``path`` (atomically)."""
+        questions = list(questions)
+        records = []
+        for q in questions:
+            parts = [cls.RECORD.pack(int(q.id, 16), ord(q.answer), len(q.options))]
+            text = q.question.encode('utf-8')
+            parts.append(cls.LENGTH.pack(len(text)) + text)
+            for option in q.options:
+                text = option.text.encode('utf-8')
+                parts.append(bytes((ord(option.key),)) + cls.LENGTH.pack(len(text)) + text)
+            records.append(b''.join(parts))
+        offsets = [0]
+        for record in records:
+            offsets.append(offsets[-1] + len(record))
+        ids = sorted((int(q.id, 16), i) for i, q in enumerate(questions))
+        digest = _digest(q.id for q in questions).encode('ascii')
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(questions), mtime_ns, size, digest))
+            f.write(b''.join(cls.OFFSET.pack(offset) for offset in offsets))
+            f.write(b''.join(cls.ID_ENTRY.pack(qid, i) for qid, i in ids))
+            f.write(b''.join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('question index out of range')
+        pos = self._record(index)
+        qid, answer, option_count = self.RECORD.unpack_from(self._mm, pos)
+        text, pos = self._string(pos + self.RECORD.size)
+        options = []
+        for _ in range(option_count):
+            key = chr(self._mm[pos])
+            option, pos = self._string(pos + 1)
+            options.append(Option(key, option))
+        return Question(f'{qid:016x}', text, tuple(options), chr(answer))
+
+    def _record(self, index: int) -> int:
+        return self._data + self.OFFSET.unpack_from(self._mm, self._offsets + index * self.OFFSET.size)[0]
+
+    def _string(self, pos: int) -> Tuple[str, int]:
+        length = self.LENGTH.unpack_from(self._mm, pos)[0]
+        start = pos + self.LENGTH.size
+        return self._mm[start:start + length].decode('utf-8'), start + length
+
+    def _id_entry(self, i: int) -> Tuple[int, int]:
+        return self.ID_ENTRY.unpack_from(self._mm, self._ids + i * self.ID_ENTRY.size)
+
+    def find(self, qid: str) -> Optional[int]:
+        """Position of the question with ID ``qid``, or None."""
+        if not isinstance(qid, str) or not _ID_RE.match(qid):
+            return None
+        target = int(qid, 16)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id_entry(mid)[0] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count:
+            found, index = self._id_entry(lo)
+            if found == target:
+                return index
+        return None
+
+    def question_id(self, index: int) -> str:
+        """ID of the question at ``index``, without decoding the question."""
+        return f'{self.RECORD.unpack_from(self._mm, self._record(index))[0]:016x}'
+
+    def answer(self, index: int) -> str:
+        """Answer key of the question at ``index``, without decoding the question."""
+        return chr(self.RECORD.unpack_from(self._mm, self._record(index))[1])
+
+
+class MmapAnswerKey(MappingABC):
+    """``{question ID: answer}`` view over a ``MmapQuestionBank``."""
+
+    def __init__(self, bank: MmapQuestionBank):
+        self._bank = bank
+
+    def __getitem__(self, qid):
+        index = self._bank.find(qid)
+        if index is None:
+            raise KeyError(qid)
+        return self._bank.answer(index)
+
+    def __len__(self):
+        return len(self._bank)
+
+    def __iter__(self):
+        for i in range(len(self._bank)):
+            yield f'{self._bank._id_entry(i)[0]:016x}'
+
+
+class QuestionBank:
+    """Parsed banks for every ``<slug>.md`` under ``content_dir``.
+
+    A bank is read and parsed on first use and then served from memory.
+    With ``auto_reload`` each lookup also compares the file's mtime and size
+    with the cached copy and re-parses on change; otherwise cached banks are
+    served without touching the filesystem.
+
+    With ``cache_dir``, a parsed bank is written to ``<cache_dir>/<slug>.qbank``
+    and served from a ``MmapQuestionBank`` over that file. A ``.qbank`` whose
+    recorded source mtime and size still match the markdown is mapped
+    without parsing the markdown at all.
+    """
+
+    def __init__(self, content_dir: str = DEFAULT_CONTENT_DIR, auto_reload: bool = False,
+                 cache_dir: Optional[str] = None):
+        self.content_dir = os.path.abspath(content_dir)
+        self.auto_reload = auto_reload
+        self.cache_dir = cache_dir
+        self._banks: Dict[str, CompiledBank] = {}
+        self._lock = threading.Lock()
+
+    def path(self, slug: str) -> Optional[str]:
+        """Path of the markdown file for ``slug``, or None for an invalid slug."""
+        if not _SLUG_RE.match(slug):
+            return None
+        return os.path.join(self.content_dir, f'{slug}.md')
+
+    def get(self, slug: str) -> Optional[Sequence[Question]]:
+        """Return the questions for ``slug``, or None if there is no such bank."""
+        entry = self.compiled(slug)
+        return entry.questions if entry is not None else None
+
+    def answer_key(self, slug: str) -> Optional[Mapping[str, str]]:
+        """Return ``{question ID: answer}`` for ``slug``, or None if there is no such bank."""
+        entry = self.compiled(slug)
+        return entry.answer_key if entry is not None else None
+
+    def compiled(self, slug: str) -> Optional[CompiledBank]:
+        """Return the ``CompiledBank`` for ``slug``, or None if there is no such bank."""
+        cached = self._banks.get(slug)
+        if cached is not None and not self.auto_reload:
+            return cached
+        path = self.path(slug)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._banks.pop(slug, None)
+            return None
+        if cached is not None and (cached.mtime_ns, cached.size) == (stat.st_mtime_ns, stat.st_size):
+            return cached
+        return self._compile(slug, path)
+
+    def _compile(self, slug: str, path: str) -> CompiledBank:
+        entry = self._map(slug, path) if self.cache_dir else None
+        if entry is None:
+            with open(path, 'r', encoding='utf-8') as f:
+                stat = os.fstat(f.fileno())
+                questions = parse_mcq_markdown(f.read())
+            entry = CompiledBank(stat.st_mtime_ns, stat.st_size, questions,
+                                 {q.id: q.answer for q in questions}, _digest(q.id for q in questions))
+            if self.cache_dir:
+                entry = self._write_qbank(slug, entry)
+        with self._lock:
+            self._banks[slug] = entry
+        return entry
+
+    def _qbank_path(self, slug: str) -> str:
+        return os.path.join(self.cache_dir, f'{slug}.qbank')
+
+    def _map(self, slug: str, path: str) -> Optional[CompiledBank]:
+        """Map an up-to-date ``.qbank`` for ``slug``, or return None."""
+        try:
+            stat = os.stat(path)
+            bank = MmapQuestionBank(self._qbank_path(slug))
+        except (OSError, ValueError, struct.error):
+            return None
+        if (bank.source_mtime_ns, bank.source_size) != (stat.st_mtime_ns, stat.st_size):
+            return None
+        return CompiledBank(stat.st_mtime_ns, stat.st_size, bank, bank.answer_key, bank.digest)
+
+    def _write_qbank(self, slug: str, entry: CompiledBank) -> CompiledBank:
+        """Compile ``entry`` to a ``.qbank`` and map it; keep ``entry`` if that fails."""
+        qbank_path = self._qbank_path(slug)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            MmapQuestionBank.write(qbank_path, entry.questions, entry.mtime_ns, entry.size)
+            bank = MmapQuestionBank(qbank_path)
+        except OSError as e:
+            print(f"Could not compile question bank {slug} to {qbank_path}: {e}")
+            return entry
+        return entry._replace(questions=bank, answer_key=bank.answer_key)
+
+    def slugs(self):
+        """Slugs of every bank in ``content_dir``, sorted."""
+        try:
+            names = os.listdir(self.content_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-3] for name in names
+                      if name.endswith('.md') and _SLUG_RE.match(name[:-3]))
+
+    def compile_all(self) -> Dict[str, int]:
+        """Load every bank into the cache, compiling stale ``.qbank`` files; return question counts."""
+        return {slug: len(self._compile(slug, self.path(slug)).questions) for slug in self.slugs()}
+
+
+def init_question_bank(app):
+    """Create the question bank for ``app`` and, unless disabled, preload it.
+
+    Preloading in ``create_app`` means gunicorn's ``--preload`` parses every
+    bank once in the master, before workers fork. Compiled ``.qbank`` files go
+    to ``QUESTION_BANK_CACHE_DIR`` (default ``instance/question_banks``); set
+    ``QUESTION_BANK_MMAP`` to false to keep parsed banks on the heap instead.
+    """
+    cache_dir = None
+    if app.config.get('QUESTION_BANK_MMAP', True):
+        cache_dir = app.config.get('QUESTION_BANK_CACHE_DIR') or os.path.join(app.instance_path, 'question_banks')
+    bank = QuestionBank(app.config.get('QUESTION_BANK_DIR') or DEFAULT_CONTENT_DIR,
+                        auto_reload=app.debug or app.config.get('QUESTION_BANK_AUTO_RELOAD', False),
+                        cache_dir=cache_dir)
+    if app.config.get('QUESTION_BANK_PRELOAD', True):
+        bank.compile_all()
+    app.extensions['question_bank'] = bank
+    return bank
+
+
+def get_question_bank() -> QuestionBank:
+    """Get the current app's question bank."""
+    return current_app.extensions['question_bank']
@@ -0,0 +1,137 @@
+"""
+Quiz assembly.
+
+This module samples practice quizzes of ``k`` questions from a question
+bank. Every user walks each bank in their own pseudo-random order, given by
+a keyed Feistel permutation of question positions, and round ``r`` serves
+the next ``k`` positions in that order. Consecutive rounds therefore never
+repeat a question until the bank has been worked through, and then a fresh
+order begins. Building a quiz costs O(k) whatever the bank size.
+
+A quiz is fully described by ``QuizSpec``. The spec travels with the form as
+a signed token, so grading can rebuild the served questions with nothing
+stored on the server.
+"""
+from collections import namedtuple
+from typing import List, Optional, Sequence
+import hashlib
+import hmac
+from itsdangerous import BadSignature, URLSafeSerializer
+
+QuizSpec = namedtuple('QuizSpec', 'slug seed round size digest')
+ServedOption = namedtuple('ServedOption', 'label key text')
+# ``options`` are shuffled and relabelled; ``answer`` is the original key
+ServedQuestion = namedtuple('ServedQuestion', 'id question options answer answer_label')
+
+LABELS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+FEISTEL_ROUNDS = 4
+TOKEN_SALT = 'practice-quiz'
+
+
+def _hash64(*parts) -> int:
+    data = '\x1f'.join(str(p) for p in parts).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+def quiz_seed(secret: str, username: str, slug: str) -> int:
+    """Per-user, per-bank 63-bit seed derived from the app's secret key."""
+    digest = hmac.new(secret.encode('utf-8'), f'{username}\x1f{slug}'.encode('utf-8'), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'big') >> 1
+
+
+class Permutation:
+    """Keyed pseudo-random permutation of ``range(n)``.
+
+    A balanced Feistel network permutes the smallest even-width power-of-two
+    domain holding ``n``; values that land outside ``range(n)`` are fed
+    through again (cycle-walking) until they fall inside. Each lookup is
+    O(1) expected: the domain is less than four times ``n``.
+    """
+
+    __slots__ = ('n', 'key', '_half', '_mask')
+
+    def __init__(self, n: int, key: int):
+        if n <= 0:
+            raise ValueError('Permutation size must be positive')
+        self.n = n
+        self.key = key
+        bits = max(2, (n - 1).bit_length())
+        self._half = (bits + 1) // 2
+        self._mask = (1 << self._half) - 1
+
+    def _encrypt(self, x: int) -> int:
+        half, mask = self._half, self._mask
+        left, right = x >> half, x & mask
+        for r in range(FEISTEL_ROUNDS):
+            left, right = right, left ^ (_hash64(self.key, r, right) & mask)
+        return (left << half) | right
+
+    def __getitem__(self, i: int) -> int:
+        if not 0 <= i < self.n:
+            raise IndexError('Permutation index out of range')
+        x = self._encrypt(i)
+        while x >= self.n:
+            x = self._encrypt(x)
+        return x
+
+    def __len__(self):
+        return self.n
+
+
+def quiz_positions(n: int, seed: int, round_number: int, size: int) -> List[int]:
+    """Bank positions served in ``round_number`` of a ``size``-question quiz.
+
+    Rounds walk one permutation of the bank ``size`` positions at a time. The
+    last round of a pass wraps around to the start of the same pass, which
+    holds the least recently served questions. The next pass uses a new
+    permutation.
+    """
+    size = min(size, n)
+    rounds_per_pass = -(-n // size)
+    cycle, step = divmod(round_number, rounds_per_pass)
+    order = Permutation(n, _hash64(seed, cycle))
+    start = step * size
+    return [order[(start + i) % n] for i in range(size)]
+
+
+def shuffle_options(question, seed: int) -> ServedQuestion:
+    """Return ``question`` with its options in a per-user, per-question order."""
+    options = list(question.options)
+    rng = _hash64(seed, question.id)
+    # Fisher-Yates driven by successive hashes
+    for i in range(len(options) - 1, 0, -1):
+        j = rng % (i + 1)
+        options[i], options[j] = options[j], options[i]
+        rng = _hash64(rng, i)
+    served = tuple(ServedOption(LABELS[i], opt.key, opt.text) for i, opt in enumerate(options))
+    answer_label = next((opt.label for opt in served if opt.key == question.answer), question.answer)
+    return ServedQuestion(question.id, question.question, served, question.answer, answer_label)
+
+
+def assemble_quiz(questions: Sequence, spec: QuizSpec) -> List[ServedQuestion]:
+    """Build the quiz described by ``spec`` from a bank's ``questions``."""
+    if not questions:
+        return []
+    return [shuffle_options(questions[pos], spec.seed)
+            for pos in quiz_positions(len(questions), spec.seed, spec.round, spec.size)]
+
+
+def served_question_ids(questions: Sequence, spec: QuizSpec) -> List[str]:
+    """IDs of the questions ``spec`` served, without shuffling any options."""
+    if not questions:
+        return []
+    return [questions[pos].id
+            for pos in quiz_positions(len(questions), spec.seed, spec.round, spec.size)]
+
+
+def dump_token(spec: QuizSpec, secret: str) -> str:
+    """Sign ``spec`` for the practice form."""
+    return URLSafeSerializer(secret, salt=TOKEN_SALT).dumps(list(spec))
+
+
+def load_token(token: str, secret: str) -> Optional[QuizSpec]:
+    """Verify a token from ``dump_token``; return None if it is invalid."""
+    try:
+        return QuizSpec(*URLSafeSerializer(secret, salt=TOKEN_SALT).loads(token))
+    except (BadSignature, TypeError):
+        return None
@@ -2,10 +2,17 @@
 In-memory user model and store for authentication and authorization.
 """
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+import json
 import os
+import sqlite3
+import threading
+from flask import current_app, has_app_context
+from app.utils import hashing
+from app.utils.bloom import BloomFilter
+from app.utils.locking import file_lock
 
 try:
     from openpyxl import Workbook, load_workbook
@@ -27,12 +34,37 @@ class User(UserMixin):
         self.is_admin = is_admin
 
     def set_password(self, password: str) -> None:
-        self.password_hash = generate_password_hash(password)
+        # Hashing runs on the bounded pool; raises HashingBusy when saturated
+        self.password_hash = hashing.run(
+            generate_password_hash, password, method=hashing.password_hash_method())
 
     def check_password(self, password: str) -> bool:
         if not self.password_hash:
             return False
-        return check_password_hash(self.password_hash, password)
+        if not hashing.run(check_password_hash, self.password_hash, password):
+            return False
+        if hashing.needs_rehash(self.password_hash):
+            self._upgrade_hash(password)
+        return True
+
+    def _upgrade_hash(self, password: str) -> None:
+        """Best-effort rehash with the configured method after a successful login.
+
+        The salt is kept, so session snapshots taken before the rehash stay
+        valid. Skipped when the hashing pool is saturated (the next login retries),
+        so a correct password never turns into a 503.
+        """
+        try:
+            new_hash = hashing.run(hashing.rehash_password, password, self.password_hash,
+                                   hashing.password_hash_method())
+        except hashing.HashingBusy:
+            return
+        old_hash, self.password_hash = self.password_hash, new_hash
+        try:
+            get_user_store().update_user(self.username, self)
+        except Exception as e:
+            self.password_hash = old_hash
+            print(f"Error upgrading password hash for {self.username}: {e}")
 
     def get_id(self) -> str:
         # Use username as the unique identifier for Flask-Login
@@ -70,21 +102,160 @@ class UserStore:
     def exists_email(cls, email: str) -> bool:
         return email in cls._users_by_email
 
+    @classmethod
+    def identity_conflicts(cls, username: Optional[str], email: Optional[str]) -> Tuple[bool, bool]:
+        """Return (username_taken, email_taken); a None argument is not checked."""
+        return (
+            username is not None and username in cls._users_by_username,
+            email is not None and email in cls._users_by_email,
+        )
+
+
+class _IdentityFilter:
+    """Bloom filters over SQLiteUserStore usernames and emails; a miss means "definitely not taken"."""
+
+    def __init__(self, capacity: int = 1024):
+        self.usernames = BloomFilter(capacity)
+        self.emails = BloomFilter(capacity)
+        # Highest row version folded in
+        self.version = -1
+
+    @property
+    def saturated(self) -> bool:
+        return self.usernames.saturated
+
+    def add(self, username, email) -> None:
+        self.usernames.add(str(username))
+        if email is not None:
+            self.emails.add(str(email))
+
+    def might_have_username(self, username) -> bool:
+        return str(username) in self.usernames
+
+    def might_have_email(self, email) -> bool:
+        return str(email) in self.emails
+
+
+class _UserIndex:
+    """In-memory view of users.xlsx with the journal replayed over it."""
+
+    def __init__(self, signature: tuple, epoch: int):
+        # Signature of the workbook snapshot this view was built from
+        self.signature = signature
+        # Journal generation that applies on top of the snapshot
+        self.epoch = epoch
+        # (inode, bytes consumed) of the journal file
+        self.journal_inode: Optional[int] = None
+        self.journal_offset = 0
+        self.journal_records = 0
+        self.rows: List[list] = []
+        self.by_username: Dict[str, list] = {}
+        self.by_email: Dict[str, list] = {}
+
+    def add_row(self, row: list) -> None:
+        if row[0] is None or row[0] in self.by_username:
+            return
+        if row[1] is not None and row[1] in self.by_email:
+            return
+        self.rows.append(row)
+        self.by_username[row[0]] = row
+        if row[1] is not None:
+            self.by_email[row[1]] = row
+
+    def accepts(self, record: dict) -> bool:
+        """Return True if ``record`` is still valid against the current rows."""
+        if record.get('op') == 'add':
+            row = record['row']
+            return row[0] not in self.by_username and row[1] not in self.by_email
+        if record.get('op') == 'update':
+            row = self.by_username.get(record['username'])
+            if row is None:
+                return False
+            # A rename must not take over another user's username or email
+            username, email = record['row'][0], record['row'][1]
+            if self.by_username.get(username, row) is not row:
+                return False
+            return email is None or self.by_email.get(email, row) is row
+        return False
+
+    def apply(self, record: dict) -> None:
+        op = record.get('op')
+        if op == 'add':
+            self.add_row(list(record['row']))
+        elif op == 'update':
+            # Replay skips collisions journaled before updates were checked
+            if not self.accepts(record):
+                return
+            row = self.by_username[record['username']]
+            new = record['row']
+            del self.by_username[row[0]]
+            if self.by_email.get(row[1]) is row:
+                del self.by_email[row[1]]
+            row[0], row[1], row[2], row[4] = new[0], new[1], new[2], new[4]
+            self.by_username[row[0]] = row
+            self.by_email.setdefault(row[1], row)
+        self.journal_records += 1
+
+
+class _PendingWrite:
+    """A journal record waiting in the ExcelUserStore write queue."""
+
+    __slots__ = ('record', 'accepted', 'done', 'error')
+
+    def __init__(self, record: dict):
+        self.record = record
+        self.accepted = False
+        self.done = False
+        self.error: Optional[BaseException] = None
+
 
 class ExcelUserStore:
     """Excel-backed user store using openpyxl.
 
     File schema (first row as headers):
     username | email | password_hash | created_at_iso | is_admin
+
+    Mutations are not written to the workbook directly. ``add`` and
+    ``update_user`` append an fsynced JSON line to ``users.xlsx.journal``,
+    and reads merge that journal over the last workbook snapshot.
+    ``compact`` folds the journal back into the workbook in one save.
+
+    Each journal starts with an ``{"epoch": N}`` header, and a compacted
+    workbook records the epoch it absorbed in its ``identifier`` property,
+    so a reader never replays a journal that is already in the snapshot.
+
+    Lookups are served from a process-local index (username and email hash
+    maps) that is rebuilt only when the workbook's mtime or size changes;
+    journal growth is applied incrementally.
     """
 
     FILE_NAME = os.path.join(os.path.dirname(__file__), '..', 'users.xlsx')
+    JOURNAL_SUFFIX = '.journal'
+    HEADERS = ['username', 'email', 'password_hash', 'created_at_iso', 'is_admin']
+    EPOCH_PREFIX = 'journal-epoch:'
+
+    # Fold the journal back into the workbook in a background thread once it
+    # holds this many records (0 disables automatic compaction)
+    COMPACT_THRESHOLD = 1000
+
+    _index_state: Optional[_UserIndex] = None
+    _index_lock = threading.RLock()
+
+    # Per-process write queue drained by one leader thread at a time
+    _queue_cond = threading.Condition()
+    _pending: List['_PendingWrite'] = []
+    _flushing = False
+    _compacting = False
 
     @classmethod
     def _file_path(cls) -> str:
         # Resolve normalized absolute path
         return os.path.abspath(cls.FILE_NAME)
 
+    @classmethod
+    def _journal_path(cls) -> str:
+        return cls._file_path() + cls.JOURNAL_SUFFIX
+
     @classmethod
     def _ensure_file(cls) -> None:
         path = cls._file_path()
@@ -95,99 +266,598 @@ class ExcelUserStore:
             wb = Workbook()
             ws = wb.active
             ws.title = 'users'
-            ws.append(['username', 'email', 'password_hash', 'created_at_iso', 'is_admin'])
+            ws.append(cls.HEADERS)
             wb.save(path)
 
     @classmethod
-    def _load_rows(cls) -> List[List[str]]:
+    def _load_snapshot(cls) -> Tuple[List[list], int]:
+        """Read the workbook rows and the journal epoch it already absorbed."""
         cls._ensure_file()
         if load_workbook is None:
             raise RuntimeError('openpyxl is required for ExcelUserStore')
-        wb = load_workbook(cls._file_path())
-        ws = wb.active
-        # Skip header
-        rows = []
-        first = True
-        for row in ws.iter_rows(values_only=True):
-            if first:
-                first = False
-                continue
-            rows.append(list(row))
-        return rows
-
-    @classmethod
-    def _append_row(cls, row: List[str]) -> None:
-        cls._ensure_file()
-        wb = load_workbook(cls._file_path())
-        ws = wb.active
-        ws.append(row)
-        wb.save(cls._file_path())
+        wb = load_workbook(cls._file_path(), read_only=True)
+        try:
+            identifier = wb.properties.identifier or ''
+            folded = 0
+            if identifier.startswith(cls.EPOCH_PREFIX):
+                folded = int(identifier[len(cls.EPOCH_PREFIX):])
+            ws = wb.active
+            # Skip header
+            rows = []
+            for row in ws.iter_rows(min_row=2, values_only=True):
+                row = list(row) + [None] * (5 - len(row))
+                rows.append(row[:5])
+            return rows, folded
+        finally:
+            wb.close()
 
     @classmethod
-    def update_user(cls, original_username: str, updated: User) -> bool:
-        """Update an existing user identified by original_username.
+    def _file_signature(cls) -> tuple:
+        path = cls._file_path()
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size)
 
-        Returns True if a row was updated.
-        """
+    @classmethod
+    def _read_journal(cls, index: _UserIndex) -> None:
+        """Apply complete journal lines past ``index.journal_offset``."""
+        try:
+            f = open(cls._journal_path(), 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            if index.journal_inode != inode:
+                index.journal_inode = inode
+                index.journal_offset = 0
+                header = f.readline()
+                if not header.endswith(b'\n'):
+                    index.journal_inode = None
+                    return
+                index.journal_offset = len(header)
+                if json.loads(header).get('epoch') != index.epoch:
+                    # Stale journal already folded into the snapshot, or a
+                    # newer one that the snapshot does not cover yet
+                    index.journal_offset = None
+                    return
+            elif index.journal_offset is None:
+                return
+            f.seek(index.journal_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # partially written record; pick it up next time
+                index.journal_offset += len(line)
+                index.apply(json.loads(line))
+
+    @classmethod
+    def _journal_epoch(cls) -> Optional[int]:
+        try:
+            with open(cls._journal_path(), 'rb') as f:
+                header = f.readline()
+        except FileNotFoundError:
+            return None
+        return json.loads(header).get('epoch') if header.endswith(b'\n') else None
+
+    @classmethod
+    def _index(cls) -> _UserIndex:
+        """Return the merged user index, refreshing it from disk if needed."""
         cls._ensure_file()
-        wb = load_workbook(cls._file_path())
-        ws = wb.active
-        found = False
-        # Iterate including header; skip header by index
-        for idx, row in enumerate(ws.iter_rows(min_row=2), start=2):
-            username_cell = ws.cell(row=idx, column=1)
-            if username_cell.value == original_username:
-                ws.cell(row=idx, column=1, value=updated.username)
-                ws.cell(row=idx, column=2, value=updated.email)
-                ws.cell(row=idx, column=3, value=updated.password_hash or '')
-                # keep created_at as-is (column 4)
-                ws.cell(row=idx, column=5, value='1' if updated.is_admin else '0')
-                found = True
-                break
-        if found:
-            wb.save(cls._file_path())
-        return found
+        signature = cls._file_signature()
+        with cls._index_lock:
+            index = cls._index_state
+            if index is None or index.signature != signature:
+                for _ in range(3):
+                    rows, folded = cls._load_snapshot()
+                    index = _UserIndex(signature, folded + 1)
+                    epoch = cls._journal_epoch()
+                    if epoch is None or epoch <= index.epoch:
+                        break
+                    # The workbook was replaced by a compaction while we were
+                    # reading it; start over from the new snapshot.
+                    signature = cls._file_signature()
+                else:
+                    # The snapshot predates the journal (e.g. the workbook was
+                    # restored by hand); replay the journal over it anyway.
+                    index.epoch = epoch
+                for r in rows:
+                    # First matching row wins, as with the former linear scan
+                    index.add_row(r)
+                cls._index_state = index
+            cls._read_journal(index)
+            return index
 
     @classmethod
-    def add(cls, user: User) -> User:
-        # Prevent duplicates
-        if cls.exists_username(user.username) or cls.exists_email(user.email):
-            return user
-        cls._append_row([
+    def invalidate_cache(cls) -> None:
+        """Drop the in-memory index so the next lookup re-reads the workbook."""
+        cls._index_state = None
+
+    @classmethod
+    def iter_rows(cls) -> List[list]:
+        """Return every stored row (username, email, password_hash, created_at_iso, is_admin)."""
+        return [list(r) for r in cls._index().rows]
+
+    @staticmethod
+    def _row_to_user(r: list) -> User:
+        u = User(username=r[0], email=r[1])
+        u.password_hash = r[2] or None
+        u.is_admin = (str(r[4]) == '1')
+        # created_at is informational; not restoring exact dt
+        return u
+
+    @staticmethod
+    def _user_to_row(user: User) -> list:
+        return [
             user.username,
             user.email,
             user.password_hash or '',
             user.created_at.isoformat(),
             '1' if user.is_admin else '0',
-        ])
+        ]
+
+    @classmethod
+    def _lock_path(cls) -> str:
+        return cls._file_path() + '.lock'
+
+    @classmethod
+    def _submit(cls, record: dict) -> bool:
+        """Queue a mutation and wait until it is durably journaled.
+
+        Threads of one process share a write queue: whichever thread finds no
+        flush in progress becomes the leader and writes every pending record
+        with a single write and fsync under the cross-process file lock.
+        Returns False if the record was rejected (duplicate add, an update of
+        a user that no longer exists, or one that takes another user's
+        username or email).
+        """
+        entry = _PendingWrite(record)
+        with cls._queue_cond:
+            cls._pending.append(entry)
+            while not entry.done and cls._flushing:
+                cls._queue_cond.wait()
+            if entry.done:
+                if entry.error is not None:
+                    raise entry.error
+                return entry.accepted
+            cls._flushing = True
+        try:
+            while True:
+                with cls._queue_cond:
+                    batch, cls._pending = cls._pending, []
+                if not batch:
+                    break
+                try:
+                    cls._write_batch(batch)
+                except Exception as e:
+                    for pending in batch:
+                        pending.error = e
+                with cls._queue_cond:
+                    for pending in batch:
+                        pending.done = True
+                    cls._queue_cond.notify_all()
+                if entry.done:
+                    break
+        finally:
+            with cls._queue_cond:
+                cls._flushing = False
+                cls._queue_cond.notify_all()
+        if entry.error is not None:
+            raise entry.error
+        if cls.COMPACT_THRESHOLD and cls._index().journal_records >= cls.COMPACT_THRESHOLD:
+            cls._compact_in_background()
+        return entry.accepted
+
+    @classmethod
+    def _write_batch(cls, batch: List['_PendingWrite']) -> None:
+        """Validate and journal a batch of records under the file lock."""
+        with file_lock(cls._lock_path()), cls._index_lock:
+            # Pick up whatever other workers journaled before we got the lock
+            index = cls._index()
+            path = cls._journal_path()
+            if index.journal_inode is None or index.journal_offset is None:
+                # Missing or torn journal, or one left over from an interrupted
+                # compaction; start the generation this snapshot expects.
+                cls._replace_journal(index.epoch)
+                cls._read_journal(index)
+            elif os.path.getsize(path) != index.journal_offset:
+                # A writer died mid-record; drop the torn tail
+                with open(path, 'r+b') as f:
+                    f.truncate(index.journal_offset)
+
+            lines = []
+            try:
+                for pending in batch:
+                    pending.accepted = index.accepts(pending.record)
+                    if pending.accepted:
+                        index.apply(pending.record)
+                        lines.append(json.dumps(pending.record) + '\n')
+                if not lines:
+                    return
+                data = ''.join(lines).encode('utf-8')
+                with open(path, 'ab') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception:
+                # The index may hold records that never reached the disk
+                cls.invalidate_cache()
+                raise
+            index.journal_offset += len(data)
+
+    @classmethod
+    def _replace_journal(cls, epoch: int) -> None:
+        """Atomically replace the journal with an empty one for ``epoch``."""
+        journal_tmp = cls._journal_path() + '.tmp'
+        with open(journal_tmp, 'wb') as f:
+            f.write((json.dumps({'epoch': epoch}) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(journal_tmp, cls._journal_path())
+
+    @classmethod
+    def _compact_in_background(cls) -> None:
+        with cls._queue_cond:
+            if cls._compacting:
+                return
+            cls._compacting = True
+
+        def run():
+            try:
+                cls.compact()
+            finally:
+                cls._compacting = False
+
+        threading.Thread(target=run, name='users-xlsx-compaction', daemon=True).start()
+
+    @classmethod
+    def _rewrite(cls, index: _UserIndex, extra_rows: List[list]) -> None:
+        """Stream ``index.rows`` plus ``extra_rows`` into a new workbook and swap it in.
+
+        Must be called with the file lock held. The journal is folded in the
+        same save, so a new journal generation is started afterwards.
+        """
+        if Workbook is None:
+            raise RuntimeError('openpyxl is required for ExcelUserStore')
+        path = cls._file_path()
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('users')
+        ws.append(cls.HEADERS)
+        for row in index.rows:
+            ws.append(row)
+        for row in extra_rows:
+            ws.append(row)
+        wb.properties.identifier = f'{cls.EPOCH_PREFIX}{index.epoch}'
+        tmp_path = path + '.tmp'
+        wb.save(tmp_path)
+        os.replace(tmp_path, path)
+
+        # Start the next journal generation; readers that still see the
+        # old journal ignore it because its epoch is now folded.
+        cls._replace_journal(index.epoch + 1)
+        cls.invalidate_cache()
+
+    @classmethod
+    def compact(cls) -> int:
+        """Fold the journal into the workbook with a single save.
+
+        Returns the number of journal records folded.
+        """
+        # Other writers wait on the file lock; readers keep using the old
+        # index until the new workbook lands.
+        with file_lock(cls._lock_path()):
+            index = cls._index()
+            if not index.journal_records:
+                return 0
+            cls._rewrite(index, [])
+            return index.journal_records
+
+    @classmethod
+    def bulk_import(cls, rows: List[list]) -> int:
+        """Add (username, email, password_hash, created_at_iso, is_admin) rows with one save.
+
+        Rows colliding with an existing user, or with an earlier row of the
+        same batch, are skipped. Pending journal records are folded in the
+        same save. Returns the number of rows added.
+        """
+        with file_lock(cls._lock_path()):
+            index = cls._index()
+            usernames = set(index.by_username)
+            emails = set(index.by_email)
+            new_rows = []
+            for r in rows:
+                if not r or r[0] is None or r[1] is None:
+                    continue
+                if r[0] in usernames or r[1] in emails:
+                    continue
+                usernames.add(r[0])
+                emails.add(r[1])
+                new_rows.append(list(r))
+            if new_rows or index.journal_records:
+                cls._rewrite(index, new_rows)
+            return len(new_rows)
+
+    @classmethod
+    def update_user(cls, original_username: str, updated: User) -> bool:
+        """Update an existing user identified by original_username.
+
+        Returns True if a row was updated.
+        """
+        if original_username not in cls._index().by_username:
+            return False
+        row = cls._user_to_row(updated)
+        # keep created_at as-is
+        row[3] = None
+        return cls._submit({'op': 'update', 'username': original_username, 'row': row})
+
+    @classmethod
+    def add(cls, user: User) -> Optional[User]:
+        """Add ``user``; return None if the username or email is already taken.
+
+        The check is repeated under the file lock, so of two workers racing
+        for one username exactly one gets the user back.
+        """
+        if cls.exists_username(user.username) or cls.exists_email(user.email):
+            return None
+        if not cls._submit({'op': 'add', 'row': cls._user_to_row(user)}):
+            return None
         return user
 
     @classmethod
     def get_by_username(cls, username: str) -> Optional[User]:
-        for r in cls._load_rows():
-            if r and r[0] == username:
-                u = User(username=r[0], email=r[1])
-                u.password_hash = r[2] or None
-                u.is_admin = (str(r[4]) == '1')
-                # created_at is informational; not restoring exact dt
-                return u
-        return None
+        r = cls._index().by_username.get(username)
+        return cls._row_to_user(r) if r else None
 
     @classmethod
     def get_by_email(cls, email: str) -> Optional[User]:
-        for r in cls._load_rows():
-            if r and r[1] == email:
-                u = User(username=r[0], email=r[1])
-                u.password_hash = r[2] or None
-                u.is_admin = (str(r[4]) == '1')
-                return u
-        return None
+        r = cls._index().by_email.get(email)
+        return cls._row_to_user(r) if r else None
 
     @classmethod
     def exists_username(cls, username: str) -> bool:
-        return cls.get_by_username(username) is not None
+        return username in cls._index().by_username
 
     @classmethod
     def exists_email(cls, email: str) -> bool:
-        return cls.get_by_email(email) is not None
+        return email in cls._index().by_email
+
+    @classmethod
+    def identity_conflicts(cls, username: Optional[str], email: Optional[str]) -> Tuple[bool, bool]:
+        """Return (username_taken, email_taken) from a single index refresh.
+
+        A None argument is not checked.
+        """
+        index = cls._index()
+        return (
+            username is not None and username in index.by_username,
+            email is not None and email in index.by_email,
+        )
+
+
+class SQLiteUserStore:
+    """SQLite-backed user store with the same classmethod surface as ExcelUserStore.
+
+    Username and email are enforced unique by indexes, and the database runs
+    in WAL mode so readers in other workers are not blocked by a writer.
+
+    Every insert or update stamps the row with the next ``version``, which
+    lets each process keep its availability Bloom filter current by reading
+    only rows newer than the last version it saw.
+    """
+
+    DB_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'instance', 'users.db')
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            email TEXT NOT NULL,
+            password_hash TEXT,
+            created_at TEXT,
+            is_admin INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username);
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email);
+        CREATE INDEX IF NOT EXISTS ix_users_version ON users (version);
+    """
+
+    NEXT_VERSION = '(SELECT COALESCE(MAX(version), 0) + 1 FROM users)'
+
+    # One connection per thread and database path
+    _local = threading.local()
+
+    # Per-process availability filters keyed by database path
+    _filters: Dict[str, _IdentityFilter] = {}
+    _filter_lock = threading.Lock()
+
+    @classmethod
+    def _db_path(cls) -> str:
+        return os.path.abspath(cls.DB_PATH)
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        path = cls._db_path()
+        connections = getattr(cls._local, 'connections', None)
+        if connections is None:
+            connections = cls._local.connections = {}
+        conn = connections.get(path)
+        if conn is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = sqlite3.connect(path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(cls.SCHEMA)
+            connections[path] = conn
+        return conn
+
+    @classmethod
+    def _filter(cls, force: bool = False) -> _IdentityFilter:
+        """Return this process's Bloom filter, folding in rows changed elsewhere.
+
+        ``PRAGMA data_version`` only changes when another connection commits,
+        so an unchanged value means the filter is current without a query.
+        """
+        path = cls._db_path()
+        conn = cls._connect()
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        seen = getattr(cls._local, 'data_versions', None)
+        if seen is None:
+            seen = cls._local.data_versions = {}
+        current = cls._filters.get(path)
+        if current is not None and not force and seen.get(path) == data_version:
+            return current
+        with cls._filter_lock:
+            current = cls._filters.get(path)
+            if current is None or current.saturated:
+                count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+                current = _IdentityFilter(max(1024, 2 * count))
+            for username, email, version in conn.execute(
+                    'SELECT username, email, version FROM users WHERE version > ? ORDER BY version',
+                    (current.version,)):
+                current.add(username, email)
+                current.version = version
+            cls._filters[path] = current
+        seen[path] = data_version
+        return current
+
+    @staticmethod
+    def _row_to_user(r: tuple) -> User:
+        u = User(username=r[0], email=r[1])
+        u.password_hash = r[2] or None
+        u.is_admin = bool(r[3])
+        return u
+
+    @classmethod
+    def iter_rows(cls) -> List[list]:
+        """Return every stored row (username, email, password_hash, created_at_iso, is_admin)."""
+        return [
+            [r[0], r[1], r[2], r[3], '1' if r[4] else '0']
+            for r in cls._connect().execute(
+                'SELECT username, email, password_hash, created_at, is_admin FROM users ORDER BY id')
+        ]
+
+    @classmethod
+    def _fetch_one(cls, column: str, value: str) -> Optional[tuple]:
+        return cls._connect().execute(
+            f'SELECT username, email, password_hash, is_admin FROM users WHERE {column} = ?',
+            (value,),
+        ).fetchone()
 
+    @classmethod
+    def add(cls, user: User) -> Optional[User]:
+        """Add ``user``; return None if the username or email is already taken."""
+        conn = cls._connect()
+        with conn:
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO users (username, email, password_hash, created_at, is_admin, version) '
+                f'VALUES (?, ?, ?, ?, ?, {cls.NEXT_VERSION})',
+                (user.username, user.email, user.password_hash or '',
+                 user.created_at.isoformat(), 1 if user.is_admin else 0),
+            ).rowcount
+        # Our own commits do not move this connection's data_version
+        cls._filter(force=True)
+        return user if inserted else None
+
+    @classmethod
+    def bulk_import(cls, rows: List[list]) -> int:
+        """Insert (username, email, password_hash, created_at_iso, is_admin) rows in one transaction.
+
+        Rows colliding with an existing username or email are skipped.
+        Returns the number of rows inserted.
+        """
+        conn = cls._connect()
+        before = conn.total_changes
+        with conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO users (username, email, password_hash, created_at, is_admin, version) '
+                f'VALUES (?, ?, ?, ?, ?, {cls.NEXT_VERSION})',
+                (
+                    (r[0], r[1], r[2] or '', r[3], 1 if str(r[4]) == '1' else 0)
+                    for r in rows
+                    if r and r[0] is not None and r[1] is not None
+                ),
+            )
+        cls._filter(force=True)
+        return conn.total_changes - before
+
+    @classmethod
+    def update_user(cls, original_username: str, updated: User) -> bool:
+        """Update an existing user identified by original_username.
+
+        Returns True if a row was updated.
+        """
+        conn = cls._connect()
+        try:
+            with conn:
+                cur = conn.execute(
+                    'UPDATE users SET username = ?, email = ?, password_hash = ?, is_admin = ?, '
+                    f'version = {cls.NEXT_VERSION} WHERE username = ?',
+                    (updated.username, updated.email, updated.password_hash or '',
+                     1 if updated.is_admin else 0, original_username),
+                )
+        except sqlite3.IntegrityError:
+            return False
+        cls._filter(force=True)
+        return cur.rowcount > 0
+
+    @classmethod
+    def get_by_username(cls, username: str) -> Optional[User]:
+        r = cls._fetch_one('username', username)
+        return cls._row_to_user(r) if r else None
+
+    @classmethod
+    def get_by_email(cls, email: str) -> Optional[User]:
+        r = cls._fetch_one('email', email)
+        return cls._row_to_user(r) if r else None
+
+    @classmethod
+    def exists_username(cls, username: str) -> bool:
+        if not cls._filter().might_have_username(username):
+            return False
+        return cls._connect().execute(
+            'SELECT 1 FROM users WHERE username = ?', (username,)).fetchone() is not None
+
+    @classmethod
+    def exists_email(cls, email: str) -> bool:
+        if not cls._filter().might_have_email(email):
+            return False
+        return cls._connect().execute(
+            'SELECT 1 FROM users WHERE email = ?', (email,)).fetchone() is not None
+
+    @classmethod
+    def identity_conflicts(cls, username: Optional[str], email: Optional[str]) -> Tuple[bool, bool]:
+        """Return (username_taken, email_taken) from one indexed query.
+
+        A None argument is not checked.
+        """
+        # Only names the Bloom filter might contain need the indexed query
+        candidates = cls._filter()
+        if username is not None and not candidates.might_have_username(username):
+            username = None
+        if email is not None and not candidates.might_have_email(email):
+            email = None
+        if username is None and email is None:
+            return False, False
+        rows = cls._connect().execute(
+            'SELECT username, email FROM users WHERE username = ? OR email = ?',
+            (username, email),
+        ).fetchall()
+        return (
+            any(r[0] == username for r in rows),
+            any(r[1] == email for r in rows),
+        )
+
+
+USER_STORE_BACKENDS = {
+    'excel': ExcelUserStore,
+    'sqlite': SQLiteUserStore,
+}
+
+
+def get_user_store():
+    """Return the persistent user store selected by the USER_STORE_BACKEND config key."""
+    backend = 'excel'
+    if has_app_context():
+        backend = current_app.config.get('USER_STORE_BACKEND', 'excel')
+    try:
+        return USER_STORE_BACKENDS[backend]
+    except KeyError:
+        raise RuntimeError(f'Unknown USER_STORE_BACKEND: {backend!r}')
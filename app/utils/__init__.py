@@ -5,5 +5,8 @@ This module contains various utility functions used throughout the application.
 """
 from . import errors
 from . import filters
+from . import hashing
+from . import locking
+from . import ratelimit
 
-__all__ = ['errors', 'filters']
+__all__ = ['errors', 'filters', 'hashing', 'locking', 'ratelimit']
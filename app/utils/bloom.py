@@ -0,0 +1,54 @@
+"""
+Bloom filter for negative membership checks.
+
+Used by the user stores so that "is this username/email taken?" can be
+answered without touching the authoritative index when the answer is no.
+"""
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Fixed-size bit array with ``k`` hash functions.
+
+    Membership tests may return false positives (at roughly ``error_rate``
+    once ``capacity`` items are added) but never false negatives. Items
+    cannot be removed.
+
+    Args:
+        capacity: Number of items the filter is sized for
+        error_rate: Target false-positive probability at capacity
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, int(capacity))
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: h1 + i * h2 over one 128-bit digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        """Add ``item`` (a string) to the filter."""
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def saturated(self):
+        """True once more items were added than the filter was sized for."""
+        return self.count > self.capacity
@@ -3,8 +3,10 @@ Error handlers for the application.
 
 This module contains error handlers for common HTTP errors.
 """
-from flask import render_template, request, jsonify
+import math
+from flask import render_template, request, jsonify, make_response
 from werkzeug.http import HTTP_STATUS_CODES
+from .hashing import HashingBusy
 
 
 def wants_json_response():
@@ -62,6 +64,11 @@ def internal_error(message='An unexpected error occurred'):
     return error_response(500, message)
 
 
+def service_unavailable(message='Service temporarily unavailable'):
+    """Create a 503 Service Unavailable response."""
+    return error_response(503, message)
+
+
 def page_not_found(e):
     """Handle 404 errors."""
     if wants_json_response():
@@ -83,6 +90,17 @@ def internal_error_handler(e):
     return render_template('errors/500.html'), 500
 
 
+def hashing_busy_error(e):
+    """Handle a saturated password-hashing pool with a fast 503."""
+    retry_after = str(max(1, math.ceil(e.retry_after)))
+    if wants_json_response():
+        response = service_unavailable('The server is busy. Please retry shortly.')
+    else:
+        response = make_response(render_template('errors/503.html'), 503)
+    response.headers['Retry-After'] = retry_after
+    return response
+
+
 def init_error_handlers(app):
     """Register error handlers with the Flask application."""
     app.register_error_handler(400, bad_request)
@@ -91,6 +109,7 @@ def init_error_handlers(app):
     app.register_error_handler(404, page_not_found)
     app.register_error_handler(405, method_not_allowed)
     app.register_error_handler(500, internal_error_handler)
+    app.register_error_handler(HashingBusy, hashing_busy_error)
     
     # No database-specific error handlers required since the app does not use a DB backend
     # CSRF error handler
@@ -0,0 +1,255 @@
+"""
+Bounded execution of password hashing.
+
+Password hashes are deliberately slow. This module runs them on a small,
+fixed-size thread pool with a cap on queued work, so a burst of logins or
+registrations cannot tie up every request thread. When the pool is
+saturated, ``HashingBusy`` is raised and turned into a 503 response with a
+``Retry-After`` header by the error handlers.
+
+It also resolves the configured ``SECURITY_PASSWORD_HASH`` into a werkzeug
+method string and can calibrate that method to a latency budget.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import threading
+import time
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash
+# No public werkzeug API hashes with a given salt; rehash_password needs one
+from werkzeug.security import _hash_internal
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool has no room for more work."""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Password hashing capacity exhausted')
+        self.retry_after = retry_after
+
+
+class HashingExecutor:
+    """Thread pool for password hashing with a queue-depth limit.
+
+    Args:
+        workers: Number of hashing threads
+        max_queue: Number of hash jobs allowed to wait for a free thread
+        retry_after: Seconds suggested to clients when the pool is saturated
+    """
+
+    def __init__(self, workers=4, max_queue=16, retry_after=1):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    def run(self, fn, *args, **kwargs):
+        """Run ``fn`` on the pool and wait for its result.
+
+        Raises:
+            HashingBusy: If ``workers + max_queue`` jobs are already in flight
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy(self.retry_after)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            return self._pool.submit(fn, *args, **kwargs).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        """Return current load figures for monitoring."""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'in_flight': self._in_flight,
+                'rejected': self._rejected,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+# Process-wide executor used by User.set_password and User.check_password
+hash_executor = HashingExecutor()
+
+
+def run(fn, *args, **kwargs):
+    """Run a hashing function on the shared executor."""
+    return hash_executor.run(fn, *args, **kwargs)
+
+
+def init_hashing(app):
+    """Size the shared hashing executor from the application config."""
+    global hash_executor
+    workers = app.config.get('HASH_WORKERS', 4)
+    max_queue = app.config.get('HASH_QUEUE_DEPTH', 16)
+    retry_after = app.config.get('HASH_RETRY_AFTER', 1)
+    current = hash_executor
+    if (current.workers, current.max_queue, current.retry_after) != (workers, max_queue, retry_after):
+        hash_executor = HashingExecutor(workers, max_queue, retry_after)
+        current.shutdown()
+
+
+# Config names that are not werkzeug methods. 'plaintext' keeps tests fast
+# without ever storing a password in the clear (and only applies when the app
+# is testing, see resolve_method); werkzeug has no bcrypt, so it maps to the
+# library default.
+METHOD_ALIASES = {
+    'plaintext': 'pbkdf2:sha256:1',
+    'bcrypt': 'scrypt',
+}
+
+
+def normalize_method(method):
+    """Expand a werkzeug method string with its default parameters.
+
+    ``'scrypt'`` becomes ``'scrypt:32768:8:1'`` and ``'pbkdf2'`` becomes
+    ``'pbkdf2:sha256:<default iterations>'``, matching the prefix werkzeug
+    writes into the hashes it generates.
+    """
+    method = METHOD_ALIASES.get(method, method) or 'scrypt'
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return 'scrypt:32768:8:1'
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+def resolve_method(method, testing=False):
+    """Return the werkzeug method to hash new passwords with for a configured ``method``.
+
+    Outside tests nothing weaker than werkzeug's default for the algorithm
+    is used, so 'plaintext' (or a low work factor) left in a config that
+    reaches a real deployment still gets strong hashes.
+    """
+    resolved = normalize_method(method)
+    if testing:
+        return resolved
+    name = resolved.split(':')[0]
+    floor = normalize_method(name if name in ('scrypt', 'pbkdf2') and method != 'plaintext' else 'scrypt')
+    if method_strength(resolved) < method_strength(floor):
+        return floor
+    return resolved
+
+
+def password_hash_method():
+    """Return the werkzeug method for new hashes from ``SECURITY_PASSWORD_HASH``."""
+    method, testing = None, False
+    if has_app_context():
+        method = current_app.config.get('SECURITY_PASSWORD_HASH')
+        testing = current_app.testing
+    return resolve_method(method, testing)
+
+
+def method_strength(method):
+    """Return a sortable strength for a werkzeug method string.
+
+    scrypt ranks above pbkdf2 at any cost; within an algorithm the work
+    factor decides (``n * r * p`` for scrypt, iterations for pbkdf2).
+    Unknown or unparsable methods rank below both.
+    """
+    name, *args = method.split(':')
+    try:
+        if name == 'scrypt' and len(args) == 3:
+            n, r, p = (int(arg) for arg in args)
+            return (2, n * r * p)
+        if name == 'pbkdf2' and len(args) == 2:
+            return (1, int(args[1]))
+    except ValueError:
+        pass
+    return (0, 0)
+
+
+def needs_rehash(password_hash, method=None):
+    """Return True if ``password_hash`` should be replaced with one made by ``method``.
+
+    ``method`` defaults to the configured one. Hashes are only ever moved to
+    a method at least as strong as the one they were made with, and never
+    to the development 'plaintext' alias.
+    """
+    if not password_hash or '$' not in password_hash:
+        return False
+    method = normalize_method(method) if method else password_hash_method()
+    if method == METHOD_ALIASES['plaintext']:
+        return False
+    stored = password_hash.split('$', 1)[0]
+    return stored != method and method_strength(method) >= method_strength(stored)
+
+
+def password_salt(password_hash):
+    """Return the salt of a werkzeug ``method$salt$hash`` string, or None."""
+    parts = (password_hash or '').split('$', 2)
+    return parts[1] if len(parts) == 3 and parts[1] else None
+
+
+def rehash_password(password, old_hash, method):
+    """Hash ``password`` with ``method``, keeping the salt of ``old_hash``.
+
+    Session snapshots fingerprint the salt, which only setting a new
+    password replaces, so an upgraded hash keeps the user's other sessions.
+    """
+    salt = password_salt(old_hash)
+    if salt is None:
+        return generate_password_hash(password, method=method)
+    digest, actual_method = _hash_internal(method, salt, password)
+    return f'{actual_method}${salt}${digest}'
+
+
+def measure_ms(method, samples=5):
+    """Return the median time in milliseconds to hash a password with ``method``."""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        generate_password_hash('calibration-password', method=method)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def scrypt_memory_bytes(n, r=8):
+    """Memory one scrypt hash with work factor ``n`` and block size ``r`` needs."""
+    return 128 * n * r
+
+
+def calibrate(target_ms, algorithm='scrypt', samples=5, max_memory_mb=64):
+    """Pick hash parameters that cost about ``target_ms`` on this machine.
+
+    For pbkdf2 the iteration count is scaled linearly from a probe run; for
+    scrypt the largest power-of-two work factor within budget is chosen,
+    capped so one hash needs at most ``max_memory_mb``. The suggestion is
+    never weaker than werkzeug's default for the algorithm.
+
+    Returns:
+        tuple: (werkzeug method string, measured median milliseconds)
+    """
+    if algorithm == 'pbkdf2':
+        probe = 'pbkdf2:sha256:100000'
+        iterations = 100000 * target_ms / max(measure_ms(probe, samples), 0.001)
+        # Round to a readable multiple of 10k
+        iterations = max(DEFAULT_PBKDF2_ITERATIONS, int(round(iterations, -4)))
+        method = f'pbkdf2:sha256:{iterations}'
+    elif algorithm == 'scrypt':
+        method = normalize_method('scrypt')
+        n = int(method.split(':')[1])
+        while scrypt_memory_bytes(n * 2) <= max_memory_mb * 1024 * 1024:
+            candidate = f'scrypt:{n * 2}:8:1'
+            if measure_ms(candidate, samples) > target_ms:
+                break
+            n *= 2
+            method = candidate
+    else:
+        raise ValueError(f'Unsupported algorithm: {algorithm!r}')
+    return method, measure_ms(method, samples)
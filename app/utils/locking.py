@@ -0,0 +1,35 @@
+"""
+Cross-process file locking.
+
+This module provides an advisory lock on a sidecar file so that several
+gunicorn workers can serialize writes to a shared data file.
+"""
+from contextlib import contextmanager
+import os
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Hold an exclusive advisory lock on ``lock_path`` for the duration of the block.
+
+    The lock is taken with ``flock`` on a dedicated sidecar file, so it also
+    excludes other threads of the same process that open the file separately.
+    Where ``fcntl`` is unavailable the block runs unlocked.
+
+    Args:
+        lock_path: Path of the sidecar lock file (created if missing)
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
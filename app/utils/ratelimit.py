@@ -0,0 +1,59 @@
+"""
+Token-bucket rate limiting.
+
+Used in front of the login view so that password-hashing capacity goes to
+legitimate traffic instead of credential-stuffing bursts.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class TokenBucketLimiter:
+    """In-process token buckets keyed by arbitrary strings.
+
+    Each key may spend up to ``capacity`` requests in a burst, refilled at
+    ``refill_per_second``. The least recently used buckets are dropped once
+    more than ``max_keys`` are tracked.
+    """
+
+    def __init__(self, capacity, refill_per_second, max_keys=100000):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tokens(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.refill_per_second)
+
+    def consume(self, *keys):
+        """Take one token from every bucket in ``keys``.
+
+        Tokens are only taken if every bucket has one available.
+        Returns 0 on success, or the number of seconds until the request
+        would be allowed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = {key: self._tokens(key, now) for key in keys}
+            short = [key for key, tokens in levels.items() if tokens < 1]
+            if short:
+                if self.refill_per_second <= 0:
+                    return float('inf')
+                return max((1 - levels[key]) / self.refill_per_second for key in short)
+            for key, tokens in levels.items():
+                self._buckets[key] = (tokens - 1, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0
+
+
+def init_rate_limiter(app):
+    """Create the login limiter for the application (disabled if burst is 0)."""
+    burst = app.config.get('LOGIN_RATE_LIMIT_BURST', 10)
+    per_minute = app.config.get('LOGIN_RATE_LIMIT_PER_MINUTE', 10)
+    limiter = TokenBucketLimiter(burst, per_minute / 60.0) if burst else None
+    app.extensions['login_limiter'] = limiter
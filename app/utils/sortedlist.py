@@ -0,0 +1,182 @@
+"""
+Sorted list with positional queries.
+
+A list of sorted sublists (in the style of ``sortedcontainers.SortedList``)
+plus a Fenwick tree over the sublist lengths, so inserts, removals and
+rank lookups cost O(log n) and reading the first k items costs O(log n + k).
+"""
+from bisect import bisect_left, bisect_right, insort
+
+
+class SortedList:
+    """Sorted sequence of comparable, unique-enough values.
+
+    Args:
+        iterable: Initial values
+        load: Target sublist size; sublists split at twice this size
+    """
+
+    def __init__(self, iterable=(), load=500):
+        self._load = load
+        self._lists = []
+        self._maxes = []
+        self._tree = []
+        self._len = 0
+        values = sorted(iterable)
+        for i in range(0, len(values), load):
+            chunk = values[i:i + load]
+            self._lists.append(chunk)
+            self._maxes.append(chunk[-1])
+        self._len = len(values)
+        self._build_tree()
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for sublist in self._lists:
+            yield from sublist
+
+    def __contains__(self, value):
+        pos = bisect_left(self._maxes, value)
+        if pos == len(self._maxes):
+            return False
+        sublist = self._lists[pos]
+        idx = bisect_left(sublist, value)
+        return idx < len(sublist) and sublist[idx] == value
+
+    # Fenwick tree over sublist lengths
+
+    def _build_tree(self):
+        tree = [len(sublist) for sublist in self._lists]
+        for i in range(len(tree)):
+            parent = i | (i + 1)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, pos, delta):
+        tree = self._tree
+        while pos < len(tree):
+            tree[pos] += delta
+            pos |= pos + 1
+
+    def _prefix(self, pos):
+        """Total length of sublists before ``pos``."""
+        total = 0
+        tree = self._tree
+        while pos > 0:
+            total += tree[pos - 1]
+            pos &= pos - 1
+        return total
+
+    def _locate(self, index):
+        """Return (sublist, offset) of the item at ``index``."""
+        tree = self._tree
+        pos = 0
+        step = 1 << (len(tree).bit_length())
+        while step:
+            nxt = pos + step
+            if nxt <= len(tree) and tree[nxt - 1] <= index:
+                index -= tree[nxt - 1]
+                pos = nxt
+            step >>= 1
+        return pos, index
+
+    # Mutation
+
+    def add(self, value):
+        """Insert ``value`` keeping the list sorted."""
+        if not self._maxes:
+            self._lists.append([value])
+            self._maxes.append(value)
+            self._len = 1
+            self._build_tree()
+            return
+        pos = bisect_right(self._maxes, value)
+        if pos == len(self._maxes):
+            pos -= 1
+            self._lists[pos].append(value)
+            self._maxes[pos] = value
+        else:
+            insort(self._lists[pos], value)
+        self._len += 1
+        if len(self._lists[pos]) > 2 * self._load:
+            sublist = self._lists[pos]
+            half = sublist[self._load:]
+            del sublist[self._load:]
+            self._maxes[pos] = sublist[-1]
+            self._lists.insert(pos + 1, half)
+            self._maxes.insert(pos + 1, half[-1])
+            self._build_tree()
+        else:
+            self._tree_add(pos, 1)
+
+    def remove(self, value):
+        """Remove one occurrence of ``value``; raise ValueError if absent."""
+        pos = bisect_left(self._maxes, value)
+        if pos < len(self._maxes):
+            sublist = self._lists[pos]
+            idx = bisect_left(sublist, value)
+            if idx < len(sublist) and sublist[idx] == value:
+                del sublist[idx]
+                self._len -= 1
+                if sublist:
+                    self._maxes[pos] = sublist[-1]
+                    self._tree_add(pos, -1)
+                else:
+                    del self._lists[pos]
+                    del self._maxes[pos]
+                    self._build_tree()
+                return
+        raise ValueError(f'{value!r} not in list')
+
+    def discard(self, value):
+        """Remove ``value`` if present."""
+        try:
+            self.remove(value)
+        except ValueError:
+            pass
+
+    # Queries
+
+    def bisect_left(self, value):
+        """Number of items strictly less than ``value``."""
+        pos = bisect_left(self._maxes, value)
+        if pos == len(self._maxes):
+            return self._len
+        return self._prefix(pos) + bisect_left(self._lists[pos], value)
+
+    def index(self, value):
+        """Position of ``value``; raise ValueError if absent."""
+        if value not in self:
+            raise ValueError(f'{value!r} not in list')
+        return self.bisect_left(value)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self.islice(start, stop)
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('SortedList index out of range')
+        pos, offset = self._locate(index)
+        return self._lists[pos][offset]
+
+    def islice(self, start, stop):
+        """Return items ``start`` to ``stop`` as a list."""
+        if start >= stop:
+            return []
+        pos, offset = self._locate(start)
+        result = []
+        remaining = stop - start
+        while remaining > 0 and pos < len(self._lists):
+            chunk = self._lists[pos][offset:offset + remaining]
+            result.extend(chunk)
+            remaining -= len(chunk)
+            pos += 1
+            offset = 0
+        return result
@@ -0,0 +1,86 @@
+"""
+Session-cached user snapshots.
+
+When ``SESSION_USER_SNAPSHOT`` is enabled, the fields needed to rebuild the
+logged-in ``User`` are kept in the (signed) Flask session, so the user loader
+only reaches the user store once every ``SESSION_USER_SNAPSHOT_TTL`` seconds.
+A fingerprint of the password hash's salt is stored alongside; if the stored
+hash no longer matches when the snapshot is revalidated, the session is revoked.
+Setting a password always draws a new salt, while the rehash on login keeps it,
+so upgrading a hash does not sign the user out elsewhere.
+"""
+import hashlib
+import time
+from flask import current_app, session
+from app.models.user import User
+from app.utils import hashing
+
+SESSION_KEY = '_user_snapshot'
+
+
+def enabled():
+    """Return True if session snapshots are turned on for the current app."""
+    return bool(current_app.config.get('SESSION_USER_SNAPSHOT'))
+
+
+def password_fingerprint(password_hash):
+    """Return a short, non-reversible fingerprint of a password hash's salt.
+
+    Hashes without a salt are fingerprinted whole.
+    """
+    source = hashing.password_salt(password_hash) or password_hash or ''
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+
+
+def remember(user):
+    """Store a snapshot of ``user`` in the session (no-op when disabled)."""
+    if not enabled():
+        return
+    session[SESSION_KEY] = {
+        'u': user.username,
+        'e': user.email,
+        'a': 1 if user.is_admin else 0,
+        'f': password_fingerprint(user.password_hash),
+        't': int(time.time()),
+    }
+
+
+def forget():
+    """Drop any snapshot from the session."""
+    session.pop(SESSION_KEY, None)
+
+
+def load(user_id):
+    """Rebuild the user for ``user_id`` from a fresh snapshot, or return None.
+
+    The returned user has no ``password_hash``; code that needs it must read
+    the user from the store.
+    """
+    if not enabled():
+        return None
+    data = session.get(SESSION_KEY)
+    if not data or data.get('u') != user_id:
+        return None
+    ttl = current_app.config.get('SESSION_USER_SNAPSHOT_TTL', 300)
+    if time.time() - data.get('t', 0) >= ttl:
+        return None
+    user = User(username=data['u'], email=data['e'])
+    user.is_admin = bool(data['a'])
+    return user
+
+
+def revalidate(user):
+    """Check a store-loaded user against the session snapshot.
+
+    Returns False if the snapshot was taken for a different password hash,
+    meaning the password changed since the session was established.
+    Otherwise refreshes the snapshot and returns True.
+    """
+    if not enabled():
+        return True
+    data = session.get(SESSION_KEY)
+    if data and data.get('u') == user.username and data.get('f') != password_fingerprint(user.password_hash):
+        forget()
+        return False
+    remember(user)
+    return True
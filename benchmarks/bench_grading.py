@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Benchmark grading a practice submission against a large question bank.
+
+Compares the former submit_practice path (read the markdown, parse it into
+dicts and grade every position) with the answer-key lookup over the question
+IDs in the form, both for a 20-question quiz and for a form carrying the
+whole bank, with the bank held on the heap and memory-mapped from a .qbank
+file.
+
+Usage:
+    python benchmarks/bench_grading.py --questions 10000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.question_bank import QuestionBank, grade  # noqa: E402
+
+
+def build_bank(path, count):
+    """Write a markdown bank with ``count`` synthetic arithmetic questions."""
+    rng = random.Random(0)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('# Benchmark\n\n')
+        for i in range(1, count + 1):
+            a, b = rng.randint(2, 999), rng.randint(2, 999)
+            options = [a * b + delta for delta in (0, 1, -1, 10)]
+            rng.shuffle(options)
+            f.write(f'{i}) What is {a} × {b}?\n\n')
+            for key, value in zip('ABCD', options):
+                f.write(f'- {key}) {value}\n')
+            f.write(f'\nAnswer: {"ABCD"[options.index(a * b)]}\n\n')
+
+
+def legacy_parse(md_text):
+    """The former _parse_mcq_markdown: regex over every line into dicts."""
+    lines = [l.strip() for l in md_text.splitlines()]
+    questions = []
+    current = None
+    option_pattern = re.compile(r"^-\s*([A-Da-d])\)\s*(.+)$")
+    q_pattern = re.compile(r"^\d+\)\s*(.+)$")
+    answer_pattern = re.compile(r"^Answer:\s*([A-Da-d])(?:\b.*)?$")
+    for line in lines:
+        if not line:
+            continue
+        q_match = q_pattern.match(line)
+        if q_match:
+            current = {'question': q_match.group(1).strip(), 'options': [], 'answer': None}
+            questions.append(current)
+            continue
+        if current is not None:
+            o_match = option_pattern.match(line)
+            if o_match:
+                current['options'].append({'key': o_match.group(1).upper(), 'text': o_match.group(2).strip()})
+                continue
+            a_match = answer_pattern.match(line)
+            if a_match:
+                current['answer'] = a_match.group(1).upper()
+                current = None
+    return [q for q in questions if q.get('question') and q.get('options') and q.get('answer')]
+
+
+def legacy_submit(path, form):
+    """The former submit_practice: re-read, re-parse and grade by position."""
+    with open(path, 'r', encoding='utf-8') as f:
+        questions = legacy_parse(f.read())
+    correct = 0
+    for i, question in enumerate(questions):
+        user_answer = form.get(f'question_{i}')
+        if user_answer and user_answer.upper() == question['answer']:
+            correct += 1
+    return correct, len(questions)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(count, quiz_size, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.md')
+        build_bank(path, count)
+        bank = QuestionBank(tmp)
+        mapped = QuestionBank(tmp, cache_dir=os.path.join(tmp, 'cache'))
+        questions = bank.get('bench')
+        mapped.get('bench')
+        legacy_form = {f'question_{i}': 'A' for i in range(count)}
+
+        def submit(source, served):
+            answers = {q.id: 'A' for q in served}
+            return lambda: grade(source.answer_key('bench'), answers)
+
+        results = {
+            'legacy (parse + positional)': timed(lambda: legacy_submit(path, legacy_form), repeat),
+            f'answer key, {quiz_size} served': timed(submit(bank, questions[:quiz_size]), repeat * 1000),
+            f'answer key, {count} served': timed(submit(bank, questions), repeat),
+            f'mmap answer key, {quiz_size} served': timed(submit(mapped, questions[:quiz_size]), repeat * 100),
+            'cold compile (first request)': timed(lambda: bank._compile('bench', path), repeat),
+            'map existing .qbank': timed(lambda: mapped._compile('bench', path), repeat),
+        }
+    print(f'\n{count} questions')
+    for name, seconds in results.items():
+        print(f'  {name:<32} {seconds * 1000:10.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--questions', type=int, nargs='+', default=[10000])
+    parser.add_argument('--quiz-size', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    for count in args.questions:
+        run(count, args.quiz_size, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
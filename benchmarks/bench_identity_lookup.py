@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Benchmark registration-time identity checks against ExcelUserStore.
+
+Compares the former path (separate exists_username/exists_email calls, each
+re-reading the workbook) with identity_conflicts, both on a cold index (first
+request after the file changed) and a warm one.
+
+Usage:
+    python benchmarks/bench_identity_lookup.py --sizes 10000 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook, load_workbook  # noqa: E402
+from app.models.user import ExcelUserStore  # noqa: E402
+
+
+def build_workbook(path, count):
+    """Write a users.xlsx with ``count`` synthetic rows."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('users')
+    ws.append(ExcelUserStore.HEADERS)
+    for i in range(count):
+        ws.append([f'user{i}', f'user{i}@example.com', 'pbkdf2:sha256:1$salt$hash',
+                   '2024-01-01T00:00:00', '0'])
+    wb.save(path)
+
+
+def legacy_exists(path, column, value):
+    """The former exists_* implementation: load the workbook and scan it."""
+    wb = load_workbook(path)
+    for row in wb.active.iter_rows(min_row=2, values_only=True):
+        if row and row[column] == value:
+            return True
+    return False
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(count, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'users.xlsx')
+        build_workbook(path, count)
+        ExcelUserStore.FILE_NAME = path
+        username, email = 'newcomer', 'newcomer@example.com'
+
+        def legacy():
+            # register() used to call both checks on the Excel store
+            legacy_exists(path, 0, username)
+            legacy_exists(path, 1, email)
+
+        def cold():
+            ExcelUserStore.invalidate_cache()
+            ExcelUserStore.identity_conflicts(username, email)
+
+        def warm():
+            ExcelUserStore.identity_conflicts(username, email)
+
+        results = {
+            'legacy (2 scans)': timed(legacy, max(1, repeat // 10)),
+            'identity_conflicts, cold': timed(cold, max(1, repeat // 10)),
+            'identity_conflicts, warm': timed(warm, repeat * 100),
+        }
+    print(f'\n{count} users')
+    for name, seconds in results.items():
+        print(f'  {name:<28} {seconds * 1000:10.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    for count in args.sizes:
+        run(count, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Measure resident bytes per user for the progress model.
+
+Builds the same synthetic users with the former dict-backed classes
+(datetimes, activity dicts with preformatted scores) and with the current
+slotted model, and reports traced allocation per user for each.
+
+Usage:
+    python benchmarks/bench_progress_memory.py --users 20000 --categories 8
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.progress import UserProgress  # noqa: E402
+
+SLUGS = ['percentages', 'averages', 'ratios', 'time-and-work', 'profit-and-loss',
+         'simple-interest', 'number-series', 'data-interpretation', 'probability', 'ages']
+
+
+class LegacyCategoryProgress:
+    """The former CategoryProgress: a plain object holding a datetime."""
+
+    def __init__(self, category_slug, questions_attempted=0, questions_correct=0, last_attempted=None):
+        self.category_slug = category_slug
+        self.questions_attempted = questions_attempted
+        self.questions_correct = questions_correct
+        self.last_attempted = last_attempted or datetime.now()
+
+
+class LegacyUserProgress:
+    """The former UserProgress: categories dict plus a list of activity dicts."""
+
+    def __init__(self, username):
+        self.username = username
+        self.categories = {}
+        self.activities = []
+        self.created_at = datetime.now()
+        self.updated_at = datetime.now()
+
+    @classmethod
+    def from_dict(cls, data):
+        progress = cls(data['username'])
+        progress.created_at = datetime.fromisoformat(data['created_at'])
+        progress.updated_at = datetime.fromisoformat(data['updated_at'])
+        progress.activities = data.get('activities', [])
+        for slug, cat in data.get('categories', {}).items():
+            progress.categories[slug] = LegacyCategoryProgress(
+                cat['category_slug'], cat['questions_attempted'], cat['questions_correct'],
+                datetime.fromisoformat(cat['last_attempted']))
+        return progress
+
+
+def user_record(i, categories):
+    """Return a to_dict()-shaped record as it would be read from disk."""
+    slugs = SLUGS[:categories]
+    stamp = f'2024-03-{1 + i % 28:02d}T10:{i % 60:02d}:00'
+    return {
+        'username': f'user{i}',
+        'categories': {
+            slug: {'category_slug': slug, 'questions_attempted': 20,
+                   'questions_correct': i % 21, 'last_attempted': stamp}
+            for slug in slugs
+        },
+        'activities': [
+            {'type': 'quiz_completed', 'category_slug': slugs[n % len(slugs)],
+             'score': f'{i % 21}/20 ({(i % 21) * 5:.1f}%)', 'timestamp': stamp}
+            for n in range(10)
+        ],
+        'created_at': '2024-01-01T00:00:00',
+        'updated_at': stamp,
+    }
+
+
+def bytes_per_user(factory, count, categories):
+    """Traced bytes retained per user after building ``count`` users."""
+    import json
+    # Parse from JSON text so no strings are shared with the generator
+    lines = [json.dumps(user_record(i, categories)) for i in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    users = [factory(json.loads(line)) for line in lines]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(users) == count
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--categories', type=int, default=8)
+    args = parser.parse_args()
+
+    legacy = bytes_per_user(LegacyUserProgress.from_dict, args.users, args.categories)
+    compact = bytes_per_user(UserProgress.from_dict, args.users, args.categories)
+    print(f'{args.users} users, {args.categories} categories, 10 activities each')
+    print(f'  {"dict-backed model":<20} {legacy:10.0f} bytes/user')
+    print(f'  {"slotted model":<20} {compact:10.0f} bytes/user ({compact / legacy:.0%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -18,14 +18,63 @@ class Config:
     
     # Database settings removed (no database used)
     
+    # User store settings ('excel' or 'sqlite')
+    USER_STORE_BACKEND = os.environ.get('USER_STORE_BACKEND', 'excel')
+    USER_DB_PATH = os.environ.get('USER_DB_PATH')  # defaults to instance/users.db
+    # Journal records before users.xlsx is compacted in the background (0 = never)
+    USER_JOURNAL_COMPACT_THRESHOLD = int(os.environ.get('USER_JOURNAL_COMPACT_THRESHOLD', 1000))
+    
+    # Progress store settings
+    # 'json' (sharded files) or 'sqlite' (shared safely by several workers)
+    PROGRESS_STORE_BACKEND = os.environ.get('PROGRESS_STORE_BACKEND', 'json')
+    PROGRESS_DATA_DIR = os.environ.get('PROGRESS_DATA_DIR')  # defaults to the instance folder
+    PROGRESS_DB_PATH = os.environ.get('PROGRESS_DB_PATH')  # defaults to <data dir>/progress.db
+    PROGRESS_SHARD_COUNT = int(os.environ.get('PROGRESS_SHARD_COUNT', 256))  # fixed once data exists
+    # Write-behind: batch submissions and flush every interval or at the dirty-user threshold
+    PROGRESS_WRITE_BEHIND = os.environ.get('PROGRESS_WRITE_BEHIND', 'false').lower() in ['true', '1', 't']
+    PROGRESS_FLUSH_INTERVAL = float(os.environ.get('PROGRESS_FLUSH_INTERVAL', 2.0))  # seconds
+    PROGRESS_FLUSH_THRESHOLD = int(os.environ.get('PROGRESS_FLUSH_THRESHOLD', 100))
+    # Lazy mode: load users from the shard offset index on first access, keep an LRU
+    PROGRESS_LAZY_LOAD = os.environ.get('PROGRESS_LAZY_LOAD', 'false').lower() in ['true', '1', 't']
+    PROGRESS_CACHE_SIZE = int(os.environ.get('PROGRESS_CACHE_SIZE', 10000))  # users per worker
+    # Leaderboards are kept per worker; a background thread rebuilds them this often to include other workers' submissions
+    LEADERBOARD_REFRESH_SECONDS = int(os.environ.get('LEADERBOARD_REFRESH_SECONDS', 300))  # 0 = never
+    # Question banks are parsed once per process; auto-reload re-checks file mtimes (always on in debug)
+    QUESTION_BANK_DIR = os.environ.get('QUESTION_BANK_DIR')  # defaults to app/content
+    QUESTION_BANK_PRELOAD = os.environ.get('QUESTION_BANK_PRELOAD', 'true').lower() in ['true', '1', 't']
+    QUESTION_BANK_AUTO_RELOAD = os.environ.get('QUESTION_BANK_AUTO_RELOAD', 'false').lower() in ['true', '1', 't']
+    # Compiled .qbank files are mmap'd so gunicorn workers share one copy of each bank
+    QUESTION_BANK_MMAP = os.environ.get('QUESTION_BANK_MMAP', 'true').lower() in ['true', '1', 't']
+    QUESTION_BANK_CACHE_DIR = os.environ.get('QUESTION_BANK_CACHE_DIR')  # defaults to instance/question_banks
+    QUIZ_SIZE = int(os.environ.get('QUIZ_SIZE', 20))  # questions per practice quiz
+    # Generated questions kept ready per templated category, refilled in the background
+    QUESTION_POOL_SIZE = int(os.environ.get('QUESTION_POOL_SIZE', 500))  # 0 = generate on request
+    QUESTION_POOL_PREFILL = os.environ.get('QUESTION_POOL_PREFILL', 'true').lower() in ['true', '1', 't']
+    
     # Security settings
     WTF_CSRF_ENABLED = os.environ.get('WTF_CSRF_ENABLED', 'true').lower() in ['true', '1', 't']
     SECURITY_PASSWORD_SALT = os.environ.get('SECURITY_PASSWORD_SALT', 'dev-password-salt')
     
+    # Password hashing pool (requests beyond workers + queue depth get a 503)
+    HASH_WORKERS = int(os.environ.get('HASH_WORKERS', 4))
+    HASH_QUEUE_DEPTH = int(os.environ.get('HASH_QUEUE_DEPTH', 16))
+    HASH_RETRY_AFTER = int(os.environ.get('HASH_RETRY_AFTER', 1))  # seconds
+    
+    # Login token buckets, applied per client IP and per username (0 disables)
+    LOGIN_RATE_LIMIT_BURST = int(os.environ.get('LOGIN_RATE_LIMIT_BURST', 10))
+    LOGIN_RATE_LIMIT_PER_MINUTE = int(os.environ.get('LOGIN_RATE_LIMIT_PER_MINUTE', 10))
+    
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto are trusted
+    # (0 when clients connect directly, or they could pick their own address)
+    PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS', 1))
+    
     # Session settings
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
+    # Keep a signed user snapshot in the session so most requests skip the user store
+    SESSION_USER_SNAPSHOT = os.environ.get('SESSION_USER_SNAPSHOT', 'false').lower() in ['true', '1', 't']
+    SESSION_USER_SNAPSHOT_TTL = int(os.environ.get('SESSION_USER_SNAPSHOT_TTL', 300))  # seconds
     
     # Upload settings
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads'))
@@ -60,7 +109,8 @@ class DevelopmentConfig(Config):
     # Disable CSRF protection in development for easier testing
     WTF_CSRF_ENABLED = False
     
-    # Allow less secure password hashing for faster development
+    # 'plaintext' only speeds up hashing when TESTING is set; otherwise
+    # werkzeug's default is used (see app.utils.hashing.resolve_method)
     SECURITY_PASSWORD_HASH = 'plaintext'
 
 
@@ -75,7 +125,7 @@ class TestingConfig(Config):
     # Disable CSRF protection in tests
     WTF_CSRF_ENABLED = False
     
-    # Disable password hashing for tests
+    # Single-iteration pbkdf2 for fast tests (never stored in the clear)
     SECURITY_PASSWORD_HASH = 'plaintext'
 
 
@@ -88,8 +138,8 @@ class ProductionConfig(Config):
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     
-    # Use secure password hashing in production
-    SECURITY_PASSWORD_HASH = 'bcrypt'
+    # Use secure password hashing in production; tune with `flask calibrate-hash`
+    SECURITY_PASSWORD_HASH = os.environ.get('SECURITY_PASSWORD_HASH', 'scrypt')
     SECURITY_PASSWORD_SALT = os.environ.get('SECURITY_PASSWORD_SALT')
     
     # Email settings for production
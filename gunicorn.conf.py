@@ -0,0 +1,26 @@
+"""
+Gunicorn settings for the Aptitude Generator.
+
+Gunicorn reads this file from the working directory automatically, so the
+hooks below apply to the commands in Procfile, render.yaml and railway.json.
+"""
+
+
+def worker_exit(server, worker):
+    """Flush write-behind progress and stop background threads before a worker goes away.
+
+    atexit handlers do not run when gunicorn recycles or stops a worker, so
+    any progress still waiting for the background flusher is written here,
+    and the leaderboard and question-pool threads are stopped.
+    """
+    app = getattr(worker, 'wsgi', None)
+    extensions = getattr(app, 'extensions', {})
+    store = extensions.get('progress_store')
+    if store is not None:
+        try:
+            store.close()
+        except Exception as e:
+            server.log.error('Could not flush progress store: %s', e)
+    if extensions.get('question_pools'):
+        from app.models.generator import close_question_pools
+        close_question_pools(app)
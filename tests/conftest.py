@@ -7,6 +7,7 @@ import os
 import tempfile
 import pytest
 from app import create_app
+from app.models.generator import close_question_pools
 from app.models.user import User, ExcelUserStore
 
 
@@ -21,6 +22,10 @@ def app(tmp_path):
     app = create_app({
         'TESTING': True,
         'WTF_CSRF_ENABLED': False,
+        'PROGRESS_DATA_DIR': str(tmp_path / 'instance'),
+        'QUESTION_BANK_CACHE_DIR': str(tmp_path / 'question_banks'),
+        'LEADERBOARD_REFRESH_SECONDS': 0,
+        'QUESTION_POOL_PREFILL': False,
     })
 
     # Create a test user in the Excel store
@@ -30,6 +35,8 @@ def app(tmp_path):
 
     yield app
 
+    close_question_pools(app)
+
     # Restore file name and cleanup
     ExcelUserStore.FILE_NAME = original_file
     try:
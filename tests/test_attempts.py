@@ -0,0 +1,118 @@
+"""
+Tests for the attempt history log.
+
+This module checks the file and SQLite attempt logs and the paginated
+history on the profile page.
+"""
+from datetime import datetime
+import pytest
+from app.models.attempts import AttemptLog
+from app.models.progress import ProgressStore, SQLiteProgressStore
+
+BASE = int(datetime(2024, 3, 1).timestamp())
+
+
+@pytest.fixture(params=['file', 'sqlite'])
+def log(request, tmp_path):
+    """An attempt log of each kind, holding 25 attempts one hour apart."""
+    if request.param == 'file':
+        attempts = AttemptLog(str(tmp_path / 'attempts'))
+    else:
+        attempts = SQLiteProgressStore(str(tmp_path / 'progress.db')).attempts
+    for i in range(25):
+        attempts.append('alice', 'averages' if i % 2 else 'percentages', 20, i % 21, BASE + i * 3600)
+    attempts.append('bob', 'averages', 5, 5, BASE)
+    return attempts
+
+
+def test_recent_pages_through_history(log):
+    """Test cursor pagination from newest to oldest."""
+    assert log.count('alice') == 25
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = log.recent('alice', limit=10, cursor=cursor)
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert len(seen) == 25
+    assert [a.questions_correct for a in seen[:3]] == [3, 2, 1]
+    assert seen[0].category_slug == 'percentages' and seen[1].category_slug == 'averages'
+    assert all(a.timestamp > b.timestamp for a, b in zip(seen, seen[1:]))
+    assert log.recent('nobody') == ([], None)
+
+
+def test_between_selects_time_range(log):
+    """Test half-open time-range queries."""
+    attempts = log.between('alice', BASE + 5 * 3600, BASE + 8 * 3600)
+    assert [a.questions_correct for a in attempts] == [5, 6, 7]
+    assert log.between('alice', datetime(2023, 1, 1), datetime(2023, 2, 1)) == []
+    assert len(log.between('bob', BASE, BASE + 1)) == 1
+
+
+def test_file_log_uses_binary_search(tmp_path, monkeypatch):
+    """Test that a range query reads O(log n) records, not the whole file."""
+    attempts = AttemptLog(str(tmp_path))
+    for i in range(1000):
+        attempts.append('alice', 'averages', 1, 1, BASE + i)
+    reads = []
+    original = AttemptLog._bisect
+
+    def counting_bisect(self, f, total, epoch):
+        reads.append(epoch)
+        return original(self, f, total, epoch)
+
+    monkeypatch.setattr(AttemptLog, '_bisect', counting_bisect)
+    assert len(attempts.between('alice', BASE + 500, BASE + 510)) == 10
+    assert len(reads) == 2
+
+
+def test_file_log_keeps_time_order(tmp_path):
+    """Test that an out-of-order clock never unsorts a user's file."""
+    attempts = AttemptLog(str(tmp_path))
+    attempts.append('alice', 'averages', 1, 1, BASE + 100)
+    attempts.append('alice', 'ratios', 1, 0, BASE + 50)
+    page, _ = attempts.recent('alice')
+    assert page[0].category_slug == 'ratios'
+    assert page[0].timestamp == page[1].timestamp
+
+
+def test_sqlite_pages_use_indexes(tmp_path):
+    """Test that history pages and ranges are read in index order, without a sort."""
+    store = SQLiteProgressStore(str(tmp_path / 'progress.db'))
+    conn = store._connect()
+    queries = [
+        ('SELECT ts FROM attempts WHERE username = ? AND id < ? ORDER BY id DESC LIMIT ?', ('a', 10, 5)),
+        ('SELECT ts FROM attempts WHERE username = ? AND ts >= ? AND ts < ? ORDER BY ts, id', ('a', 0, 10)),
+    ]
+    for sql, args in queries:
+        plan = ' '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, args))
+        assert 'USING INDEX' in plan or 'USING COVERING INDEX' in plan, plan
+        assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_store_records_every_submission(tmp_path):
+    """Test that progress updates append to the log beyond the ten activities."""
+    store = ProgressStore(str(tmp_path), shard_count=4)
+    for attempted in range(1, 16):
+        store.update_user_progress('alice', 'averages', attempted, attempted)
+    assert len(store.get_user_progress('alice').activities) == 10
+    assert store.attempts.count('alice') == 15
+
+
+def test_profile_paginates_history(app, client):
+    """Test the profile page's Older attempts link."""
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    store = app.extensions['progress_store']
+    for i in range(12):
+        store.update_user_progress('testuser', 'verbal-aptitude', 20, i)
+
+    response = client.get('/profile')
+    assert response.status_code == 200
+    assert b'11/20 (55.0%)' in response.data
+    assert b'Older attempts' in response.data
+    assert b'0/20 (0.0%)' not in response.data
+
+    response = client.get('/profile?before=2')
+    assert b'1/20 (5.0%)' in response.data and b'0/20 (0.0%)' in response.data
+    assert b'Older attempts' not in response.data
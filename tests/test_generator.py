@@ -0,0 +1,170 @@
+"""
+Tests for the parametric question generator.
+
+This module checks generated questions and their answers, the markdown
+batch output, the background question pools, generated-quiz tokens and the
+generated practice pages.
+"""
+from fractions import Fraction
+import io
+import re
+import time
+import pytest
+from app.models import generator
+from app.models.question_bank import parse_mcq_markdown
+
+OPS = {'+': lambda a, b: a + b, '−': lambda a, b: a - b,
+       '×': lambda a, b: a * b, '÷': lambda a, b: Fraction(a, b)}
+
+
+def expected_answer(text):
+    """Work out the answer to a generated question independently, if we can."""
+    match = re.match(r'What is (\d+) (.) (\d+)\?$', text)
+    if match:
+        return str(OPS[match.group(2)](int(match.group(1)), int(match.group(3))))
+    match = re.match(r'What is (\d+)% of (\d+)\?$', text)
+    if match:
+        return str(int(match.group(1)) * int(match.group(2)) // 100)
+    match = re.match(r'A price rises from \$(\d+) to \$(\d+)\.', text)
+    if match:
+        old, new = int(match.group(1)), int(match.group(2))
+        return f'{(new - old) * 100 // old}%'
+    match = re.match(r'Which of the following is identical to (\S+)\?$', text)
+    if match:
+        return match.group(1)
+    return None
+
+
+@pytest.mark.parametrize('slug', sorted(generator.CATEGORY_TEMPLATES))
+def test_generated_questions_are_valid(slug):
+    """Test four distinct options, a correct answer key and seed determinism."""
+    kinds = set()
+    for seed in range(400):
+        question = generator.generate_question(slug, seed)
+        assert question == generator.generate_question(slug, seed)
+        texts = [option.text for option in question.options]
+        assert [option.key for option in question.options] == ['A', 'B', 'C', 'D']
+        assert len(set(texts)) == 4
+        correct = next(o.text for o in question.options if o.key == question.answer)
+        expected = expected_answer(question.question)
+        if expected is not None:
+            assert correct == expected, question
+        kinds.add(question.question.split()[0])
+    assert len(kinds) >= 2
+
+
+def test_write_markdown_round_trips():
+    """Test that batch output parses back into the same questions."""
+    out = io.StringIO()
+    questions = list(generator.generate_questions('numerical-aptitude', 200, seed=11))
+    assert generator.write_markdown(out, 'Numerical Aptitude', iter(questions)) == 200
+    assert out.getvalue().startswith('# Numerical Aptitude\n\n1) ')
+    assert list(parse_mcq_markdown(out.getvalue())) == questions
+    assert list(generator.generate_questions('numerical-aptitude', 200, seed=11)) == questions
+
+
+def test_generated_batches_have_distinct_questions(monkeypatch):
+    """Test that batches skip repeated questions and stop short when the templates run out."""
+    questions = list(generator.generate_questions('numerical-aptitude', 3000, seed=5))
+    assert len({q.id for q in questions}) == len(questions) == 3000
+
+    real = generator.generate_question
+    monkeypatch.setattr(generator, 'generate_question', lambda slug, seed: real(slug, seed % 7))
+    monkeypatch.setattr(generator, 'MAX_REPEATED_DRAWS', 200)
+    questions = list(generator.generate_questions('numerical-aptitude', 20, seed=5))
+    assert len({q.id for q in questions}) == len(questions) <= 7
+
+
+def test_pool_refills_in_background():
+    """Test that taking questions drains the pool and the thread tops it up."""
+    pool = generator.QuestionPool('numerical-aptitude', size=40)
+    try:
+        pool.start()
+        deadline = time.monotonic() + 5
+        while pool.metrics()['available'] < 40 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert pool.metrics()['available'] == 40
+
+        items = pool.take(30)
+        assert len(items) == 30
+        assert all(generator.generate_question('numerical-aptitude', seed) == q for seed, q in items)
+        deadline = time.monotonic() + 5
+        while pool.metrics()['available'] < 40 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        metrics = pool.metrics()
+        assert (metrics['available'], metrics['served'], metrics['misses']) == (40, 30, 0)
+    finally:
+        pool.close()
+
+    assert len(pool.take(50)) == 50
+    assert pool.metrics()['misses'] == 10
+
+
+def test_app_pools_start_lazily_and_close(app):
+    """Test that test apps start no refill threads until a pool is used, and can stop them."""
+    pools = app.extensions['question_pools']
+    assert all(pool._refiller is None for pool in pools.values())
+    pool = pools['numerical-aptitude']
+    assert len(pool.take(3)) == 3
+    assert pool._refiller.is_alive()
+    generator.close_question_pools(app)
+    assert not pool._refiller.is_alive()
+
+
+def test_generated_token():
+    """Test that tokens are bound to the category and user."""
+    token = generator.dump_token('numerical-aptitude', 'alice', [1, 2, 3], 'secret')
+    assert generator.load_token(token, 'numerical-aptitude', 'alice', 'secret') == [1, 2, 3]
+    assert generator.load_token(token, 'numerical-aptitude', 'bob', 'secret') is None
+    assert generator.load_token(token, 'clerical-perceptual-aptitude', 'alice', 'secret') is None
+    assert generator.load_token(token, 'numerical-aptitude', 'alice', 'other') is None
+    too_many = generator.dump_token('numerical-aptitude', 'alice', list(range(500)), 'secret')
+    assert generator.load_token(too_many, 'numerical-aptitude', 'alice', 'secret') is None
+
+
+def test_generated_practice_round_trip(app, client):
+    """Test serving a generated quiz and grading it from the seeds in its token."""
+    app.config['QUIZ_SIZE'] = 5
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    response = client.get('/practice/numerical-aptitude/generated')
+    assert response.status_code == 200
+    token = re.search(rb'name="generated_token" value="([^"]+)"', response.data).group(1).decode()
+    seeds = generator.load_token(token, 'numerical-aptitude', 'testuser', app.config['SECRET_KEY'])
+    assert len(seeds) == 5
+
+    questions = [generator.generate_question('numerical-aptitude', seed) for seed in seeds]
+    data = {f'question_{q.id}': q.answer for q in questions[:4]}
+    data['generated_token'] = token
+    assert client.post('/practice/numerical-aptitude/submit', data=data).status_code == 302
+    category = app.extensions['progress_store'].get_user_progress('testuser').get_category_progress('numerical-aptitude')
+    assert (category.questions_correct, category.questions_attempted) == (4, 5)
+
+    data['generated_token'] = token[:-3] + 'abc'
+    assert client.post('/practice/numerical-aptitude/submit', data=data).status_code == 400
+    assert client.get('/practice/verbal-aptitude/generated').status_code == 404
+    assert b'Practice Generated Questions' in client.get('/practice/numerical-aptitude').data
+
+
+def test_content_generate_command(runner, tmp_path):
+    """Test batch generation to a markdown file."""
+    path = tmp_path / 'generated.md'
+    result = runner.invoke(args=['content', 'generate', '--category', 'clerical-perceptual-aptitude',
+                                 '--count', '150', '--seed', '3', '--output', str(path)])
+    assert result.exit_code == 0, result.output
+    questions = parse_mcq_markdown(path.read_text(encoding='utf-8'))
+    assert len(questions) == 150
+    assert list(questions) == list(generator.generate_questions('clerical-perceptual-aptitude', 150, seed=3))
+
+
+def test_content_generate_reports_shortfall(runner, tmp_path, monkeypatch):
+    """Test that the command warns when it cannot produce enough distinct questions."""
+    real = generator.generate_question
+    monkeypatch.setattr(generator, 'generate_question', lambda slug, seed: real(slug, seed % 3))
+    monkeypatch.setattr(generator, 'MAX_REPEATED_DRAWS', 100)
+    path = tmp_path / 'generated.md'
+    result = runner.invoke(args=['content', 'generate', '--count', '10', '--seed', '1',
+                                 '--output', str(path)])
+    assert result.exit_code == 0, result.output
+    written = len(parse_mcq_markdown(path.read_text(encoding='utf-8')))
+    assert written <= 3
+    assert f'only {written} of 10 requested questions are distinct' in result.output
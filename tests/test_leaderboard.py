@@ -0,0 +1,245 @@
+"""
+Tests for the leaderboards.
+
+This module checks the sorted list behind the boards, incremental updates
+against a full rebuild, percentiles, and the leaderboard and dashboard pages.
+"""
+import random
+import threading
+import time
+import pytest
+from app.models.leaderboard import Leaderboard, OVERALL
+from app.models.progress import ProgressStore, SQLiteProgressStore, UserProgress
+from app.utils.sortedlist import SortedList
+
+
+def test_sorted_list_matches_reference():
+    """Test add/remove/bisect/slicing against a plain sorted list."""
+    rng = random.Random(7)
+    values = SortedList(load=4)
+    reference = []
+    for _ in range(2000):
+        value = rng.randrange(200)
+        if reference and rng.random() < 0.4:
+            value = rng.choice(reference)
+            values.remove(value)
+            reference.remove(value)
+        else:
+            values.add(value)
+            reference.append(value)
+            reference.sort()
+        probe = rng.randrange(200)
+        assert values.bisect_left(probe) == sum(1 for v in reference if v < probe)
+    assert list(values) == reference
+    assert len(values) == len(reference)
+    assert values[:15] == reference[:15]
+    assert values[-1] == reference[-1]
+    with pytest.raises(ValueError):
+        values.remove(1000)
+
+
+def make_store(backend, tmp_path):
+    if backend == 'json':
+        store = ProgressStore(str(tmp_path), shard_count=4)
+    else:
+        store = SQLiteProgressStore(str(tmp_path / 'progress.db'))
+    store.leaderboard_refresh = 0
+    store.start_leaderboard()
+    return store
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def store(request, tmp_path):
+    return make_store(request.param, tmp_path)
+
+
+def test_updates_move_users(store):
+    """Test that submissions after the first build are reflected immediately."""
+    store.update_user_progress('alice', 'averages', 10, 9)
+    store.update_user_progress('bob', 'averages', 10, 5)
+    board = store.leaderboard()
+    assert [e.username for e in board.top('averages')] == ['alice', 'bob']
+    assert board.rank('bob', 'averages') == (2, 2)
+
+    store.update_user_progress('bob', 'averages', 10, 10)
+    assert store.leaderboard() is board
+    assert [e.username for e in board.top('averages')] == ['bob', 'alice']
+    assert board.rank('bob', 'averages') == (1, 2)
+    assert board.rank('carol', 'averages') is None
+
+    store.update_user_progress('carol', 'ratios', 40, 30)
+    assert board.rank('carol', OVERALL, 'correct') == (1, 3)
+    assert board.rank('carol', OVERALL, 'accuracy') == (3, 3)
+    assert board.size('ratios') == 1
+
+
+def test_incremental_matches_rebuild(tmp_path):
+    """Test that a board kept up to date equals one built from scratch."""
+    rng = random.Random(3)
+    store = ProgressStore(str(tmp_path), shard_count=4)
+    board = store.leaderboard()
+    for _ in range(300):
+        attempted = rng.randint(1, 20)
+        store.update_user_progress(f'user{rng.randrange(30)}', rng.choice(['a', 'b', 'c']),
+                                   attempted, rng.randint(0, attempted))
+    rebuilt = Leaderboard.build(store.get_all_progress().values())
+    for scope in (OVERALL, 'a', 'b', 'c'):
+        for metric in Leaderboard.METRICS:
+            assert board.top(scope, metric, 50) == rebuilt.top(scope, metric, 50)
+        assert board._histograms[scope].counts == rebuilt._histograms[scope].counts
+        assert [board.percentile(f'user{i}', scope) for i in range(30)] == \
+            [rebuilt.percentile(f'user{i}', scope) for i in range(30)]
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_leaderboard_reads_never_scan_the_store(backend, tmp_path, monkeypatch):
+    """Test that reading the board does not rebuild it, however old it is."""
+    store = make_store(backend, tmp_path)
+    store.update_user_progress('alice', 'averages', 10, 9)
+    board = store.leaderboard()
+    board.built_at -= 10 ** 6
+
+    def fail():
+        raise AssertionError('store scanned on the request path')
+
+    monkeypatch.setattr(store, 'leaderboard_source', fail)
+    store.update_user_progress('bob', 'averages', 10, 5)
+    assert store.leaderboard() is board
+    assert board.rank('bob', 'averages') == (2, 2)
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_background_refresh_picks_up_other_workers(backend, tmp_path):
+    """Test that the refresh thread folds in submissions made by another process."""
+    store = make_store(backend, tmp_path)
+    store.leaderboard_refresh = 0.05
+    store.start_leaderboard()
+    try:
+        other = make_store(backend, tmp_path)
+        other.update_user_progress('remote', 'averages', 10, 7)
+        other.close()
+        deadline = time.monotonic() + 5
+        while store.leaderboard().rank('remote', 'averages') is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.leaderboard().rank('remote', 'averages') == (1, 1)
+    finally:
+        store.close()
+    assert not store._leaderboard_refresher.is_alive()
+
+
+def test_lazy_store_builds_first_board_off_the_boot_path(tmp_path, monkeypatch):
+    """Test that starting a lazy store's board parses nothing on the calling thread."""
+    writer = make_store('json', tmp_path)
+    writer.update_user_progress('alice', 'averages', 10, 9)
+    writer.close()
+
+    store = ProgressStore(str(tmp_path), shard_count=4, lazy=True)
+    store.leaderboard_refresh = 0
+    release = threading.Event()
+    parsed_on = []
+    source = store.leaderboard_source
+
+    def blocked_source():
+        release.wait(5)
+        return source()
+
+    original = UserProgress.from_dict
+
+    def counting_from_dict(data):
+        parsed_on.append(threading.current_thread().name)
+        return original(data)
+
+    monkeypatch.setattr(store, 'leaderboard_source', blocked_source)
+    monkeypatch.setattr(UserProgress, 'from_dict', staticmethod(counting_from_dict))
+    try:
+        store.start_leaderboard(background=True)
+        assert parsed_on == []
+        assert store.leaderboard().rank('alice', 'averages') is None
+        release.set()
+        store._leaderboard_refresher.join(5)
+        assert store.leaderboard().rank('alice', 'averages') == (1, 1)
+        assert parsed_on and set(parsed_on) == {'leaderboard-refresh'}
+    finally:
+        release.set()
+        store.close()
+
+
+def test_sqlite_get_all_progress_is_one_query(tmp_path):
+    """Test that loading every user issues a single statement."""
+    store = make_store('sqlite', tmp_path)
+    for i in range(5):
+        store.update_user_progress(f'user{i}', 'averages', 10, i)
+        store.update_user_progress(f'user{i}', 'ratios', 4, 2)
+    statements = []
+    store._connect().set_trace_callback(statements.append)
+    everyone = store.get_all_progress()
+    assert len(statements) == 1
+    assert sorted(everyone) == [f'user{i}' for i in range(5)]
+    assert everyone['user3'].get_category_progress('averages').questions_correct == 3
+    assert everyone['user3'].totals[:2] == (14, 5)
+    assert len(everyone['user3'].activities) == 2
+    assert everyone['user3'].activities == store.get_user_progress('user3').activities
+
+
+def test_percentile_counts_lower_buckets(store):
+    """Test "better than X%" against the other users in a category."""
+    for name, correct in (('a', 2), ('b', 5), ('c', 5), ('d', 9), ('e', 10)):
+        store.update_user_progress(name, 'averages', 10, correct)
+    board = store.leaderboard()
+    assert board.percentile('e', 'averages') == 100
+    assert board.percentile('b', 'averages') == 25
+    assert board.percentile('a', 'averages') == 0
+    assert board.percentile('a', 'ratios') is None
+
+    store.update_user_progress('a', 'averages', 10, 6)  # the latest score replaces 2/10
+    assert board.percentile('a', 'averages') == 50
+    assert board._histograms['averages'].total == 5
+
+
+def test_leaderboard_page(app, client):
+    """Test the leaderboard page's table and the viewer's rank."""
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    store = app.extensions['progress_store']
+    store.update_user_progress('testuser', 'verbal-aptitude', 20, 15)
+    store.update_user_progress('someone', 'verbal-aptitude', 20, 18)
+
+    response = client.get('/leaderboard?category=verbal-aptitude')
+    assert response.status_code == 200
+    assert b'Your rank: #2 of 2' in response.data
+    assert response.data.index(b'someone') < response.data.index(b'testuser</td>')
+
+    response = client.get('/leaderboard?category=mechanical-aptitude')
+    assert b'You are not ranked here yet' in response.data
+    assert client.get('/leaderboard?category=nope').status_code == 404
+
+
+def test_dashboard_shows_percentile(app, client):
+    """Test the dashboard's per-category percentile line."""
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    store = app.extensions['progress_store']
+    store.update_user_progress('testuser', 'numerical-aptitude', 20, 15)
+    for name, correct in (('p', 10), ('q', 12), ('r', 19)):
+        store.update_user_progress(name, 'numerical-aptitude', 20, correct)
+
+    response = client.get('/dashboard')
+    assert response.status_code == 200
+    assert b'Better than 67% of users' in response.data
+    assert response.data.count(b'Better than') == 1
+
+
+def test_dashboard_never_rebuilds_the_board(app, client, monkeypatch):
+    """Test that a stale board is read as is by the dashboard."""
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    store = app.extensions['progress_store']
+    for name, correct in (('testuser', 15), ('p', 10)):
+        store.update_user_progress(name, 'numerical-aptitude', 20, correct)
+    store.leaderboard().built_at -= 10 ** 6
+
+    def fail(*args):
+        raise AssertionError('dashboard rebuilt the leaderboard')
+
+    monkeypatch.setattr(store, 'rebuild_leaderboard', fail)
+    monkeypatch.setattr(store, 'get_all_progress', fail)
+    response = client.get('/dashboard')
+    assert response.status_code == 200
+    assert b'Better than 100% of users' in response.data
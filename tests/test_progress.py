@@ -0,0 +1,449 @@
+"""
+Tests for the progress store.
+
+This module contains tests for sharded progress persistence and the
+migration from the single-file format.
+"""
+import json
+import os
+import time
+from datetime import date, timedelta
+import pytest
+from app.models.progress import CategoryProgress, ProgressStore, SQLiteProgressStore, UserProgress, get_progress_store
+from app.models.user import User, ExcelUserStore
+
+
+def shard_lines(store, username):
+    with open(store._shard_path(store._shard_for(username)), encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_submit_rewrites_only_its_shard(tmp_path):
+    """Test that a submission touches one shard and survives a reload."""
+    store = ProgressStore(str(tmp_path), shard_count=8)
+    store.update_user_progress('alice', 'percentages', 10, 7)
+    shard = store._shard_path(store._shard_for('alice'))
+    others = [store._shard_path(n) for n in range(8) if store._shard_path(n) != shard]
+    assert os.path.exists(shard)
+    assert not any(os.path.exists(path) for path in others)
+
+    store.update_user_progress('alice', 'percentages', 20, 15)
+    assert [line['username'] for line in shard_lines(store, 'alice')] == ['alice']
+
+    reloaded = ProgressStore(str(tmp_path), shard_count=8)
+    progress = reloaded.get_user_progress('alice').get_category_progress('percentages')
+    assert (progress.questions_attempted, progress.questions_correct) == (20, 15)
+
+
+def test_shared_shard_keeps_other_users(tmp_path):
+    """Test that users sharing a shard are preserved across each other's saves."""
+    store = ProgressStore(str(tmp_path), shard_count=1)
+    store.update_user_progress('alice', 'percentages', 5, 5)
+    # A second process writes bob to the same shard
+    ProgressStore(str(tmp_path), shard_count=1).update_user_progress('bob', 'averages', 4, 2)
+    store.update_user_progress('alice', 'percentages', 6, 5)
+    assert sorted(line['username'] for line in shard_lines(store, 'alice')) == ['alice', 'bob']
+
+
+def test_get_does_not_persist_new_users(tmp_path):
+    """Test that looking up an unknown user writes nothing."""
+    store = ProgressStore(str(tmp_path), shard_count=8)
+    assert store.get_user_progress('visitor').categories == {}
+    assert not any(name.startswith('shard-') for name in os.listdir(store.progress_dir))
+
+
+def test_shard_count_is_fixed_by_meta(tmp_path):
+    """Test that a directory keeps the shard count it was created with."""
+    ProgressStore(str(tmp_path), shard_count=4).update_user_progress('alice', 'averages', 1, 1)
+    reopened = ProgressStore(str(tmp_path), shard_count=64)
+    assert reopened.shard_count == 4
+    assert reopened.get_user_progress('alice').get_category_progress('averages').questions_correct == 1
+
+
+def test_migrates_legacy_file(tmp_path):
+    """Test that user_progress.json is split into shards on first load."""
+    legacy = {name: UserProgress(name).to_dict() for name in ('alice', 'bob', 'carol')}
+    legacy['alice']['categories'] = {'averages': {
+        'category_slug': 'averages', 'questions_attempted': 3,
+        'questions_correct': 2, 'last_attempted': '2024-01-01T00:00:00'}}
+    (tmp_path / 'user_progress.json').write_text(json.dumps(legacy), encoding='utf-8')
+
+    store = ProgressStore(str(tmp_path), shard_count=4)
+    assert sorted(store.get_all_progress()) == ['alice', 'bob', 'carol']
+    assert store.get_user_progress('alice').get_category_progress('averages').questions_correct == 2
+    assert not (tmp_path / 'user_progress.json').exists()
+    assert (tmp_path / 'user_progress.json.migrated').exists()
+    assert sorted(ProgressStore(str(tmp_path)).get_all_progress()) == ['alice', 'bob', 'carol']
+
+
+def test_migrate_progress_command(app, runner, tmp_path):
+    """Test that migrate-progress imports a given file without clobbering shards."""
+    store = ProgressStore(str(tmp_path / 'data'), shard_count=4)
+    store.update_user_progress('alice', 'averages', 9, 9)
+    source = tmp_path / 'old.json'
+    source.write_text(json.dumps({
+        'alice': UserProgress('alice').to_dict(),
+        'dave': UserProgress('dave').to_dict(),
+    }), encoding='utf-8')
+
+    app.extensions['progress_store'] = store
+    result = runner.invoke(args=['migrate-progress', '--source', str(source)])
+    assert 'Migrated 1 users' in result.output
+    assert store.get_user_progress('alice').get_category_progress('averages').questions_correct == 9
+    assert 'dave' in store.get_all_progress()
+
+
+def test_write_behind_coalesces_until_flush(tmp_path):
+    """Test that write-behind submissions reach disk only when flushed."""
+    store = ProgressStore(str(tmp_path), shard_count=4, write_behind=True,
+                          flush_interval=60, flush_threshold=1000)
+    try:
+        for attempted in range(1, 6):
+            store.update_user_progress('alice', 'averages', attempted, attempted)
+        store.update_user_progress('bob', 'averages', 1, 0)
+        assert ProgressStore(str(tmp_path)).get_all_progress() == {}
+        assert store.metrics()['dirty_users'] == 2
+
+        assert store.flush() == 2
+        metrics = store.metrics()
+        assert (metrics['dirty_users'], metrics['flushes'], metrics['users_flushed']) == (0, 1, 2)
+        reloaded = ProgressStore(str(tmp_path))
+        assert reloaded.get_user_progress('alice').get_category_progress('averages').questions_attempted == 5
+    finally:
+        store.close()
+
+
+def test_write_behind_defers_attempt_log_to_flush(tmp_path, monkeypatch):
+    """Test that write-behind submissions reach the attempt log with their progress."""
+    store = ProgressStore(str(tmp_path), shard_count=4, write_behind=True,
+                          flush_interval=60, flush_threshold=1000)
+    try:
+        store.update_user_progress('alice', 'averages', 4, 3)
+        store.update_user_progress('alice', 'ratios', 2, 2)
+        # A crash now loses the submissions from progress and history alike
+        assert ProgressStore(str(tmp_path)).get_all_progress() == {}
+        assert store.attempts.count('alice') == 0
+
+        appended = []
+        monkeypatch.setattr(store.attempts, 'append', lambda *attempt: appended.append(attempt))
+        monkeypatch.setattr(store, '_write_records', lambda records: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            store.flush()
+        monkeypatch.undo()
+        # The records that were written are not queued again
+        assert store.flush() == 1
+        assert store.attempts.count('alice') == 0
+        assert len(appended) == 2
+
+        store.update_user_progress('bob', 'averages', 1, 1)
+        assert store.flush() == 1
+        assert [a.category_slug for a in store.attempts.recent('bob')[0]] == ['averages']
+    finally:
+        store.close()
+
+
+def test_write_behind_flushes_on_threshold_and_close(tmp_path):
+    """Test the background flusher's threshold trigger and the shutdown flush."""
+    store = ProgressStore(str(tmp_path), shard_count=4, write_behind=True,
+                          flush_interval=60, flush_threshold=3)
+    for name in ('a', 'b', 'c'):
+        store.update_user_progress(name, 'averages', 1, 1)
+    deadline = time.monotonic() + 5
+    while store.metrics()['flushes'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert store.metrics()['users_flushed'] == 3
+
+    store.update_user_progress('d', 'averages', 1, 1)
+    store.close()
+    assert sorted(ProgressStore(str(tmp_path)).get_all_progress()) == ['a', 'b', 'c', 'd']
+    # Once closed, submissions are written synchronously
+    store.update_user_progress('e', 'averages', 1, 1)
+    assert 'e' in ProgressStore(str(tmp_path)).get_all_progress()
+
+
+def test_write_behind_flushes_on_interval(tmp_path):
+    """Test that a lone dirty user is written once the interval elapses."""
+    store = ProgressStore(str(tmp_path), shard_count=4, write_behind=True,
+                          flush_interval=0.05, flush_threshold=1000)
+    try:
+        store.update_user_progress('alice', 'averages', 1, 1)
+        deadline = time.monotonic() + 5
+        while store.metrics()['flushes'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.metrics()['last_flush_lag_seconds'] >= 0.05
+        assert 'alice' in ProgressStore(str(tmp_path)).get_all_progress()
+    finally:
+        store.close()
+
+
+def test_admin_metrics_route(app, client):
+    """Test that /admin/metrics reports store figures to admins only."""
+    with app.app_context():
+        ExcelUserStore.add(User(username='admin', email='admin@example.com',
+                                password='adminpass1', is_admin=True))
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    assert client.get('/admin/metrics').status_code == 403
+    client.get('/logout')
+
+    client.post('/login', data={'username': 'admin', 'password': 'adminpass1'})
+    data = client.get('/admin/metrics').get_json()
+    assert data['progress_store']['dirty_users'] == 0
+    assert 'in_flight' in data['password_hashing']
+
+
+def test_sqlite_store_surface(tmp_path):
+    """Test that SQLiteProgressStore mirrors the ProgressStore API."""
+    store = SQLiteProgressStore(str(tmp_path / 'progress.db'))
+    assert store.get_user_progress('visitor').categories == {}
+    assert store.get_all_progress() == {}
+
+    for attempted in range(1, 13):
+        store.update_user_progress('alice', 'averages', attempted, attempted - 1)
+    store.update_user_progress('alice', 'percentages', 4, 4)
+
+    progress = store.get_user_progress('alice')
+    averages = progress.get_category_progress('averages')
+    assert (averages.questions_attempted, averages.questions_correct) == (12, 11)
+    assert progress.get_overall_progress()['total_questions_attempted'] == 16
+    # Only the ten most recent activities are kept, oldest first
+    assert len(progress.activities) == 10
+    assert progress.activities[-1]['category_slug'] == 'percentages'
+    assert progress.activities[0]['score'].startswith('3/4')
+    assert store._connect().execute('SELECT COUNT(*) FROM activities').fetchone()[0] == 10
+    assert store._connect().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def _submit_progress(db_path, worker, count):
+    """Record ``count`` submissions from several threads of one process."""
+    import threading
+    store = SQLiteProgressStore(db_path)
+
+    def submit(thread):
+        for i in range(count):
+            store.update_user_progress('shared', f'w{worker}t{thread}', i + 1, i)
+            store.update_user_progress(f'w{worker}t{thread}', 'averages', i + 1, i)
+
+    threads = [threading.Thread(target=submit, args=(t,)) for t in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_sqlite_store_concurrent_workers(tmp_path):
+    """Test that several worker processes writing at once lose no updates."""
+    import multiprocessing
+
+    db_path = str(tmp_path / 'progress.db')
+    ctx = multiprocessing.get_context('fork')
+    workers, count = 4, 20
+    procs = [ctx.Process(target=_submit_progress, args=(db_path, w, count)) for w in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert all(p.exitcode == 0 for p in procs)
+
+    store = SQLiteProgressStore(db_path)
+    shared = store.get_user_progress('shared')
+    assert len(shared.categories) == workers * 3
+    assert all(c.questions_attempted == count for c in shared.categories.values())
+    assert len(store.get_all_progress()) == 1 + workers * 3
+
+
+def test_progress_backend_follows_config(tmp_path):
+    """Test that PROGRESS_STORE_BACKEND selects the store class."""
+    from app import create_app
+    app = create_app({'TESTING': True, 'PROGRESS_DATA_DIR': str(tmp_path),
+                      'PROGRESS_STORE_BACKEND': 'sqlite'})
+    with app.app_context():
+        store = get_progress_store()
+        assert isinstance(store, SQLiteProgressStore)
+        assert store.db_path == str(tmp_path / 'progress.db')
+    with pytest.raises(ValueError):
+        create_app({'TESTING': True, 'PROGRESS_DATA_DIR': str(tmp_path),
+                    'PROGRESS_STORE_BACKEND': 'redis'})
+
+
+def test_migrate_progress_into_sqlite(app, runner, tmp_path):
+    """Test that migrate-progress copies sharded progress into SQLite."""
+    data_dir = app.config['PROGRESS_DATA_DIR']
+    shards = ProgressStore(data_dir)
+    shards.update_user_progress('alice', 'averages', 5, 4)
+    shards.update_user_progress('bob', 'averages', 2, 1)
+    store = SQLiteProgressStore(str(tmp_path / 'progress.db'))
+    store.update_user_progress('bob', 'averages', 9, 9)
+    app.extensions['progress_store'] = store
+
+    result = runner.invoke(args=['migrate-progress'])
+    assert 'Migrated 1 of 2 users' in result.output
+    assert store.get_user_progress('alice').get_category_progress('averages').questions_correct == 4
+    assert store.get_user_progress('bob').get_category_progress('averages').questions_correct == 9
+
+
+def test_lazy_mode_loads_users_on_demand(tmp_path, monkeypatch):
+    """Test that lazy mode parses nothing at startup and only the user asked for."""
+    writer = ProgressStore(str(tmp_path), shard_count=2)
+    for i in range(20):
+        writer.update_user_progress(f'user{i}', 'averages', i + 1, i)
+
+    parsed = []
+    original = UserProgress.from_dict.__func__
+    monkeypatch.setattr(UserProgress, 'from_dict',
+                        classmethod(lambda cls, data: parsed.append(data['username']) or original(cls, data)))
+    store = ProgressStore(str(tmp_path), lazy=True, cache_size=5)
+    assert parsed == []
+    progress = store.get_user_progress('user7')
+    assert progress.get_category_progress('averages').questions_attempted == 8
+    assert parsed == ['user7']
+    assert store.get_user_progress('user7') is progress
+    assert store.metrics()['cache_hits'] == 1
+    assert store.get_user_progress('nobody').categories == {}
+
+
+def test_lazy_mode_bounds_the_cache(tmp_path):
+    """Test LRU eviction and that unflushed users stay pinned."""
+    ProgressStore(str(tmp_path), shard_count=2).update_user_progress('seed', 'averages', 1, 1)
+    store = ProgressStore(str(tmp_path), lazy=True, cache_size=3, write_behind=True,
+                          flush_interval=60, flush_threshold=1000)
+    try:
+        store.update_user_progress('dirty', 'averages', 3, 2)
+        for i in range(10):
+            store.get_user_progress(f'reader{i}')
+        assert len(store._progress_data) == 3
+        assert 'dirty' in store._progress_data
+        assert 'reader9' in store._progress_data and 'reader0' not in store._progress_data
+
+        store.flush()
+        assert store.get_all_progress()['dirty'].get_category_progress('averages').questions_correct == 2
+        store.get_user_progress('reader10')
+        store.get_user_progress('reader11')
+        store.get_user_progress('reader12')
+        assert 'dirty' not in store._progress_data
+        assert store.get_user_progress('dirty').get_category_progress('averages').questions_correct == 2
+    finally:
+        store.close()
+
+
+def test_lazy_mode_offset_index(tmp_path):
+    """Test that the .idx sidecar is used when current and rebuilt when stale."""
+    writer = ProgressStore(str(tmp_path), shard_count=1)
+    writer.update_user_progress('alice', 'averages', 2, 1)
+    writer.update_user_progress('bob', 'averages', 4, 3)
+    index_path = writer._index_path(0)
+    with open(index_path, encoding='utf-8') as f:
+        assert set(json.load(f)['offsets']) == {'alice', 'bob'}
+
+    lazy = ProgressStore(str(tmp_path), lazy=True)
+    assert lazy.get_user_progress('bob').get_category_progress('averages').questions_correct == 3
+
+    # Another worker rewrites the shard without a usable sidecar
+    writer.update_user_progress('alice', 'percentages', 10, 10)
+    os.remove(index_path)
+    lazy = ProgressStore(str(tmp_path), lazy=True)
+    assert lazy.get_user_progress('alice').get_category_progress('percentages').questions_correct == 10
+    assert lazy.get_user_progress('bob').get_category_progress('averages').questions_correct == 3
+
+
+def test_compact_model_round_trips_dicts():
+    """Test that the slotted model reads and writes the original dict format."""
+    data = {
+        'username': 'alice',
+        'categories': {'averages': {'category_slug': 'averages', 'questions_attempted': 20,
+                                    'questions_correct': 15, 'last_attempted': '2024-03-01T10:20:30'}},
+        'activities': [
+            {'type': 'quiz_completed', 'category_slug': 'averages',
+             'score': '15/20 (75.0%)', 'timestamp': '2024-03-01T10:20:30'},
+            {'type': 'note', 'category_slug': None, 'score': 'n/a', 'timestamp': '2024-03-02T08:00:00'},
+        ],
+        'created_at': '2024-01-01T00:00:00',
+        'updated_at': '2024-03-02T08:00:00',
+    }
+    progress = UserProgress.from_dict(data)
+    dumped = progress.to_dict()
+    # Older records gain a calendar seeded from their activity days
+    assert dumped.pop('activity_days') == {'origin': '2024-03-01', 'bits': '3'}
+    assert dumped == data
+    assert progress.created_at.year == 2024
+    assert progress.categories['averages'].last_attempted.minute == 20
+    assert not hasattr(progress, '__dict__')
+    assert not hasattr(progress.categories['averages'], '__dict__')
+
+    for attempted in range(1, 13):
+        progress.update_category_progress('averages', attempted, attempted)
+    assert len(progress.activities) == UserProgress.MAX_ACTIVITIES
+    assert progress.activities[-1]['score'] == '12/12 (100.0%)'
+
+
+def test_category_slugs_are_interned():
+    """Test that users share one string object per category slug."""
+    first = CategoryProgress(''.join(['aver', 'ages']))
+    second = UserProgress.from_dict({
+        'username': 'bob', 'created_at': '2024-01-01T00:00:00', 'updated_at': '2024-01-01T00:00:00',
+        'categories': {''.join(['aver', 'ages']): first.to_dict()}})
+    assert next(iter(second.categories)) is first.category_slug
+
+
+def test_running_totals_match_recomputation(tmp_path):
+    """Test that O(1) totals agree with a from-scratch recount."""
+    progress = UserProgress('alice')
+    submissions = [('averages', 10, 7), ('percentages', 20, 12), ('averages', 25, 20),
+                   ('ratios', 0, 0), ('percentages', 5, 5), ('ratios', 20, 20)]
+    for slug, attempted, correct in submissions:
+        progress.update_category_progress(slug, attempted, correct)
+        progress.get_category_progress('untouched')
+        expected = progress.totals
+        assert progress._recompute_totals() == expected
+    assert progress.totals == (50, 45, 3, 2)
+    stats = progress.get_overall_progress()
+    assert (stats['categories_started'], stats['categories_completed']) == (3, 2)
+    assert stats['overall_accuracy'] == 90.0
+
+    restored = UserProgress.from_dict(progress.to_dict())
+    assert restored.totals == progress.totals
+
+    store = SQLiteProgressStore(str(tmp_path / 'progress.db'))
+    for slug, attempted, correct in submissions:
+        store.update_user_progress('alice', slug, attempted, correct)
+    assert store.get_user_progress('alice').totals == progress.totals
+
+
+def test_day_bitmap_streaks():
+    """Test streaks and active-day counts computed from the day bitmap."""
+    progress = UserProgress('alice')
+    today = date(2024, 6, 30)
+    active = [today - timedelta(days=n) for n in (0, 1, 2, 5, 6, 7, 8, 20, 40)]
+    # Record out of order to exercise moving the origin back
+    for day in sorted(active, key=lambda d: (d.day * 7) % 31):
+        progress.mark_active(day)
+
+    assert progress.current_streak(today) == 3
+    assert progress.current_streak(today + timedelta(days=1)) == 0
+    assert progress.current_streak(today - timedelta(days=5)) == 4
+    assert progress.current_streak(date(2020, 1, 1)) == 0
+    assert progress.longest_streak() == 4
+    assert progress.active_days(today - timedelta(days=29), today) == 8
+    assert progress.active_days(date(2020, 1, 1), date(2020, 2, 1)) == 0
+    assert [date.fromordinal(o) for o in progress.active_day_ordinals()] == sorted(active)
+
+    restored = UserProgress.from_dict(json.loads(json.dumps(progress.to_dict())))
+    assert list(restored.active_day_ordinals()) == list(progress.active_day_ordinals())
+
+    calendar = progress.activity_calendar(today, weeks=2)
+    assert len(calendar) == 2 and all(len(week) == 7 for week in calendar)
+    assert calendar[0][0][0].weekday() == 0
+    assert (today, True) in calendar[1]
+
+
+def test_streak_beyond_ten_activities(tmp_path):
+    """Test that streaks longer than the activity list are reported."""
+    store = SQLiteProgressStore(str(tmp_path / 'progress.db'))
+    progress = UserProgress('alice')
+    today = date.today()
+    for n in range(15):
+        progress.mark_active(today - timedelta(days=n))
+    store.import_progress([progress])
+    store.update_user_progress('alice', 'averages', 1, 1)
+    loaded = store.get_user_progress('alice')
+    assert loaded.current_streak(today) == 15
+    assert len(loaded.activities) == 1
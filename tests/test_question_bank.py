@@ -0,0 +1,183 @@
+"""
+Tests for the question bank cache.
+
+This module checks markdown parsing, question IDs and grading, the
+mtime/size cache, memory-mapped .qbank files, the content CLI and the
+practice pages served from the cache.
+"""
+import os
+import re
+import pytest
+from app.models import question_bank
+from app.models.question_bank import MmapQuestionBank, Option, QuestionBank, grade, parse_mcq_markdown
+
+BANK = """# Sample
+
+1) What is 2 + 2?
+
+- A) 3
+- B) 4
+
+Answer: B
+
+2) Dangling question without an answer
+- A) yes
+
+3) Pick c
+- a) one
+- c) three
+Answer: c (because)
+"""
+
+
+def test_parse_mcq_markdown():
+    """Test that questions become immutable tuples and incomplete ones are dropped."""
+    questions = parse_mcq_markdown(BANK)
+    assert [q.question for q in questions] == ['What is 2 + 2?', 'Pick c']
+    assert questions[0].options == (Option('A', '3'), Option('B', '4'))
+    assert questions[1].answer == 'C'
+    assert isinstance(questions, tuple) and isinstance(questions[0].options, tuple)
+
+
+def test_question_ids_are_stable():
+    """Test that IDs follow question content, not position or answer."""
+    ids = [q.id for q in parse_mcq_markdown(BANK)]
+    assert len(ids[0]) == 16 and int(ids[0], 16) >= 0
+    assert len(set(ids)) == 2
+
+    renumbered = BANK.replace('1) What', '7) What').replace('Answer: B', 'Answer: A')
+    assert parse_mcq_markdown(renumbered)[0].id == ids[0]
+    assert parse_mcq_markdown(BANK.replace('- B) 4', '- B) 5'))[0].id != ids[0]
+    inserted = BANK.replace('# Sample', '# Sample\n\n1) New first?\n- A) x\nAnswer: A')
+    assert [q.id for q in parse_mcq_markdown(inserted)][1:] == ids
+
+
+def test_parse_mcq_markdown_drops_repeated_questions():
+    """Test that a question repeated later in a bank is kept once, at its first position."""
+    questions = parse_mcq_markdown(BANK + BANK.replace('1) What', '3) What').replace('Answer: B', 'Answer: A'))
+    assert [q.question for q in questions] == ['What is 2 + 2?', 'Pick c']
+    assert questions[0].answer == 'B'
+
+
+def test_grade_uses_answer_key():
+    """Test grading by ID, ignoring IDs no longer in the bank."""
+    questions = parse_mcq_markdown(BANK)
+    key = {q.id: q.answer for q in questions}
+    answers = {questions[0].id: 'b', questions[1].id: 'A', 'ffffffffffffffff': 'A'}
+    assert grade(key, answers) == (1, 2)
+    assert grade(key, {questions[1].id: None}) == (0, 1)
+    assert grade(key, {}) == (0, 0)
+
+
+def test_cache_skips_filesystem_unless_auto_reload(tmp_path, monkeypatch):
+    """Test that cached banks are served without reading or stat-ing the file."""
+    (tmp_path / 'sample.md').write_text(BANK, encoding='utf-8')
+    bank = QuestionBank(str(tmp_path))
+    assert bank.compile_all() == {'sample': 2}
+    first = bank.get('sample')
+
+    def fail(*args, **kwargs):
+        raise AssertionError('filesystem touched')
+
+    monkeypatch.setattr(os, 'stat', fail)
+    monkeypatch.setattr('builtins.open', fail)
+    assert bank.get('sample') is first
+
+
+def test_auto_reload_reparses_changed_bank(tmp_path):
+    """Test that auto-reload picks up edits and deletions."""
+    path = tmp_path / 'sample.md'
+    path.write_text(BANK, encoding='utf-8')
+    bank = QuestionBank(str(tmp_path), auto_reload=True)
+    first = bank.get('sample')
+    assert bank.get('sample') is first
+
+    path.write_text(BANK.split('2)')[0], encoding='utf-8')
+    assert len(bank.get('sample')) == 1
+    path.unlink()
+    assert bank.get('sample') is None
+
+
+def test_mmap_bank_matches_parsed(tmp_path):
+    """Test that a .qbank file decodes to the same questions and answer key."""
+    questions = parse_mcq_markdown(BANK + BANK.replace('2 + 2', '3 + 3').replace('Pick c', 'Pick ç'))
+    path = str(tmp_path / 'sample.qbank')
+    MmapQuestionBank.write(path, questions, mtime_ns=5, size=7)
+    bank = MmapQuestionBank(path)
+    assert len(bank) == 4
+    assert list(bank) == list(questions)
+    assert bank[-1] == questions[-1] and bank[1:3] == list(questions[1:3])
+    assert (bank.source_mtime_ns, bank.source_size) == (5, 7)
+    assert dict(bank.answer_key) == {q.id: q.answer for q in questions}
+    assert bank.answer_key.get('0' * 16) is None and bank.answer_key.get('nothex') is None
+    with pytest.raises(IndexError):
+        bank[4]
+
+    empty = str(tmp_path / 'empty.qbank')
+    MmapQuestionBank.write(empty, ())
+    assert len(MmapQuestionBank(empty)) == 0
+
+
+def test_cache_dir_maps_compiled_banks(tmp_path, monkeypatch):
+    """Test that a fresh .qbank is mapped without re-parsing, and rebuilt when stale."""
+    content = tmp_path / 'content'
+    content.mkdir()
+    (content / 'sample.md').write_text(BANK, encoding='utf-8')
+    cache = str(tmp_path / 'cache')
+    first = QuestionBank(str(content), cache_dir=cache).compiled('sample')
+    assert isinstance(first.questions, MmapQuestionBank)
+    assert os.path.exists(os.path.join(cache, 'sample.qbank'))
+
+    parse = question_bank.parse_mcq_markdown
+    monkeypatch.setattr(question_bank, 'parse_mcq_markdown', None)
+    second = QuestionBank(str(content), cache_dir=cache).compiled('sample')
+    assert list(second.questions) == list(first.questions)
+    assert second.digest == first.digest
+
+    monkeypatch.setattr(question_bank, 'parse_mcq_markdown', parse)
+    (content / 'sample.md').write_text(BANK.split('2)')[0], encoding='utf-8')
+    bank = QuestionBank(str(content), auto_reload=True, cache_dir=cache)
+    assert len(bank.get('sample')) == 1
+    assert bank.answer_key('sample')[first.questions[0].id] == 'B'
+
+
+@pytest.mark.parametrize('slug', ['missing', '..', '../config', 'Sample'])
+def test_unknown_or_unsafe_slug(tmp_path, slug):
+    """Test that lookups never leave the content directory."""
+    (tmp_path / 'sample.md').write_text(BANK, encoding='utf-8')
+    assert QuestionBank(str(tmp_path)).get(slug) is None
+
+
+def test_content_compile_command(runner):
+    """Test the content compile command against the shipped banks."""
+    result = runner.invoke(args=['content', 'compile'])
+    assert result.exit_code == 0
+    assert 'numerical-aptitude:' in result.output
+    assert 'Compiled' in result.output
+
+
+def test_practice_pages_use_cached_bank(app, client):
+    """Test that the practice page and grading read the preloaded bank."""
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    bank = app.extensions['question_bank']
+    questions = bank.get('numerical-aptitude')
+    assert isinstance(questions, MmapQuestionBank)
+    bank.content_dir = '/nonexistent'
+
+    response = client.get('/practice/numerical-aptitude')
+    assert response.status_code == 200
+    assert questions[0].question.encode() in response.data
+    assert f'name="question_{questions[0].id}"'.encode() in response.data
+    assert client.get('/practice/no-such-topic').status_code == 404
+
+    token = re.search(rb'name="quiz_token" value="([^"]+)"', response.data).group(1).decode()
+    served = re.findall(r'data-qid="([0-9a-f]{16})"', response.data.decode())
+    key = bank.answer_key('numerical-aptitude')
+    answers = {f'question_{qid}': key[qid] for qid in served[:2]}
+    answers[f'question_{served[2]}'] = 'Z'
+    answers['quiz_token'] = token
+    response = client.post('/practice/numerical-aptitude/submit', data=answers)
+    assert response.status_code == 302
+    progress = app.extensions['progress_store'].get_user_progress('testuser')
+    category = progress.get_category_progress('numerical-aptitude')
+    assert (category.questions_correct, category.questions_attempted) == (2, len(served))
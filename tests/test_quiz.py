@@ -0,0 +1,144 @@
+"""
+Tests for quiz assembly.
+
+This module checks the keyed permutation, round-by-round sampling, option
+shuffling, quiz tokens and the practice pages that serve and grade quizzes.
+"""
+import re
+import pytest
+from app.models import quiz
+from app.models.question_bank import Option, Question
+
+
+def make_bank(n):
+    return tuple(Question(f'{i:016x}', f'Question {i}?',
+                          (Option('A', 'right'), Option('B', 'w1'), Option('C', 'w2'), Option('D', 'w3')), 'A')
+                 for i in range(n))
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 17, 64, 1000])
+def test_permutation_is_bijection(n):
+    """Test that every position maps to a distinct position in range."""
+    order = quiz.Permutation(n, key=12345)
+    assert sorted(order[i] for i in range(n)) == list(range(n))
+    assert [order[i] for i in range(n)] == [quiz.Permutation(n, key=12345)[i] for i in range(n)]
+    if n >= 17:
+        assert [order[i] for i in range(n)] != [quiz.Permutation(n, key=54321)[i] for i in range(n)]
+
+
+def test_rounds_cover_bank_before_repeating():
+    """Test that consecutive rounds exclude recently served questions."""
+    n, size = 50, 7
+    seen = []
+    for r in range(8):  # 8 rounds of 7 = one pass of 50 plus a wrap-around of 6
+        positions = quiz.quiz_positions(n, seed=99, round_number=r, size=size)
+        assert len(set(positions)) == size
+        seen.extend(positions)
+    assert sorted(seen[:50]) == list(range(n))
+    assert seen[50:] == seen[:6]
+    assert quiz.quiz_positions(n, 99, 8, size) != quiz.quiz_positions(n, 99, 0, size)
+    assert sorted(quiz.quiz_positions(5, 99, 0, 20)) == list(range(5))
+
+
+def test_assembly_is_o_k(monkeypatch):
+    """Test that building a quiz touches O(k) positions of a large bank."""
+    calls = []
+    original = quiz.Permutation._encrypt
+
+    def counting(self, x):
+        calls.append(x)
+        return original(self, x)
+
+    monkeypatch.setattr(quiz.Permutation, '_encrypt', counting)
+    questions = quiz.assemble_quiz(make_bank(100000), quiz.QuizSpec('s', 7, 3, 20, 'd'))
+    assert len(questions) == 20 and len({q.id for q in questions}) == 20
+    assert len(calls) < 20 * 8
+
+
+def test_option_shuffle_keeps_answer():
+    """Test that shuffled, relabelled options still point at the right answer."""
+    labels = set()
+    for question in make_bank(40):
+        served = quiz.shuffle_options(question, seed=5)
+        assert [o.label for o in served.options] == ['A', 'B', 'C', 'D']
+        assert sorted(o.key for o in served.options) == ['A', 'B', 'C', 'D']
+        right = next(o for o in served.options if o.text == 'right')
+        assert (right.key, right.label) == (served.answer, served.answer_label)
+        assert quiz.shuffle_options(question, seed=5) == served
+        labels.add(served.answer_label)
+    assert len(labels) > 1
+
+
+def test_token_round_trip():
+    """Test that specs survive signing and tampering is rejected."""
+    spec = quiz.QuizSpec('numerical-aptitude', 2 ** 62 + 3, 4, 20, 'abcdef0123456789')
+    token = quiz.dump_token(spec, 'secret')
+    assert quiz.load_token(token, 'secret') == spec
+    assert quiz.load_token(token, 'other secret') is None
+    assert quiz.load_token(token[:-2] + 'xx', 'secret') is None
+    assert quiz.load_token('', 'secret') is None
+
+
+def served_ids(response):
+    return re.findall(rb'data-qid="([0-9a-f]{16})"', response.data)
+
+
+def test_practice_serves_rounds_and_grades_from_token(app, client):
+    """Test that quizzes advance per submission and grading rebuilds the quiz."""
+    app.config['QUIZ_SIZE'] = 5
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    bank = app.extensions['question_bank'].compiled('numerical-aptitude')
+
+    response = client.get('/practice/numerical-aptitude')
+    first = [qid.decode() for qid in served_ids(response)]
+    assert len(first) == 5
+    assert served_ids(client.get('/practice/numerical-aptitude')) == served_ids(response)
+    token = re.search(rb'name="quiz_token" value="([^"]+)"', response.data).group(1).decode()
+
+    # Answers to questions that were not served are ignored: the token says what was
+    data = {f'question_{q.id}': q.answer for q in bank.questions[:len(first) + 3]}
+    data.update({f'question_{qid}': bank.answer_key[qid] for qid in first})
+    data['quiz_token'] = token
+    client.post('/practice/numerical-aptitude/submit', data=data)
+    category = app.extensions['progress_store'].get_user_progress('testuser').get_category_progress('numerical-aptitude')
+    assert (category.questions_correct, category.questions_attempted) == (5, 5)
+
+    second = [qid.decode() for qid in served_ids(client.get('/practice/numerical-aptitude'))]
+    assert len(second) == 5 and not set(first) & set(second)
+
+
+def test_changed_bank_asks_to_restart(app, client):
+    """Test that a quiz whose bank was edited after it was served is not graded."""
+    app.config['QUIZ_SIZE'] = 3
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    bank = app.extensions['question_bank']
+    response = client.get('/practice/numerical-aptitude')
+    served = [qid.decode() for qid in served_ids(response)]
+    token = re.search(rb'name="quiz_token" value="([^"]+)"', response.data).group(1).decode()
+
+    compiled = bank.compiled('numerical-aptitude')
+    bank._banks['numerical-aptitude'] = compiled._replace(digest='0' * 16)
+    data = {f'question_{qid}': compiled.answer_key[qid] for qid in served}
+    data['quiz_token'] = token
+    response = client.post('/practice/numerical-aptitude/submit', data=data)
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/practice/numerical-aptitude')
+    category = app.extensions['progress_store'].get_user_progress('testuser').get_category_progress('numerical-aptitude')
+    assert category.questions_attempted == 0
+
+
+def test_submission_without_valid_token_is_rejected(app, client):
+    """Test that the client cannot choose which questions are graded."""
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    questions = app.extensions['question_bank'].get('numerical-aptitude')
+    data = {f'question_{q.id}': q.answer for q in questions[:3]}
+    assert client.post('/practice/numerical-aptitude/submit', data=data).status_code == 400
+
+    response = client.get('/practice/numerical-aptitude')
+    token = re.search(rb'name="quiz_token" value="([^"]+)"', response.data).group(1).decode()
+    data['quiz_token'] = token[:-2] + 'xx'
+    assert client.post('/practice/numerical-aptitude/submit', data=data).status_code == 400
+    data['quiz_token'] = token
+    assert client.post('/practice/verbal-aptitude/submit', data=data).status_code == 400
+    category = app.extensions['progress_store'].get_user_progress('testuser').get_category_progress('numerical-aptitude')
+    assert category.questions_attempted == 0
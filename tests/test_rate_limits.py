@@ -0,0 +1,222 @@
+"""
+Tests for login throttling and password hashing.
+
+This module covers the token-bucket limiter, the hashing executor and hash
+method calibration.
+"""
+import threading
+import pytest
+from app.utils import hashing
+from app.utils.hashing import HashingBusy, HashingExecutor
+from app.utils.ratelimit import TokenBucketLimiter
+
+
+def test_token_bucket_burst_and_refill(monkeypatch):
+    """Test that a bucket allows a burst and then asks the caller to wait."""
+    now = [1000.0]
+    monkeypatch.setattr('app.utils.ratelimit.time.monotonic', lambda: now[0])
+    limiter = TokenBucketLimiter(capacity=2, refill_per_second=0.5)
+
+    assert limiter.consume('ip:1', 'user:a') == 0
+    assert limiter.consume('ip:1', 'user:a') == 0
+    assert limiter.consume('ip:1', 'user:a') == pytest.approx(2.0)
+    # A different account from the same IP is still throttled by the IP bucket
+    assert limiter.consume('ip:1', 'user:b') > 0
+    # ...and a rejected request does not spend the other bucket's tokens
+    assert limiter.consume('ip:2', 'user:b') == 0
+    assert limiter.consume('ip:2', 'user:b') == 0
+
+    now[0] += 2.0
+    assert limiter.consume('ip:1', 'user:a') == 0
+
+
+def test_hashing_executor_rejects_when_saturated():
+    """Test that work beyond workers + queue depth is rejected immediately."""
+    executor = HashingExecutor(workers=1, max_queue=0, retry_after=3)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    result = []
+    worker = threading.Thread(target=lambda: result.append(executor.run(slow)))
+    worker.start()
+    started.wait(5)
+    with pytest.raises(HashingBusy) as exc:
+        executor.run(lambda: None)
+    assert exc.value.retry_after == 3
+    assert executor.stats()['rejected'] == 1
+
+    release.set()
+    worker.join(5)
+    assert result == ['done']
+    assert executor.run(lambda: 'free') == 'free'
+    executor.shutdown()
+
+
+def test_login_returns_503_when_hashing_saturated(client, monkeypatch):
+    """Test that a saturated hashing pool yields a fast 503 with Retry-After."""
+    def busy(fn, *args, **kwargs):
+        raise HashingBusy(2)
+
+    monkeypatch.setattr(hashing, 'run', busy)
+    response = client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+
+
+def test_login_rate_limited(app, client):
+    """Test that repeated logins from one client get 429 with Retry-After."""
+    app.extensions['login_limiter'] = TokenBucketLimiter(capacity=2, refill_per_second=0.01)
+    for _ in range(2):
+        response = client.post('/login', data={'username': 'testuser', 'password': 'wrong'})
+        assert response.status_code == 200
+    response = client.post('/login', data={'username': 'testuser', 'password': 'wrong'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert b'Too many login attempts' in response.data
+
+
+def test_login_rate_limit_keys_on_forwarded_client(app):
+    """Test that clients behind the same proxy get their own login bucket."""
+    app.extensions['login_limiter'] = TokenBucketLimiter(capacity=2, refill_per_second=0.01)
+    first = app.test_client()
+    second = app.test_client()
+    proxy = {'REMOTE_ADDR': '10.0.0.1'}
+    for _ in range(2):
+        response = first.post('/login', data={'username': 'alice', 'password': 'wrong'},
+                              headers={'X-Forwarded-For': '203.0.113.5'}, environ_base=proxy)
+        assert response.status_code == 200
+    response = first.post('/login', data={'username': 'carol', 'password': 'wrong'},
+                          headers={'X-Forwarded-For': '203.0.113.5'}, environ_base=proxy)
+    assert response.status_code == 429
+    response = second.post('/login', data={'username': 'bob', 'password': 'wrong'},
+                           headers={'X-Forwarded-For': '198.51.100.7'}, environ_base=proxy)
+    assert response.status_code == 200
+
+
+def test_hash_method_resolution(app):
+    """Test that SECURITY_PASSWORD_HASH is resolved to a werkzeug method."""
+    assert hashing.normalize_method('scrypt') == 'scrypt:32768:8:1'
+    assert hashing.normalize_method('plaintext') == 'pbkdf2:sha256:1'
+    assert hashing.normalize_method('pbkdf2:sha256:1000') == 'pbkdf2:sha256:1000'
+    with app.app_context():
+        app.config['SECURITY_PASSWORD_HASH'] = 'pbkdf2:sha256:1000'
+        assert hashing.password_hash_method() == 'pbkdf2:sha256:1000'
+        assert hashing.needs_rehash('pbkdf2:sha256:1$salt$hash')
+        assert not hashing.needs_rehash('pbkdf2:sha256:1000$salt$hash')
+
+
+def test_weak_methods_only_apply_in_tests(app):
+    """Test that deployments never hash below werkzeug's default strength."""
+    from app.models.user import User
+    from config import config
+    assert hashing.resolve_method('plaintext', testing=True) == 'pbkdf2:sha256:1'
+    assert hashing.resolve_method('plaintext') == 'scrypt:32768:8:1'
+    assert hashing.resolve_method('pbkdf2:sha256:1000') == hashing.normalize_method('pbkdf2')
+    assert hashing.resolve_method('scrypt:1024:8:1') == 'scrypt:32768:8:1'
+    assert hashing.resolve_method('scrypt:65536:8:1') == 'scrypt:65536:8:1'
+
+    assert config['development'].SECURITY_PASSWORD_HASH == 'plaintext'
+    app.config['SECURITY_PASSWORD_HASH'] = 'plaintext'
+    app.testing = False
+    with app.app_context():
+        assert User('dev', 'dev@example.com', password='devpass123').password_hash.startswith('scrypt:32768:8:1$')
+
+
+def test_rehash_never_downgrades(app):
+    """Test that stored hashes only move to methods at least as strong."""
+    with app.app_context():
+        app.config['SECURITY_PASSWORD_HASH'] = 'pbkdf2:sha256:1000'
+        assert not hashing.needs_rehash('scrypt:32768:8:1$salt$hash')
+        assert not hashing.needs_rehash('pbkdf2:sha256:600000$salt$hash')
+        app.config['SECURITY_PASSWORD_HASH'] = 'plaintext'
+        assert not hashing.needs_rehash('scrypt:32768:8:1$salt$hash')
+        assert not hashing.needs_rehash('pbkdf2:sha256:1000$salt$hash')
+        app.config['SECURITY_PASSWORD_HASH'] = 'scrypt:65536:8:1'
+        assert hashing.needs_rehash('scrypt:32768:8:1$salt$hash')
+        assert hashing.needs_rehash('pbkdf2:sha256:600000$salt$hash')
+        assert not hashing.needs_rehash('scrypt:131072:8:1$salt$hash')
+
+
+def set_stored_hash(app, method):
+    from app.models.user import ExcelUserStore
+    from werkzeug.security import generate_password_hash
+    with app.app_context():
+        user = ExcelUserStore.get_by_username('testuser')
+        user.password_hash = generate_password_hash('testpass123', method=method)
+        ExcelUserStore.update_user('testuser', user)
+
+
+def test_login_upgrades_stored_hash(app, client):
+    """Test that a successful login rehashes with the configured method."""
+    from app.models.user import ExcelUserStore
+    set_stored_hash(app, 'pbkdf2:sha256:1')
+    app.config['SECURITY_PASSWORD_HASH'] = 'pbkdf2:sha256:1000'
+
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+
+    with app.app_context():
+        stored = ExcelUserStore.get_by_username('testuser')
+        assert stored.password_hash.startswith('pbkdf2:sha256:1000$')
+        assert stored.check_password('testpass123')
+        assert stored.email == 'test@example.com'
+
+
+def test_login_keeps_stronger_hash_under_dev_alias(app, client):
+    """Test that the 'plaintext' development alias never replaces a stored hash."""
+    from app.models.user import ExcelUserStore
+    app.config['SECURITY_PASSWORD_HASH'] = 'plaintext'
+    with app.app_context():
+        before = ExcelUserStore.get_by_username('testuser').password_hash
+    assert before.startswith('scrypt:')
+
+    client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+
+    with app.app_context():
+        assert ExcelUserStore.get_by_username('testuser').password_hash == before
+
+
+def test_rehash_is_skipped_when_pool_is_busy(app, monkeypatch):
+    """Test that a correct password still logs in when the rehash cannot run."""
+    from app.models.user import ExcelUserStore
+    set_stored_hash(app, 'pbkdf2:sha256:1')
+    app.config['SECURITY_PASSWORD_HASH'] = 'pbkdf2:sha256:1000'
+    calls = []
+    original = hashing.run
+
+    def busy_after_verify(fn, *args, **kwargs):
+        calls.append(fn)
+        if len(calls) > 1:
+            raise hashing.HashingBusy()
+        return original(fn, *args, **kwargs)
+
+    monkeypatch.setattr(hashing, 'run', busy_after_verify)
+    with app.app_context():
+        user = ExcelUserStore.get_by_username('testuser')
+        assert user.check_password('testpass123')
+        assert user.password_hash.startswith('pbkdf2:sha256:1$')
+
+
+def test_calibrate_hash_command(runner):
+    """Test that calibration suggests a method string for the chosen algorithm."""
+    result = runner.invoke(args=['calibrate-hash', '--algorithm', 'pbkdf2',
+                                 '--target-ms', '5', '--samples', '1'])
+    assert result.exit_code == 0
+    assert 'Set SECURITY_PASSWORD_HASH=pbkdf2:sha256:' in result.output
+
+
+def test_calibrate_respects_default_and_memory_cap(monkeypatch):
+    """Test that scrypt suggestions stay between the default and the memory cap."""
+    monkeypatch.setattr(hashing, 'measure_ms', lambda method, samples=5: 0.0)
+    method, _ = hashing.calibrate(1000, 'scrypt', max_memory_mb=64)
+    assert method == 'scrypt:65536:8:1'
+    assert hashing.scrypt_memory_bytes(65536) == 64 * 1024 * 1024
+    assert hashing.calibrate(1000, 'scrypt', max_memory_mb=1)[0] == hashing.normalize_method('scrypt')
+
+    monkeypatch.setattr(hashing, 'measure_ms', lambda method, samples=5: 1000.0)
+    assert hashing.calibrate(1, 'scrypt')[0] == hashing.normalize_method('scrypt')
+    iterations = int(hashing.calibrate(1, 'pbkdf2')[0].split(':')[2])
+    assert iterations == hashing.DEFAULT_PBKDF2_ITERATIONS
@@ -0,0 +1,108 @@
+"""
+Tests for session user snapshots.
+
+This module checks that the user loader skips the store while a snapshot is
+fresh and revokes sessions whose password changed, but not ones whose hash
+was only upgraded.
+"""
+import pytest
+from app.models.user import User, ExcelUserStore
+from app.utils import hashing
+
+
+@pytest.fixture
+def store_calls(monkeypatch):
+    """Count ExcelUserStore.get_by_username calls."""
+    calls = []
+    original = ExcelUserStore.get_by_username.__func__
+
+    def counting_get_by_username(cls, username):
+        calls.append(username)
+        return original(cls, username)
+
+    monkeypatch.setattr(ExcelUserStore, 'get_by_username', classmethod(counting_get_by_username))
+    return calls
+
+
+def login(client):
+    return client.post('/login', data={'username': 'testuser', 'password': 'testpass123'})
+
+
+def test_snapshot_skips_store(app, client, store_calls):
+    """Test that authenticated requests are served from the snapshot."""
+    app.config['SESSION_USER_SNAPSHOT'] = True
+    login(client)
+    del store_calls[:]
+
+    for _ in range(3):
+        response = client.get('/dashboard')
+        assert response.status_code == 200
+        assert b'testuser' in response.data
+    assert store_calls == []
+
+
+def test_snapshot_disabled_by_default(app, client, store_calls):
+    """Test that the store is consulted on every request without the option."""
+    login(client)
+    del store_calls[:]
+    client.get('/dashboard')
+    client.get('/dashboard')
+    assert store_calls == ['testuser', 'testuser']
+
+
+def test_password_change_revokes_snapshot(app, client, store_calls):
+    """Test that an expired snapshot is checked against the stored hash."""
+    app.config['SESSION_USER_SNAPSHOT'] = True
+    app.config['SESSION_USER_SNAPSHOT_TTL'] = 0
+    login(client)
+
+    assert client.get('/dashboard').status_code == 200
+    assert store_calls[-1] == 'testuser'
+
+    with app.app_context():
+        changed = User(username='testuser', email='test@example.com', password='newpass456')
+        ExcelUserStore.update_user('testuser', changed)
+
+    response = client.get('/dashboard')
+    assert response.status_code == 302
+    assert '/login' in response.headers['Location']
+
+
+def test_rehash_keeps_other_sessions(app, store_calls):
+    """Test that a login that upgrades the hash does not revoke other sessions."""
+    app.config['SESSION_USER_SNAPSHOT'] = True
+    app.config['SESSION_USER_SNAPSHOT_TTL'] = 0
+    app.config['SECURITY_PASSWORD_HASH'] = 'pbkdf2:sha256:1'
+    with app.app_context():
+        user = ExcelUserStore.get_by_username('testuser')
+        user.password_hash = hashing.rehash_password('testpass123', None, 'pbkdf2:sha256:1')
+        ExcelUserStore.update_user('testuser', user)
+    first, second = app.test_client(), app.test_client()
+    login(first)
+    assert first.get('/dashboard').status_code == 200
+
+    app.config['SECURITY_PASSWORD_HASH'] = 'pbkdf2:sha256:1000'
+    login(second)
+    with app.app_context():
+        upgraded = ExcelUserStore.get_by_username('testuser').password_hash
+    assert upgraded.startswith('pbkdf2:sha256:1000$')
+    assert hashing.password_salt(upgraded) == hashing.password_salt(user.password_hash)
+
+    assert first.get('/dashboard').status_code == 200
+    assert second.get('/dashboard').status_code == 200
+
+
+def test_account_edit_keeps_password_with_snapshot(app, client):
+    """Test that editing a snapshot-loaded user does not drop the password."""
+    app.config['SESSION_USER_SNAPSHOT'] = True
+    login(client)
+    response = client.post('/account/edit', data={
+        'username': 'testuser', 'email': 'changed@example.com', 'password': ''})
+    assert response.status_code == 302
+
+    with app.app_context():
+        stored = ExcelUserStore.get_by_username('testuser')
+        assert stored.email == 'changed@example.com'
+        assert stored.check_password('testpass123')
+    # The editing session stays valid
+    assert client.get('/dashboard').status_code == 200
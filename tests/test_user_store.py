@@ -0,0 +1,419 @@
+"""
+Tests for the user stores.
+
+This module contains tests for the Excel and SQLite user stores.
+"""
+import json
+import os
+import sqlite3
+import pytest
+from openpyxl import load_workbook
+from app.models.user import User, ExcelUserStore, SQLiteUserStore, get_user_store
+from app.utils.bloom import BloomFilter
+
+
+def test_lookups_use_cached_index(app, monkeypatch):
+    """Test that repeated lookups do not re-read an unchanged workbook."""
+    with app.app_context():
+        ExcelUserStore.invalidate_cache()
+        assert ExcelUserStore.get_by_username('testuser') is not None
+
+        calls = []
+        original = ExcelUserStore._load_snapshot.__func__
+
+        def counting_load_snapshot(cls):
+            calls.append(1)
+            return original(cls)
+
+        monkeypatch.setattr(ExcelUserStore, '_load_snapshot', classmethod(counting_load_snapshot))
+        for _ in range(5):
+            assert ExcelUserStore.exists_username('testuser')
+            assert ExcelUserStore.exists_email('test@example.com')
+            assert ExcelUserStore.get_by_email('test@example.com').username == 'testuser'
+        assert not ExcelUserStore.exists_username('nobody')
+        assert calls == []
+
+
+def test_index_rebuilds_when_file_changes(app):
+    """Test that a write from outside the store invalidates the index."""
+    with app.app_context():
+        assert not ExcelUserStore.exists_username('outsider')
+
+        path = ExcelUserStore._file_path()
+        wb = load_workbook(path)
+        wb.active.append(['outsider', 'outsider@example.com', '', '', '0'])
+        wb.save(path)
+        st = os.stat(path)
+        # Make sure the signature changes even on coarse-grained filesystems
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+        user = ExcelUserStore.get_by_username('outsider')
+        assert user is not None
+        assert user.email == 'outsider@example.com'
+
+
+def test_add_and_update_refresh_index(app):
+    """Test that the store's own writes are visible immediately."""
+    with app.app_context():
+        user = User(username='alice', email='alice@example.com', password='alicepass1')
+        ExcelUserStore.add(user)
+        assert ExcelUserStore.exists_username('alice')
+
+        updated = User(username='alice2', email='alice2@example.com')
+        updated.password_hash = user.password_hash
+        assert ExcelUserStore.update_user('alice', updated) is True
+        assert not ExcelUserStore.exists_username('alice')
+        assert not ExcelUserStore.exists_email('alice@example.com')
+        assert ExcelUserStore.get_by_email('alice2@example.com').username == 'alice2'
+
+
+def test_update_rejects_identity_collisions(app):
+    """Test that a rename cannot take over another row, even if a pre-check raced."""
+    with app.app_context():
+        ExcelUserStore.add(User(username='erin', email='erin@example.com', password='erinpass12'))
+        ExcelUserStore.add(User(username='fred', email='fred@example.com', password='fredpass12'))
+
+        # Written straight to the queue, as if the other row appeared after update_user's check
+        assert ExcelUserStore._submit({'op': 'update', 'username': 'erin',
+                                       'row': ['fred', 'erin@example.com', '', None, '0']}) is False
+        assert ExcelUserStore.update_user('erin', User(username='erin2', email='fred@example.com')) is False
+        assert ExcelUserStore.get_by_username('fred').email == 'fred@example.com'
+        assert ExcelUserStore.get_by_email('fred@example.com').username == 'fred'
+        assert ExcelUserStore.get_by_username('erin').email == 'erin@example.com'
+
+        # Keeping one's own username or email is not a collision
+        assert ExcelUserStore.update_user('erin', User(username='erin', email='erin3@example.com')) is True
+
+        # A colliding record already in the journal is skipped on replay
+        with open(ExcelUserStore._journal_path(), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'op': 'update', 'username': 'erin',
+                                'row': ['fred', 'erin3@example.com', '', None, '0']}) + '\n')
+        ExcelUserStore.invalidate_cache()
+        assert ExcelUserStore.get_by_username('fred').email == 'fred@example.com'
+        assert ExcelUserStore.get_by_username('erin').email == 'erin3@example.com'
+
+
+@pytest.fixture
+def sqlite_store(app, tmp_path):
+    """Point SQLiteUserStore at a temporary database."""
+    original = SQLiteUserStore.DB_PATH
+    SQLiteUserStore.DB_PATH = str(tmp_path / 'users.db')
+    yield SQLiteUserStore
+    SQLiteUserStore.DB_PATH = original
+
+
+def test_sqlite_store_surface(sqlite_store):
+    """Test that the SQLite store mirrors the ExcelUserStore API."""
+    user = User(username='bob', email='bob@example.com', password='bobpass123', is_admin=True)
+    sqlite_store.add(user)
+    # Duplicates are ignored rather than raising
+    sqlite_store.add(User(username='bob', email='other@example.com'))
+
+    loaded = sqlite_store.get_by_username('bob')
+    assert loaded.email == 'bob@example.com'
+    assert loaded.is_admin is True
+    assert loaded.check_password('bobpass123')
+    assert sqlite_store.get_by_email('bob@example.com').username == 'bob'
+    assert sqlite_store.exists_username('bob')
+    assert not sqlite_store.exists_email('other@example.com')
+
+    updated = User(username='bobby', email='bobby@example.com')
+    updated.password_hash = loaded.password_hash
+    assert sqlite_store.update_user('bob', updated) is True
+    assert sqlite_store.update_user('bob', updated) is False
+    assert sqlite_store.exists_username('bobby')
+
+    mode = sqlite_store._connect().execute('PRAGMA journal_mode').fetchone()[0]
+    assert mode == 'wal'
+
+
+def test_get_user_store_follows_config(app):
+    """Test that USER_STORE_BACKEND selects the store class."""
+    with app.app_context():
+        assert get_user_store() is ExcelUserStore
+        app.config['USER_STORE_BACKEND'] = 'sqlite'
+        assert get_user_store() is SQLiteUserStore
+
+
+def test_migrate_users_command(app, runner, sqlite_store):
+    """Test that migrate-users copies every workbook row into SQLite."""
+    with app.app_context():
+        ExcelUserStore.add(User(username='carol', email='carol@example.com', password='carolpass1'))
+
+    result = runner.invoke(args=['migrate-users'])
+    assert 'Migrated 2 of 2 users' in result.output
+    assert sqlite_store.get_by_username('testuser').check_password('testpass123')
+    assert sqlite_store.exists_email('carol@example.com')
+
+    # Running it again is a no-op
+    result = runner.invoke(args=['migrate-users'])
+    assert 'Migrated 0 of 2 users' in result.output
+
+
+def test_mutations_append_to_journal(app):
+    """Test that add and update_user leave the workbook untouched."""
+    with app.app_context():
+        path = ExcelUserStore._file_path()
+        before = os.stat(path).st_mtime_ns
+        ExcelUserStore.add(User(username='dave', email='dave@example.com', password='davepass12'))
+        ExcelUserStore.update_user('dave', User(username='dave', email='dave2@example.com'))
+        assert os.stat(path).st_mtime_ns == before
+
+        with open(ExcelUserStore._journal_path(), encoding='utf-8') as f:
+            assert len(f.readlines()) == 4  # header, testuser, dave, update
+
+        # A fresh index replays the journal over the snapshot
+        ExcelUserStore.invalidate_cache()
+        assert ExcelUserStore.get_by_username('dave').email == 'dave2@example.com'
+        assert ExcelUserStore.get_by_username('dave').check_password('davepass12') is False
+
+
+def test_compact_folds_journal_into_workbook(app, runner):
+    """Test that compaction writes every row once and starts a new journal."""
+    with app.app_context():
+        ExcelUserStore.add(User(username='erin', email='erin@example.com', password='erinpass12'))
+        stale_index = ExcelUserStore._index()
+
+    result = runner.invoke(args=['compact-users'])
+    assert 'Folded 2 journal records' in result.output
+
+    wb = load_workbook(ExcelUserStore._file_path(), read_only=True)
+    usernames = [r[0] for r in wb.active.iter_rows(min_row=2, values_only=True)]
+    wb.close()
+    assert usernames == ['testuser', 'erin']
+
+    with open(ExcelUserStore._journal_path(), encoding='utf-8') as f:
+        assert f.read() == '{"epoch": 2}\n'
+
+    with app.app_context():
+        assert ExcelUserStore.get_by_username('erin').check_password('erinpass12')
+        # Nothing left to fold
+        assert ExcelUserStore.compact() == 0
+
+    # A reader still holding the old journal generation must not replay it
+    stale_index.journal_inode = None
+    stale_index.journal_offset = 0
+    ExcelUserStore._read_journal(stale_index)
+    assert stale_index.journal_offset is None
+
+
+def test_identity_conflicts(app, sqlite_store):
+    """Test the combined username/email collision check on both stores."""
+    with app.app_context():
+        sqlite_store.add(User(username='testuser', email='test@example.com'))
+        for store in (ExcelUserStore, sqlite_store):
+            assert store.identity_conflicts('testuser', 'test@example.com') == (True, True)
+            assert store.identity_conflicts('testuser', 'new@example.com') == (True, False)
+            assert store.identity_conflicts('newuser', 'test@example.com') == (False, True)
+            assert store.identity_conflicts('newuser', 'new@example.com') == (False, False)
+            assert store.identity_conflicts(None, 'test@example.com') == (False, True)
+
+
+def test_create_admin_rejects_taken_email(runner):
+    """Test that create-admin reports an email that is already registered."""
+    result = runner.invoke(args=['create-admin', 'admin', 'test@example.com', 'adminpass1'])
+    assert 'Email test@example.com is already registered.' in result.output
+    assert not ExcelUserStore.exists_username('admin')
+
+
+def test_registration_losing_a_race_is_not_logged_in(app, client, monkeypatch, sqlite_store):
+    """Test that a registrant whose name was taken after the pre-check is not signed in as its owner."""
+    from app.models.user import UserStore
+    # Both pre-checks pass, as if the other registration landed just after them
+    monkeypatch.setattr(ExcelUserStore, 'identity_conflicts', classmethod(lambda cls, u, e: (False, False)))
+    monkeypatch.setattr(UserStore, 'identity_conflicts', classmethod(lambda cls, u, e: (False, False)))
+    response = client.post('/register', data={
+        'username': 'testuser', 'email': 'intruder@example.com',
+        'password': 'intruder123', 'confirm_password': 'intruder123'})
+    assert response.status_code == 200
+    # Once in the flashed message, once in the live-check script
+    assert response.data.count(b'Username is already taken.') == 2
+    with client.session_transaction() as session:
+        assert '_user_id' not in session
+    with app.app_context():
+        assert ExcelUserStore.get_by_username('testuser').email == 'test@example.com'
+        assert ExcelUserStore.add(User(username='other', email='test@example.com')) is None
+
+    sqlite_store.add(User(username='sam', email='sam@example.com'))
+    assert sqlite_store.add(User(username='sam', email='sam2@example.com')) is None
+    assert sqlite_store.add(User(username='sam3', email='sam@example.com')) is None
+    assert sqlite_store.add(User(username='sam4', email='sam4@example.com')).username == 'sam4'
+
+
+def test_create_admin_reports_lost_race(runner, monkeypatch):
+    """Test that create-admin does not claim success when the add was rejected."""
+    from app.models.user import UserStore
+    monkeypatch.setattr(ExcelUserStore, 'identity_conflicts', classmethod(lambda cls, u, e: (False, False)))
+    monkeypatch.setattr(UserStore, 'identity_conflicts', classmethod(lambda cls, u, e: (False, False)))
+    result = runner.invoke(args=['create-admin', 'testuser', 'boss@example.com', 'adminpass1'])
+    assert 'User testuser already exists.' in result.output
+    assert 'Created admin user' not in result.output
+
+
+def _register_users(worker, count):
+    """Add ``count`` users from several threads of one process."""
+    import threading
+
+    def add_some(thread):
+        for i in range(count):
+            name = f'w{worker}t{thread}u{i}'
+            ExcelUserStore.add(User(username=name, email=f'{name}@example.com'))
+            if i % 10 == 9 and thread == 0:
+                ExcelUserStore.compact()
+
+    threads = [threading.Thread(target=add_some, args=(t,)) for t in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_concurrent_registrations_lose_no_rows(app):
+    """Test that several worker processes appending at once lose no rows."""
+    pytest.importorskip('fcntl')
+    import multiprocessing
+
+    ctx = multiprocessing.get_context('fork')
+    workers, count = 4, 25
+    with app.app_context():
+        procs = [ctx.Process(target=_register_users, args=(w, count)) for w in range(workers)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        assert all(p.exitcode == 0 for p in procs)
+
+        ExcelUserStore.invalidate_cache()
+        rows = ExcelUserStore.iter_rows()
+        assert len(rows) == 1 + workers * 3 * count
+        assert len({r[0] for r in rows}) == len(rows)
+
+        # Compacting leaves exactly the same users in the workbook
+        ExcelUserStore.compact()
+        wb = load_workbook(ExcelUserStore._file_path(), read_only=True)
+        assert sum(1 for _ in wb.active.iter_rows(min_row=2)) == len(rows)
+        wb.close()
+
+
+def test_write_queue_batches_and_dedupes(app, monkeypatch):
+    """Test that queued records are written together and duplicates rejected."""
+    with app.app_context():
+        batches = []
+        original = ExcelUserStore._write_batch.__func__
+
+        def recording_write_batch(cls, batch):
+            batches.append(len(batch))
+            return original(cls, batch)
+
+        monkeypatch.setattr(ExcelUserStore, '_write_batch', classmethod(recording_write_batch))
+        # Simulate another thread's records waiting behind the leader
+        from app.models.user import _PendingWrite
+        queued = [
+            _PendingWrite({'op': 'add', 'row': ['frank', 'frank@example.com', '', '', '0']}),
+            _PendingWrite({'op': 'add', 'row': ['frank', 'other@example.com', '', '', '0']}),
+        ]
+        ExcelUserStore._pending.extend(queued)
+        assert ExcelUserStore._submit(
+            {'op': 'add', 'row': ['gina', 'gina@example.com', '', '', '0']}) is True
+
+        assert batches == [3]
+        assert [p.accepted for p in queued] == [True, False]
+        assert ExcelUserStore.get_by_username('frank').email == 'frank@example.com'
+        assert ExcelUserStore.exists_username('gina')
+
+
+def test_users_import_and_export(app, runner, tmp_path):
+    """Test bulk CSV import with dedupe and export in both formats."""
+    source = tmp_path / 'cohort.csv'
+    source.write_text(
+        'username,email,password_hash,is_admin\n'
+        'hank,hank@example.com,pbkdf2:sha256:1$salt$hash,0\n'
+        'testuser,dupe@example.com,,0\n'
+        'ivy,test@example.com,,0\n'
+        'hank,hank2@example.com,,0\n'
+        'jo,jo@example.com,,true\n',
+        encoding='utf-8',
+    )
+    result = runner.invoke(args=['users', 'import', str(source)])
+    assert 'Imported 2 users (3 skipped as duplicates)' in result.output
+
+    with app.app_context():
+        assert ExcelUserStore.get_by_username('hank').password_hash == 'pbkdf2:sha256:1$salt$hash'
+        assert ExcelUserStore.get_by_username('jo').is_admin is True
+        assert ExcelUserStore.get_by_username('testuser').check_password('testpass123')
+
+    csv_path = tmp_path / 'out.csv'
+    result = runner.invoke(args=['users', 'export', str(csv_path)])
+    assert 'Exported 3 users' in result.output
+    lines = csv_path.read_text(encoding='utf-8').splitlines()
+    assert lines[0] == 'username,email,password_hash,created_at_iso,is_admin'
+    assert [line.split(',')[0] for line in lines[1:]] == ['testuser', 'hank', 'jo']
+
+    xlsx_path = tmp_path / 'out.xlsx'
+    runner.invoke(args=['users', 'export', str(xlsx_path)])
+    wb = load_workbook(str(xlsx_path), read_only=True)
+    assert [r[0] for r in wb.active.iter_rows(min_row=2, values_only=True)] == ['testuser', 'hank', 'jo']
+    wb.close()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """Test that added items are always found and the false-positive rate holds."""
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f'user{i}')
+    assert all(f'user{i}' in bloom for i in range(1000))
+    assert len(bloom) == 1000 and not bloom.saturated
+
+    false_positives = sum(f'other{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+    bloom.add('one-more')
+    assert bloom.saturated
+
+
+def test_excel_lookups_follow_renames(app):
+    """Test that existence checks see added and renamed users."""
+    with app.app_context():
+        assert ExcelUserStore.identity_conflicts('nobody', 'nobody@example.com') == (False, False)
+        ExcelUserStore.add(User(username='kim', email='kim@example.com'))
+        assert ExcelUserStore.exists_username('kim')
+        ExcelUserStore.update_user('kim', User(username='kimberly', email='kim@example.com'))
+        assert ExcelUserStore.exists_username('kimberly')
+        assert not ExcelUserStore.exists_username('kim')
+        assert ExcelUserStore.exists_email('kim@example.com')
+
+
+def test_sqlite_filter_sees_other_connections(sqlite_store):
+    """Test that rows written by another process are folded into the filter."""
+    sqlite_store.add(User(username='lee', email='lee@example.com'))
+    assert sqlite_store.identity_conflicts('max', 'max@example.com') == (False, False)
+
+    # Simulate another worker writing through its own connection
+    other = sqlite3.connect(sqlite_store._db_path())
+    with other:
+        other.execute(
+            'INSERT INTO users (username, email, password_hash, created_at, version) '
+            f'VALUES (?, ?, ?, ?, {sqlite_store.NEXT_VERSION})',
+            ('max', 'max@example.com', '', '2024-01-01T00:00:00'))
+    other.close()
+    assert sqlite_store.identity_conflicts('max', 'max@example.com') == (True, True)
+    assert sqlite_store.exists_username('lee')
+
+
+def test_check_username_endpoint(client):
+    """Test the registration form's availability check."""
+    assert client.get('/check-username?username=testuser').get_json() == {
+        'username': 'testuser', 'available': False}
+    assert client.get('/check-username?username=newbie').get_json() == {
+        'username': 'newbie', 'available': True}
+    assert client.get('/check-username').get_json()['available'] is False
+
+
+def test_check_username_reports_store_errors(client, monkeypatch):
+    """Test that a failing store yields an unknown status, never "available"."""
+    def broken(*args):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(ExcelUserStore, 'identity_conflicts', broken)
+    response = client.get('/check-username?username=newbie')
+    assert response.status_code == 503
+    assert response.get_json() == {'username': 'newbie', 'available': None}